@@ -1,15 +1,33 @@
 #!/usr/bin/env python3
 
+import array
 import base64
+import codecs
+import contextlib
 import datetime as dt
+import functools
+import gzip
+import hashlib
+import http.client
 import json
+import math
 import os
 import re
 import ssl
-import urllib.error
+import sys
+import threading
+import time
 import urllib.parse
-import urllib.request
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator
+
+try:
+    import numpy
+except ImportError:  # The CronJob image is stock python:alpine; numpy only speeds up local reductions.
+    numpy = None
 
 
 APP_TEMPLATE_RELEASE_FILE_MAP = {
@@ -118,13 +136,35 @@ def log(message: str) -> None:
     print(f"[{now}] {message}", flush=True)
 
 
+ENV_OVERRIDES = threading.local()
+
+
+@contextlib.contextmanager
+def env_overrides(values: dict[str, str]) -> Iterator[None]:
+    """Layer values over the process environment for getenv() and env_*() on this thread only."""
+
+    previous = getattr(ENV_OVERRIDES, "values", {})
+    ENV_OVERRIDES.values = {**previous, **values}
+    try:
+        yield
+    finally:
+        ENV_OVERRIDES.values = previous
+
+
+def getenv(name: str, default: str | None = None) -> str | None:
+    overrides = getattr(ENV_OVERRIDES, "values", None)
+    if overrides and name in overrides:
+        return overrides[name]
+    return os.getenv(name, default)
+
+
 def env_list(name: str, default: str) -> list[str]:
-    value = os.getenv(name, default)
+    value = getenv(name, default)
     return [item.strip() for item in value.split(",") if item.strip()]
 
 
 def env_float(name: str, default: float) -> float:
-    value = os.getenv(name)
+    value = getenv(name)
     if not value:
         return default
     try:
@@ -135,7 +175,7 @@ def env_float(name: str, default: float) -> float:
 
 
 def env_int(name: str, default: int) -> int:
-    value = os.getenv(name)
+    value = getenv(name)
     if not value:
         return default
     try:
@@ -146,7 +186,7 @@ def env_int(name: str, default: int) -> int:
 
 
 def env_bool(name: str, default: bool) -> bool:
-    value = os.getenv(name)
+    value = getenv(name)
     if value is None or value.strip() == "":
         return default
     normalized = value.strip().lower()
@@ -279,6 +319,17 @@ def parse_mem_to_mi(value: str | None) -> float:
     return float(value) / (1024 * 1024)
 
 
+def parse_duration_seconds(value: str) -> int | None:
+    """Parse a Prometheus duration such as 14d, 1h or 1h30m into whole seconds."""
+
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800, "y": 31536000}
+    value = value.strip()
+    parts = re.findall(r"(\d+)([smhdwy])", value)
+    if not parts or "".join(number + unit for number, unit in parts) != value:
+        return None
+    return sum(int(number) * units[unit] for number, unit in parts)
+
+
 def fmt_cpu_m(value: float) -> str:
     return f"{max(0, int(round(value)))}m"
 
@@ -454,6 +505,594 @@ def patch_app_template_resources(
     return "".join(lines), True, "resources_updated"
 
 
+def tls_context(cafile: str = "") -> ssl.SSLContext:
+    # Shared per CA bundle so pooled connections are not split across equivalent contexts.
+    with TLS_CONTEXTS_LOCK:
+        if cafile not in TLS_CONTEXTS:
+            TLS_CONTEXTS[cafile] = (
+                ssl.create_default_context(cafile=cafile) if cafile else ssl.create_default_context()
+            )
+        return TLS_CONTEXTS[cafile]
+
+
+TLS_CONTEXTS: dict[str, ssl.SSLContext] = {}
+TLS_CONTEXTS_LOCK = threading.Lock()
+
+
+class PooledTransport:
+    """Keep-alive HTTP(S) connection pool built on http.client.
+
+    Idle connections are kept per (scheme, host, port) and at most max_per_host requests run
+    against one host at a time. Responses are requested gzip-encoded and decoded here as they stream. A
+    request that fails on a reused socket (the server closed it while idle) is retried once on
+    a fresh connection. A non-idempotent request is retried only when the failure shows it was never
+    written; once it may have reached the server, resending it could apply it twice.
+    """
+
+    STALE_CONNECTION_ERRORS = (
+        http.client.RemoteDisconnected,
+        http.client.CannotSendRequest,
+        ConnectionResetError,
+        BrokenPipeError,
+    )
+    UNSENT_REQUEST_ERRORS = (http.client.CannotSendRequest, BrokenPipeError)
+    IDEMPOTENT_METHODS = frozenset(("GET", "HEAD", "OPTIONS", "PUT", "DELETE"))
+    STREAM_CHUNK_BYTES = 64 * 1024
+
+    def __init__(self, max_per_host: int = 4) -> None:
+        self.max_per_host = max(1, max_per_host)
+        self.lock = threading.Lock()
+        self.idle: dict[tuple[str, str, int], list[http.client.HTTPConnection]] = {}
+        self.slots: dict[tuple[str, str, int], threading.BoundedSemaphore] = {}
+        self.counters = {
+            "requests": 0,
+            "connections_opened": 0,
+            "connections_reused": 0,
+            "tls_handshakes": 0,
+        }
+
+    def stats(self) -> dict[str, int]:
+        with self.lock:
+            return dict(self.counters)
+
+    def count(self, name: str) -> None:
+        with self.lock:
+            self.counters[name] += 1
+
+    def close_idle(self) -> None:
+        with self.lock:
+            idle = [conn for conns in self.idle.values() for conn in conns]
+            self.idle.clear()
+        for conn in idle:
+            conn.close()
+
+    def host_slot(self, key: tuple[str, str, int]) -> threading.BoundedSemaphore:
+        with self.lock:
+            if key not in self.slots:
+                self.slots[key] = threading.BoundedSemaphore(self.max_per_host)
+            return self.slots[key]
+
+    def open_connection(
+        self,
+        key: tuple[str, str, int],
+        timeout: float,
+        ssl_context: ssl.SSLContext | None,
+    ) -> http.client.HTTPConnection:
+        scheme, host, port = key
+        if scheme == "https":
+            conn: http.client.HTTPConnection = http.client.HTTPSConnection(
+                host, port, timeout=timeout, context=ssl_context or tls_context()
+            )
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        conn.connect()
+        self.count("connections_opened")
+        if scheme == "https":
+            self.count("tls_handshakes")
+        return conn
+
+    def checkout(
+        self,
+        key: tuple[str, str, int],
+        timeout: float,
+        ssl_context: ssl.SSLContext | None,
+    ) -> tuple[http.client.HTTPConnection, bool]:
+        with self.lock:
+            idle = self.idle.get(key) or []
+            conn = idle.pop() if idle else None
+        if conn is None:
+            return self.open_connection(key, timeout, ssl_context), False
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        self.count("connections_reused")
+        return conn, True
+
+    def send(
+        self,
+        conn: http.client.HTTPConnection,
+        method: str,
+        target: str,
+        headers: dict[str, str],
+        body: bytes | None,
+    ) -> http.client.HTTPResponse:
+        try:
+            conn.request(method, target, body=body, headers=headers)
+            return conn.getresponse()
+        except Exception:
+            conn.close()
+            raise
+
+    def stream(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str] | None = None,
+        body: bytes | None = None,
+        timeout: float = 30.0,
+        ssl_context: ssl.SSLContext | None = None,
+        long_poll: bool = False,
+    ) -> Iterator[int | bytes]:
+        """Send a request lazily; yield the status code first, then decoded body chunks.
+
+        Nothing is sent until the first next(). The connection and host slot are held while
+        the body is consumed; a fully read body returns the connection to the idle pool, and an
+        abandoned one closes it. Chunks are yielded as soon as they arrive. A long_poll request
+        (a watch) gets its own connection outside the host slots, so it never starves short calls.
+        """
+
+        parts = urllib.parse.urlsplit(url)
+        scheme = parts.scheme or "http"
+        key = (scheme, parts.hostname or "", parts.port or (443 if scheme == "https" else 80))
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        request_headers = {"Accept-Encoding": "gzip", **(headers or {})}
+
+        slot = contextlib.nullcontext() if long_poll else self.host_slot(key)
+        slot.__enter__()
+        try:
+            if long_poll:
+                conn, reused = self.open_connection(key, timeout, ssl_context), False
+            else:
+                conn, reused = self.checkout(key, timeout, ssl_context)
+            try:
+                resp = self.send(conn, method, target, request_headers, body)
+            except self.STALE_CONNECTION_ERRORS as error:
+                if not reused:
+                    raise
+                if method.upper() not in self.IDEMPOTENT_METHODS and not isinstance(error, self.UNSENT_REQUEST_ERRORS):
+                    raise
+                conn = self.open_connection(key, timeout, ssl_context)
+                resp = self.send(conn, method, target, request_headers, body)
+            self.count("requests")
+
+            finished = False
+            try:
+                yield resp.status
+                gunzip = None
+                if (resp.getheader("Content-Encoding") or "").lower() == "gzip":
+                    gunzip = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                while chunk := resp.read1(self.STREAM_CHUNK_BYTES):
+                    yield gunzip.decompress(chunk) if gunzip else chunk
+                # read1 stops at Content-Length without releasing the response; read() finishes it.
+                if chunk := resp.read():
+                    yield gunzip.decompress(chunk) if gunzip else chunk
+                if gunzip:
+                    tail = gunzip.flush()
+                    if tail:
+                        yield tail
+                finished = True
+            finally:
+                if finished and not resp.will_close and not long_poll:
+                    with self.lock:
+                        self.idle.setdefault(key, []).append(conn)
+                else:
+                    conn.close()
+        finally:
+            slot.__exit__(None, None, None)
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str] | None = None,
+        body: bytes | None = None,
+        timeout: float = 30.0,
+        ssl_context: ssl.SSLContext | None = None,
+    ) -> tuple[int, bytes]:
+        chunks = self.stream(method, url, headers=headers, body=body, timeout=timeout, ssl_context=ssl_context)
+        status = next(chunks)
+        return int(status), b"".join(chunks)
+
+
+HTTP_POOL = PooledTransport(env_int("HTTP_POOL_MAX_PER_HOST", 4))
+
+
+class CallRecord:
+    """One timed Prometheus or Kubernetes call; filled in by the client and logged on exit."""
+
+    def __init__(self, stats: "RunStats", family: str, target: str) -> None:
+        self.stats = stats
+        self.family = family
+        self.target = target
+        self.stage = stats.current_stage()
+        self.status = 0
+        self.bytes = 0
+        self.series = 0
+        self.started = 0.0
+
+    def count(self, chunks: Iterator[Any]) -> Iterator[Any]:
+        """Pass a PooledTransport.stream through, adding up the decoded body bytes."""
+
+        for chunk in chunks:
+            if isinstance(chunk, bytes):
+                self.bytes += len(chunk)
+            yield chunk
+
+    def __enter__(self) -> "CallRecord":
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, *exc_info: object) -> bool:
+        self.stats.record(self, time.monotonic() - self.started)
+        return False
+
+
+class RunStats:
+    """Per-call log of the Prometheus and Kubernetes requests made during one advisor run.
+
+    Calls are grouped into families (endpoint plus metric name or resource) and tagged with the
+    stage that issued them. Worker threads inherit the stage of the thread that queued them.
+    """
+
+    SLOWEST = 10
+    TARGET_CHARS = 200
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.calls: list[tuple[str, str, str, int, float, int, int]] = []
+        self.pipeline: dict[str, float] = {}
+        self.started = time.monotonic()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.calls = []
+            self.pipeline = {}
+            self.started = time.monotonic()
+
+    def current_stage(self) -> str:
+        return getattr(self.local, "stage", "") or "other"
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        previous = getattr(self.local, "stage", "")
+        self.local.stage = name
+        try:
+            yield
+        finally:
+            self.local.stage = previous
+
+    def call(self, family: str, target: str) -> CallRecord:
+        return CallRecord(self, family, target)
+
+    def record_pipeline(self, seconds: dict[str, float]) -> None:
+        with self.lock:
+            for name, value in seconds.items():
+                self.pipeline[name] = self.pipeline.get(name, 0.0) + value
+
+    def record(self, call: CallRecord, seconds: float) -> None:
+        target = call.target[: self.TARGET_CHARS]
+        entry = (call.family, call.stage, target, call.status, seconds, call.bytes, call.series)
+        with self.lock:
+            self.calls.append(entry)
+
+    def summary(self) -> dict:
+        """Aggregate the calls into the run_stats section of the report."""
+
+        with self.lock:
+            calls = list(self.calls)
+            pipeline = {name: round(seconds, 4) for name, seconds in self.pipeline.items()}
+
+        families: dict[str, dict] = {}
+        stages: dict[str, dict] = {}
+        for family, stage, _target, status, seconds, size, series in calls:
+            row = families.setdefault(family, {"calls": 0, "errors": 0, "bytes": 0, "series": 0, "latencies": []})
+            row["calls"] += 1
+            row["errors"] += 0 if 200 <= status < 400 else 1
+            row["bytes"] += size
+            row["series"] += series
+            row["latencies"].append(seconds)
+            stage_row = stages.setdefault(stage, {"calls": 0, "bytes": 0, "seconds": 0.0})
+            stage_row["calls"] += 1
+            stage_row["bytes"] += size
+            stage_row["seconds"] += seconds
+
+        for row in families.values():
+            latencies = sorted(row.pop("latencies"))
+            row["p50_seconds"] = round(nearest_rank(latencies, 0.50), 4)
+            row["p95_seconds"] = round(nearest_rank(latencies, 0.95), 4)
+            row["max_seconds"] = round(latencies[-1], 4)
+            row["total_seconds"] = round(sum(latencies), 4)
+        for row in stages.values():
+            row["seconds"] = round(row["seconds"], 4)
+
+        slowest = sorted(calls, key=lambda entry: entry[4], reverse=True)[: self.SLOWEST]
+        return {
+            "duration_seconds": round(time.monotonic() - self.started, 3),
+            "calls": len(calls),
+            "errors": sum(row["errors"] for row in families.values()),
+            "total_bytes": sum(row["bytes"] for row in families.values()),
+            "families": families,
+            "stages": stages,
+            "pipeline_seconds": pipeline,
+            "slowest": [
+                {
+                    "family": family,
+                    "stage": stage,
+                    "target": target,
+                    "status": status,
+                    "seconds": round(seconds, 4),
+                    "bytes": size,
+                    "series": series,
+                }
+                for family, stage, target, status, seconds, size, series in slowest
+            ],
+        }
+
+
+def nearest_rank(sorted_values: list[float], quantile: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(quantile * len(sorted_values)) - 1)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+PROM_METRIC_SELECTOR_RE = re.compile(r"([a-zA-Z_:][a-zA-Z0-9_:]*)\s*\{")
+
+
+def prom_query_family(endpoint: str, query: str) -> str:
+    """Group a PromQL query by endpoint and the first metric it selects."""
+
+    match = PROM_METRIC_SELECTOR_RE.search(query)
+    return f"prometheus {endpoint} {match.group(1) if match else 'other'}"
+
+
+def kube_call_family(method: str, path: str) -> str:
+    """Group an API server call by method and resource, e.g. 'kubernetes GET pods'."""
+
+    parts = [part for part in urllib.parse.urlsplit(path).path.split("/") if part]
+    if parts[:1] == ["api"]:
+        parts = parts[2:]
+    elif parts[:1] == ["apis"]:
+        parts = parts[3:]
+    if len(parts) > 2 and parts[0] == "namespaces":
+        parts = parts[2:]
+    return f"kubernetes {method} {parts[0] if parts else 'other'}"
+
+
+RUN_STATS = RunStats()
+
+
+def decode_json_response(status: int, raw: bytes) -> dict:
+    text = raw.decode("utf-8", errors="replace")
+    if status >= 400:
+        try:
+            return json.loads(text)
+        except Exception:
+            return {"message": text}
+    return json.loads(text) if text else {}
+
+
+class JsonStreamReader:
+    """Incremental reader that walks a JSON document arriving in byte chunks.
+
+    Only the text of the value being decoded is buffered, so a large array can be consumed one
+    element at a time while the rest of the body is still on the socket.
+    """
+
+    WHITESPACE = " \t\r\n"
+    NUMBER_CHARS = "0123456789+-.eE"
+
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        self.chunks = iter(chunks)
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        self.buffer = self.buffer[self.pos :]
+        self.pos = 0
+        for chunk in self.chunks:
+            text = self.text_decoder.decode(chunk)
+            if text:
+                self.buffer += text
+                return True
+        self.buffer += self.text_decoder.decode(b"", final=True)
+        self.eof = True
+        return False
+
+    def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in self.WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if self.eof or not self.fill():
+                return ""
+
+    def take(self, allowed: str) -> str:
+        char = self.peek()
+        if not char or char not in allowed:
+            raise ValueError(f"Expected one of {allowed!r} at offset {self.pos}, found {char!r}")
+        self.pos += 1
+        return char
+
+    def value(self) -> Any:
+        while True:
+            self.peek()
+            try:
+                value, end = self.json_decoder.raw_decode(self.buffer, self.pos)
+                # A number cut off by the chunk boundary ("3." of "3.5") decodes early; wait for more text.
+                if self.eof or (end < len(self.buffer) and self.buffer[end] not in self.NUMBER_CHARS):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+    def array_items(self, path: tuple[str, ...], envelope: dict[str, Any]) -> Iterator[Any]:
+        """Yield the elements of the array at path (object keys from the root).
+
+        Other members met along the way are decoded whole into envelope, keyed by name.
+        """
+
+        self.take("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.take(":")
+            if key == path[0] and len(path) > 1 and self.peek() == "{":
+                yield from self.array_items(path[1:], envelope)
+            elif key == path[0] and len(path) == 1 and self.peek() == "[":
+                self.pos += 1
+                if self.peek() == "]":
+                    self.pos += 1
+                else:
+                    while True:
+                        yield self.value()
+                        if self.take(",]") == "]":
+                            break
+            else:
+                envelope[key] = self.value()
+            if self.take(",}") == "}":
+                return
+
+
+def iter_json_array(
+    chunks: Iterable[bytes], path: tuple[str, ...], envelope: dict[str, Any] | None = None
+) -> Iterator[Any]:
+    """Stream the elements of the array at path in a chunked JSON document, e.g. ("items",)."""
+
+    reader = JsonStreamReader(chunks)
+    yield from reader.array_items(path, envelope if envelope is not None else {})
+
+
+def iter_json_lines(chunks: Iterable[bytes]) -> Iterator[Any]:
+    """Decode newline-delimited JSON (a watch stream) as each line completes."""
+
+    pending = b""
+    for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+    if pending.strip():
+        yield json.loads(pending)
+
+
+class WatchExpired(RuntimeError):
+    pass
+
+
+CONFIGMAP_FIELD_MANAGER = "resource-advisor"
+CONFIGMAP_CONTENT_HASH_ANNOTATION = "resource-advisor/content-sha256"
+CONFIGMAP_APPLY_ATTEMPTS = 4
+# Conflicts, throttling and API-server hiccups are worth another attempt; anything else is final.
+CONFIGMAP_RETRY_STATUSES = (0, 409, 429, 500, 502, 503, 504)
+
+
+def configmap_content_hash(data: dict[str, str], binary_data: dict[str, str] | None = None) -> str:
+    canonical = json.dumps({"data": data, "binaryData": binary_data or {}}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+# Pods that hold node resources: scheduled and not terminated.
+ACTIVE_POD_FIELD_SELECTOR = "spec.nodeName!=,status.phase!=Succeeded,status.phase!=Failed"
+
+# Metadata-only list and watch responses: the API server drops spec and status before encoding.
+PARTIAL_OBJECT_METADATA_ACCEPT = "application/json;as=PartialObjectMetadataList;v=v1;g=meta.k8s.io,application/json"
+PARTIAL_OBJECT_METADATA_WATCH_ACCEPT = "application/json;as=PartialObjectMetadata;v=v1;g=meta.k8s.io,application/json"
+
+
+def compact_metadata(meta: dict) -> dict:
+    """Keep the metadata fields the advisor reads; names and labels are interned across objects."""
+
+    owners = [
+        {"kind": sys.intern(str(ref.get("kind") or "")), "name": str(ref.get("name") or ""), "controller": True}
+        for ref in meta.get("ownerReferences") or []
+        if isinstance(ref, dict) and ref.get("controller")
+    ]
+    return {
+        "name": str(meta.get("name") or ""),
+        "namespace": sys.intern(str(meta.get("namespace") or "")),
+        "labels": {sys.intern(str(k)): sys.intern(str(v)) for k, v in (meta.get("labels") or {}).items()},
+        "ownerReferences": owners,
+        "creationTimestamp": meta.get("creationTimestamp") or "",
+        "resourceVersion": str(meta.get("resourceVersion") or ""),
+    }
+
+
+def project_metadata(obj: dict) -> dict:
+    return {"metadata": compact_metadata(obj.get("metadata", {}) or {})}
+
+
+def compact_pod(pod: dict) -> dict:
+    """Project a pod onto the fields placement, footprint and restart stats read.
+
+    The result keeps the API shape (metadata/spec/status), so existing readers work unchanged, but
+    drops env, volumes, probes, managedFields and the like as each item is decoded.
+    """
+
+    spec = pod.get("spec", {}) or {}
+    status = pod.get("status", {}) or {}
+
+    def containers(items: list[dict] | None) -> list[dict]:
+        return [
+            {
+                "name": sys.intern(str(c.get("name") or "")),
+                "resources": {"requests": dict(((c.get("resources") or {}).get("requests") or {}))},
+            }
+            for c in items or []
+            if isinstance(c, dict)
+        ]
+
+    compact_spec = {
+        "nodeName": sys.intern(str(spec.get("nodeName") or "")),
+        "containers": containers(spec.get("containers")),
+        "initContainers": containers(spec.get("initContainers")),
+    }
+    # Scheduling constraints, kept only when set, for the scheduler placement simulation.
+    if spec.get("nodeSelector"):
+        compact_spec["nodeSelector"] = dict(spec["nodeSelector"])
+    required = ((spec.get("affinity") or {}).get("nodeAffinity") or {}).get(
+        "requiredDuringSchedulingIgnoredDuringExecution"
+    )
+    if required:
+        compact_spec["affinity"] = {"nodeAffinity": {"requiredDuringSchedulingIgnoredDuringExecution": required}}
+    if spec.get("tolerations"):
+        compact_spec["tolerations"] = list(spec["tolerations"])
+
+    return {
+        "metadata": compact_metadata(pod.get("metadata", {}) or {}),
+        "spec": compact_spec,
+        "status": {
+            "phase": sys.intern(str(status.get("phase") or "")),
+            "startTime": status.get("startTime") or "",
+            "containerStatuses": [
+                {"name": sys.intern(str(cs.get("name") or "")), "restartCount": int(cs.get("restartCount") or 0)}
+                for cs in status.get("containerStatuses") or []
+                if isinstance(cs, dict)
+            ],
+        },
+    }
+
+
 class KubeClient:
     def __init__(self) -> None:
         self.host = os.getenv("KUBERNETES_SERVICE_HOST", "kubernetes.default.svc")
@@ -464,13 +1103,11 @@ class KubeClient:
         ca_path = Path("/var/run/secrets/kubernetes.io/serviceaccount/ca.crt")
         self.token = token_path.read_text().strip() if token_path.exists() else ""
 
-        self.ssl_context = (
-            ssl.create_default_context(cafile=str(ca_path))
-            if ca_path.exists()
-            else ssl.create_default_context()
-        )
+        self.ssl_context = tls_context(str(ca_path)) if ca_path.exists() else tls_context()
 
-    def request_json(self, method: str, path: str, body: dict | None = None) -> tuple[int, dict]:
+    def request_json(
+        self, method: str, path: str, body: dict | None = None, content_type: str = "application/json"
+    ) -> tuple[int, dict]:
         url = f"{self.base}{path}"
         headers = {"Accept": "application/json"}
         if self.token:
@@ -478,244 +1115,2379 @@ class KubeClient:
 
         data = None
         if body is not None:
-            headers["Content-Type"] = "application/json"
+            headers["Content-Type"] = content_type
             data = json.dumps(body).encode("utf-8")
 
-        req = urllib.request.Request(url=url, method=method, headers=headers, data=data)
-        try:
-            with urllib.request.urlopen(req, context=self.ssl_context, timeout=30) as resp:
-                raw = resp.read().decode("utf-8")
-                return resp.getcode(), json.loads(raw) if raw else {}
-        except urllib.error.HTTPError as exc:
-            detail = exc.read().decode("utf-8", errors="replace")
-            try:
-                return exc.code, json.loads(detail)
-            except Exception:
-                return exc.code, {"message": detail}
+        with RUN_STATS.call(kube_call_family(method, path), f"{method} {path}") as call:
+            status, raw = HTTP_POOL.request(
+                method,
+                url,
+                headers=headers,
+                body=data,
+                timeout=30,
+                ssl_context=self.ssl_context,
+            )
+            call.status = status
+            call.bytes = len(raw)
+            payload = decode_json_response(status, raw)
+            call.series = len(payload.get("items") or []) if isinstance(payload, dict) else 0
+        return status, payload
+
+    def iter_page(
+        self,
+        path: str,
+        page: dict[str, Any],
+        project: Callable[[dict], dict] | None = None,
+        accept: str = "application/json",
+    ) -> Iterator[dict]:
+        """Stream the items[] of one list response; status and the other top-level members land in page.
+
+        When project is given each item is reduced by it as soon as it is decoded.
+        """
+
+        headers = {"Accept": accept}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        with RUN_STATS.call(kube_call_family("GET", path), f"GET {path}") as call:
+            chunks = call.count(
+                HTTP_POOL.stream("GET", f"{self.base}{path}", headers=headers, timeout=30, ssl_context=self.ssl_context)
+            )
+            call.status = page["status"] = int(next(chunks))
+            if call.status != 200:
+                page["error"] = decode_json_response(call.status, b"".join(chunks))
+                return
+            for item in iter_json_array(chunks, ("items",), page):
+                call.series += 1
+                yield project(item) if project else item
+
+    def iter_items(
+        self,
+        path: str,
+        description: str,
+        params: dict[str, str] | None = None,
+        meta: dict[str, Any] | None = None,
+        project: Callable[[dict], dict] | None = None,
+        accept: str = "application/json",
+    ) -> Iterator[dict]:
+        """Stream every item of a list, following limit/continue pages of KUBE_LIST_PAGE_SIZE items.
+
+        Each page is consumed before the next is requested, so memory is bounded by one page. When
+        meta is given it receives the list metadata, plus complete=True once the last page is read.
+        """
+
+        query = {key: value for key, value in (params or {}).items() if value}
+        page_size = env_int("KUBE_LIST_PAGE_SIZE", 500)
+        if page_size > 0:
+            query["limit"] = str(page_size)
+        while True:
+            page: dict[str, Any] = {}
+            yield from self.iter_page(
+                f"{path}?{urllib.parse.urlencode(query)}" if query else path, page, project, accept
+            )
+            metadata = page.get("metadata") or (page.get("error") or {}).get("metadata") or {}
+            if page["status"] == 410 and metadata.get("continue"):
+                # The continue token expired mid-list; the API server offers one that resumes on a newer snapshot.
+                log(f"List of {description} expired mid-pagination; resuming on a newer snapshot")
+            elif page["status"] != 200:
+                log(f"Failed to list {description}: {page['status']} {page.get('error')}")
+                return
+            if meta is not None:
+                meta.update(metadata)
+            if not metadata.get("continue"):
+                if meta is not None:
+                    meta["complete"] = True
+                return
+            query["continue"] = metadata["continue"]
+
+    def watch(
+        self, path: str, params: dict[str, str], timeout_seconds: int, accept: str = "application/json"
+    ) -> Iterator[dict]:
+        """Stream watch events for a collection until the server ends the watch.
+
+        Raises WatchExpired when the resourceVersion is too old (410 Gone) so the caller relists.
+        """
+
+        query = {key: value for key, value in params.items() if value}
+        query.update({"watch": "1", "allowWatchBookmarks": "true", "timeoutSeconds": str(timeout_seconds)})
+        target = f"{path}?{urllib.parse.urlencode(query)}"
+        headers = {"Accept": accept}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        with RUN_STATS.call(kube_call_family("WATCH", path), f"WATCH {target}") as call:
+            chunks = call.count(
+                HTTP_POOL.stream(
+                    "GET",
+                    f"{self.base}{target}",
+                    headers=headers,
+                    timeout=timeout_seconds + 30,
+                    ssl_context=self.ssl_context,
+                    long_poll=True,
+                )
+            )
+            call.status = int(next(chunks))
+            if call.status == 410:
+                raise WatchExpired(f"watch of {path} expired")
+            if call.status != 200:
+                raise RuntimeError(f"watch of {path} failed: {call.status} {b''.join(chunks)[:500]!r}")
+            for event in iter_json_lines(chunks):
+                call.series += 1
+                yield event
 
     def list_workloads(self, namespace: str, kind: str) -> list[dict]:
-        status, payload = self.request_json("GET", f"/apis/apps/v1/namespaces/{namespace}/{kind}")
-        if status != 200:
-            log(f"Failed to list {kind} in {namespace}: {status} {payload}")
-            return []
-        return payload.get("items", [])
+        return list(self.iter_items(f"/apis/apps/v1/namespaces/{namespace}/{kind}", f"{kind} in {namespace}"))
 
     def list_nodes(self) -> list[dict]:
-        status, payload = self.request_json("GET", "/api/v1/nodes")
-        if status != 200:
-            log(f"Failed to list nodes: {status} {payload}")
-            return []
-        return payload.get("items", [])
+        return list(self.iter_items("/api/v1/nodes", "nodes"))
+
+    def iter_metadata(
+        self,
+        path: str,
+        description: str,
+        params: dict[str, str] | None = None,
+        meta: dict[str, Any] | None = None,
+    ) -> Iterator[dict]:
+        """Stream a list as PartialObjectMetadata, reduced to compacted metadata only."""
+
+        return self.iter_items(
+            path, description, params, meta, project=project_metadata, accept=PARTIAL_OBJECT_METADATA_ACCEPT
+        )
+
+    def list_replicasets(self, namespace: str) -> list[dict]:
+        """ReplicaSet metadata only: the ownerReferences that tie pods to their Deployment."""
+
+        path = f"/apis/apps/v1/namespaces/{namespace}/replicasets"
+        return list(self.iter_metadata(path, f"replicasets in {namespace}"))
+
+    def iter_pods(
+        self, namespace: str | None = None, field_selector: str = "", label_selector: str = ""
+    ) -> Iterator[dict]:
+        """Stream pods as compact_pod records."""
 
-    def list_pods(self, namespace: str | None = None) -> list[dict]:
         if namespace:
             path = f"/api/v1/namespaces/{namespace}/pods"
         else:
             path = "/api/v1/pods"
-
-        status, payload = self.request_json("GET", path)
-        if status != 200:
-            ns = namespace or "*"
-            log(f"Failed to list pods in {ns}: {status} {payload}")
-            return []
-        return payload.get("items", [])
-
-    def get_configmap_data(self, namespace: str, name: str) -> dict[str, str]:
-        status, payload = self.request_json("GET", f"/api/v1/namespaces/{namespace}/configmaps/{name}")
-        if status != 200:
-            return {}
-        data = (payload or {}).get("data", {}) or {}
-        return {str(key): str(value) for key, value in data.items()}
-
-    def upsert_configmap(self, namespace: str, name: str, data: dict[str, str]) -> None:
-        get_status, get_payload = self.request_json("GET", f"/api/v1/namespaces/{namespace}/configmaps/{name}")
-
-        if get_status == 404:
-            body = {
-                "apiVersion": "v1",
-                "kind": "ConfigMap",
-                "metadata": {"name": name, "namespace": namespace},
-                "data": data,
-            }
-            create_status, create_payload = self.request_json(
-                "POST", f"/api/v1/namespaces/{namespace}/configmaps", body
-            )
-            if create_status not in (200, 201):
-                log(f"Failed to create configmap {namespace}/{name}: {create_status} {create_payload}")
-                return
-            log(f"Created configmap {namespace}/{name}")
-            return
-
-        if get_status != 200:
-            log(f"Failed to get configmap {namespace}/{name}: {get_status} {get_payload}")
-            return
-
-        metadata = get_payload.get("metadata", {})
-        body = {
+        params = {"fieldSelector": field_selector, "labelSelector": label_selector}
+        return self.iter_items(path, f"pods in {namespace or '*'}", params, project=compact_pod)
+
+    def list_pods(self, namespace: str | None = None, field_selector: str = "", label_selector: str = "") -> list[dict]:
+        return list(self.iter_pods(namespace, field_selector, label_selector))
+
+    def upsert_configmap(
+        self,
+        namespace: str,
+        name: str,
+        data: dict[str, str],
+        binary_data: dict[str, str] | None = None,
+        known_hash: str = "",
+        remove_keys: Iterable[str] = (),
+        content_hash: str = "",
+    ) -> str:
+        """Create or update a ConfigMap with server-side apply; binary_data values are base64-encoded.
+
+        Returns the content hash, which is also stored as an annotation. When it equals known_hash the
+        write is skipped. content_hash replaces the hash of data and binary_data for callers whose data
+        holds fields that change on every run. The apply needs no prior GET and is retried on conflicts
+        and transient errors. remove_keys drops data keys another field manager wrote, such as ones left
+        by an older update-based writer that apply cannot prune. Returns "" when the write failed.
+        """
+
+        content_hash = content_hash or configmap_content_hash(data, binary_data)
+        if known_hash and known_hash == content_hash and not remove_keys:
+            log(f"Configmap {namespace}/{name} unchanged; skipping write")
+            return content_hash
+        body: dict[str, Any] = {
             "apiVersion": "v1",
             "kind": "ConfigMap",
             "metadata": {
                 "name": name,
                 "namespace": namespace,
-                "resourceVersion": metadata.get("resourceVersion"),
+                "annotations": {CONFIGMAP_CONTENT_HASH_ANNOTATION: content_hash},
             },
             "data": data,
         }
-        put_status, put_payload = self.request_json(
-            "PUT", f"/api/v1/namespaces/{namespace}/configmaps/{name}", body
-        )
-        if put_status != 200:
-            log(f"Failed to update configmap {namespace}/{name}: {put_status} {put_payload}")
+        if binary_data:
+            body["binaryData"] = binary_data
+        path = f"/api/v1/namespaces/{namespace}/configmaps/{name}"
+        query = urllib.parse.urlencode({"fieldManager": CONFIGMAP_FIELD_MANAGER, "force": "true"})
+        status, payload = 0, {}
+        for attempt in range(CONFIGMAP_APPLY_ATTEMPTS):
+            if attempt:
+                time.sleep(0.5 * 2 ** (attempt - 1))
+            try:
+                status, payload = self.request_json(
+                    "PATCH", f"{path}?{query}", body, content_type="application/apply-patch+yaml"
+                )
+                if status in (200, 201) and remove_keys:
+                    status, payload = self.request_json(
+                        "PATCH",
+                        path,
+                        {"data": {key: None for key in remove_keys}},
+                        content_type="application/merge-patch+json",
+                    )
+            except Exception as exc:
+                status, payload = 0, {"error": str(exc)}
+            if status not in CONFIGMAP_RETRY_STATUSES:
+                break
+            log(f"Retrying write of configmap {namespace}/{name} after {status}")
+        if status not in (200, 201):
+            log(f"Failed to apply configmap {namespace}/{name}: {status} {payload}")
+            return ""
+        log(f"{'Created' if status == 201 else 'Updated'} configmap {namespace}/{name}")
+        return content_hash
+
+    def delete_configmap(self, namespace: str, name: str) -> None:
+        status, payload = self.request_json("DELETE", f"/api/v1/namespaces/{namespace}/configmaps/{name}")
+        if status not in (200, 202, 404):
+            log(f"Failed to delete configmap {namespace}/{name}: {status} {payload}")
             return
-        log(f"Updated configmap {namespace}/{name}")
+        log(f"Deleted configmap {namespace}/{name}")
+
+
+def label_selector_matches(labels: dict[str, str], selector: str) -> bool:
+    """Match equality-based label selectors: "k=v", "k==v", "k!=v", "k" and "!k", comma separated."""
+
+    for term in (part.strip() for part in selector.split(",")):
+        if not term:
+            continue
+        if "!=" in term:
+            key, value = (side.strip() for side in term.split("!=", 1))
+            if labels.get(key) == value:
+                return False
+        elif "=" in term:
+            key, value = (side.strip() for side in term.replace("==", "=").split("=", 1))
+            if labels.get(key) != value:
+                return False
+        elif term.startswith("!"):
+            if term[1:].strip() in labels:
+                return False
+        elif term not in labels:
+            return False
+    return True
+
+
+class Informer:
+    """List-then-watch cache of one Kubernetes collection, indexed by namespace and name.
+
+    The collection is listed once and then kept current from watch events resumed at the last
+    seen resourceVersion; bookmarks keep that version fresh on quiet collections. A 410 Gone
+    relists. Readers get a consistent snapshot of the store at any time.
+    """
+
+    WATCH_TIMEOUT_SECONDS = 300
+    RETRY_SECONDS = 5.0
+
+    def __init__(
+        self,
+        kube: KubeClient,
+        path: str,
+        description: str,
+        params: dict[str, str] | None = None,
+        project: Callable[[dict], dict] | None = None,
+        metadata_only: bool = False,
+    ) -> None:
+        self.kube = kube
+        self.path = path
+        self.description = description
+        self.params = dict(params or {})
+        self.project = project_metadata if metadata_only else project
+        self.metadata_only = metadata_only
+        self.lock = threading.Lock()
+        self.store: dict[str, dict[str, dict]] = {}
+        self.resource_version = ""
+        self.synced = threading.Event()
+        self.counters = {"relists": 0, "events": 0, "bookmarks": 0, "watch_restarts": 0, "errors": 0}
+
+    @staticmethod
+    def object_key(obj: dict) -> tuple[str, str]:
+        meta = obj.get("metadata", {}) or {}
+        return str(meta.get("namespace") or ""), str(meta.get("name") or "")
+
+    def relist(self) -> bool:
+        meta: dict[str, Any] = {}
+        store: dict[str, dict[str, dict]] = {}
+        if self.metadata_only:
+            objects = self.kube.iter_metadata(self.path, self.description, self.params, meta)
+        else:
+            objects = self.kube.iter_items(self.path, self.description, self.params, meta, self.project)
+        for obj in objects:
+            namespace, name = self.object_key(obj)
+            store.setdefault(namespace, {})[name] = obj
+        if not meta.get("complete"):
+            return False
+        with self.lock:
+            self.store = store
+            self.resource_version = str(meta.get("resourceVersion") or "")
+            self.counters["relists"] += 1
+        self.synced.set()
+        return True
+
+    def apply(self, event: dict) -> None:
+        kind = event.get("type")
+        obj = event.get("object", {}) or {}
+        if kind == "ERROR":
+            if obj.get("code") == 410:
+                raise WatchExpired(str(obj.get("message") or "resourceVersion too old"))
+            raise RuntimeError(f"watch error: {obj.get('message') or obj}")
+        namespace, name = self.object_key(obj)
+        resource_version = str((obj.get("metadata", {}) or {}).get("resourceVersion") or "")
+        with self.lock:
+            if kind in ("ADDED", "MODIFIED"):
+                self.store.setdefault(namespace, {})[name] = self.project(obj) if self.project else obj
+                self.counters["events"] += 1
+            elif kind == "DELETED":
+                self.store.get(namespace, {}).pop(name, None)
+                self.counters["events"] += 1
+            elif kind == "BOOKMARK":
+                self.counters["bookmarks"] += 1
+            if resource_version:
+                self.resource_version = resource_version
+
+    def watch_once(self) -> None:
+        """Follow one watch until the server closes it; raises WatchExpired when a relist is needed."""
+
+        params = {**self.params, "resourceVersion": self.resource_version}
+        accept = PARTIAL_OBJECT_METADATA_WATCH_ACCEPT if self.metadata_only else "application/json"
+        for event in self.kube.watch(self.path, params, self.WATCH_TIMEOUT_SECONDS, accept):
+            self.apply(event)
+        with self.lock:
+            self.counters["watch_restarts"] += 1
+
+    def run(self, stop: threading.Event) -> None:
+        relist = True
+        while not stop.is_set():
+            try:
+                if relist:
+                    if not self.relist():
+                        stop.wait(self.RETRY_SECONDS)
+                        continue
+                    relist = False
+                self.watch_once()
+            except WatchExpired:
+                log(f"Watch of {self.description} expired; relisting")
+                relist = True
+            except Exception as exc:
+                with self.lock:
+                    self.counters["errors"] += 1
+                log(f"Watch of {self.description} failed: {exc}")
+                stop.wait(self.RETRY_SECONDS)
+
+    def start(self, stop: threading.Event) -> threading.Thread:
+        thread = threading.Thread(target=self.run, args=(stop,), name=f"informer-{self.description}", daemon=True)
+        thread.start()
+        return thread
+
+    def items(self, namespace: str | None = None) -> list[dict]:
+        with self.lock:
+            if namespace is not None:
+                return list(self.store.get(namespace, {}).values())
+            return [obj for objects in self.store.values() for obj in objects.values()]
+
+    def stats(self) -> dict[str, Any]:
+        with self.lock:
+            return {
+                **self.counters,
+                "objects": sum(len(objects) for objects in self.store.values()),
+                "resource_version": self.resource_version,
+            }
 
 
 class PromClient:
     def __init__(self, base_url: str) -> None:
         self.base = base_url.rstrip("/")
 
-    def query_scalar(self, query: str) -> float | None:
-        encoded = urllib.parse.urlencode({"query": query})
-        url = f"{self.base}/api/v1/query?{encoded}"
-        try:
-            with urllib.request.urlopen(url, timeout=45) as resp:
-                payload = json.loads(resp.read().decode("utf-8"))
-        except urllib.error.HTTPError as exc:
-            detail = exc.read().decode("utf-8", errors="replace")
-            log(f"Prometheus query failed ({exc.code}): {detail}")
-            return None
-        except Exception as exc:
-            log(f"Prometheus query failed: {exc}")
-            return None
-
-        if payload.get("status") != "success":
-            log(f"Prometheus returned non-success: {payload}")
-            return None
+    def api_results(self, path: str, params: dict[str, str], parse: Callable[[dict], Any]) -> list | None:
+        """Stream data.result[] from a Prometheus API endpoint through parse, or return None on failure.
 
-        results = payload.get("data", {}).get("result", [])
-        if not results:
-            return None
+        Each entry is reduced by parse as it is decoded, so the raw JSON for the whole response is
+        never held in memory at once. Entries for which parse returns None are dropped.
+        """
 
-        values = []
-        for item in results:
+        url = f"{self.base}{path}?{urllib.parse.urlencode(params)}"
+        envelope: dict[str, Any] = {}
+        rows: list = []
+        query = params.get("query", "")
+        with RUN_STATS.call(prom_query_family(path.rsplit("/", 1)[-1], query), query) as call:
+            try:
+                chunks = call.count(HTTP_POOL.stream("GET", url, headers={"Accept": "application/json"}, timeout=45))
+                call.status = int(next(chunks))
+                if call.status >= 400:
+                    raw = b"".join(chunks)
+                    log(f"Prometheus query failed ({call.status}): {raw.decode('utf-8', errors='replace')}")
+                    return None
+                for item in iter_json_array(chunks, ("data", "result"), envelope):
+                    row = parse(item)
+                    if row is not None:
+                        rows.append(row)
+            except Exception as exc:
+                call.status = 0
+                log(f"Prometheus query failed: {exc}")
+                return None
+            call.series = len(rows)
+
+            if envelope.get("status") != "success":
+                call.status = 0
+                log(f"Prometheus returned non-success: {envelope}")
+                return None
+        return rows
+
+    def query_vector(self, query: str) -> list[tuple[dict[str, str], float]] | None:
+        """Return (labels, value) pairs for an instant query, or None on failure."""
+
+        def parse(item: dict) -> tuple[dict[str, str], float] | None:
             value = item.get("value", [])
             if len(value) >= 2:
                 try:
-                    values.append(float(value[1]))
+                    return item.get("metric", {}) or {}, float(value[1])
                 except ValueError:
-                    continue
-
-        if not values:
+                    return None
             return None
-        return max(values)
 
+        return self.api_results("/api/v1/query", {"query": query}, parse)
 
-def pod_regex_for_workload(workload: str, kind: str) -> str:
-    escaped = re.escape(workload).replace("\\-", "-")
-    if kind == "statefulsets":
-        return f"{escaped}-[0-9]+"
-    return f"{escaped}-.+"
+    def query_range(
+        self, query: str, start: int, end: int, step: int
+    ) -> list[tuple[dict[str, str], list[tuple[float, float]]]] | None:
+        """Return (labels, [(timestamp, value)]) series for a range query, or None on failure."""
 
+        def parse(item: dict) -> tuple[dict[str, str], list[tuple[float, float]]]:
+            points: list[tuple[float, float]] = []
+            for point in item.get("values", []):
+                if len(point) >= 2:
+                    try:
+                        points.append((float(point[0]), float(point[1])))
+                    except ValueError:
+                        continue
+            return item.get("metric", {}) or {}, points
 
-def recommend(current: float, target: float, max_step_percent: float) -> float:
-    if current <= 0:
-        return target
-    step = max_step_percent / 100.0
-    low = current * (1.0 - step)
-    high = current * (1.0 + step)
-    return clamp(target, low, high)
+        return self.api_results(
+            "/api/v1/query_range",
+            {"query": query, "start": str(start), "end": str(end), "step": f"{step}s"},
+            parse,
+        )
 
+    def query_scalar(self, query: str) -> float | None:
+        samples = self.query_vector(query)
+        if not samples:
+            return None
+        return max(value for _labels, value in samples)
 
-def pod_effective_requests(pod: dict) -> tuple[float, float]:
-    """Return the pod's effective CPU(m) and memory(Mi) requests.
 
-    Scheduler semantics: sum(containers) vs max(initContainers), per resource.
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+class PromQueryExecutor:
+    """Run Prometheus queries on a bounded thread pool.
+
+    Concurrency is capped by the pool size, starts can optionally be spaced to a per-second
+    rate, and the whole run shares one time budget. Once the budget is spent, queued queries
+    are abandoned and resolve() raises QueryBudgetExceeded so the run fails instead of
+    publishing a report built from partial data.
     """
 
-    spec = pod.get("spec", {}) or {}
+    def __init__(self, concurrency: int, rate_per_second: float = 0.0, budget_seconds: float = 0.0) -> None:
+        self.concurrency = max(1, concurrency)
+        self.rate_per_second = max(0.0, rate_per_second)
+        self.budget_seconds = max(0.0, budget_seconds)
+        self.started_at = time.monotonic()
+        self.pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="prom-query")
+        self.rate_lock = threading.Lock()
+        self.next_start_at = self.started_at
+
+    def remaining_seconds(self) -> float | None:
+        if self.budget_seconds <= 0.0:
+            return None
+        return self.budget_seconds - (time.monotonic() - self.started_at)
 
-    def sum_requests(containers: list[dict] | None) -> tuple[float, float]:
-        cpu_m = 0.0
-        mem_mi = 0.0
-        for c in containers or []:
-            req = (c.get("resources", {}) or {}).get("requests", {}) or {}
-            cpu_m += parse_cpu_to_m(req.get("cpu"))
-            mem_mi += parse_mem_to_mi(req.get("memory"))
-        return cpu_m, mem_mi
+    def check_budget(self) -> None:
+        remaining = self.remaining_seconds()
+        if remaining is not None and remaining <= 0.0:
+            raise QueryBudgetExceeded(f"Prometheus query budget of {self.budget_seconds:g}s exhausted")
 
-    def max_requests(containers: list[dict] | None) -> tuple[float, float]:
-        cpu_m = 0.0
-        mem_mi = 0.0
-        for c in containers or []:
-            req = (c.get("resources", {}) or {}).get("requests", {}) or {}
-            cpu_m = max(cpu_m, parse_cpu_to_m(req.get("cpu")))
-            mem_mi = max(mem_mi, parse_mem_to_mi(req.get("memory")))
-        return cpu_m, mem_mi
+    def wait_for_rate_slot(self) -> None:
+        if self.rate_per_second <= 0.0:
+            return
+        with self.rate_lock:
+            now = time.monotonic()
+            start_at = max(now, self.next_start_at)
+            self.next_start_at = start_at + 1.0 / self.rate_per_second
+        if start_at > now:
+            time.sleep(start_at - now)
+
+    def run(self, stage: str, fn: Callable[..., Any], *args: Any) -> Any:
+        self.check_budget()
+        self.wait_for_rate_slot()
+        self.check_budget()
+        with RUN_STATS.stage(stage):
+            return fn(*args)
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> Future:
+        return self.pool.submit(self.run, RUN_STATS.current_stage(), fn, *args)
+
+    def resolve(self, futures: dict[str, Future]) -> dict:
+        results = {}
+        for key, future in futures.items():
+            try:
+                results[key] = future.result(timeout=self.remaining_seconds())
+            except FutureTimeoutError:
+                raise QueryBudgetExceeded(
+                    f"Prometheus query budget of {self.budget_seconds:g}s exhausted"
+                ) from None
+        return results
 
-    cont_cpu_m, cont_mem_mi = sum_requests(spec.get("containers"))
-    init_cpu_m, init_mem_mi = max_requests(spec.get("initContainers"))
-    return max(cont_cpu_m, init_cpu_m), max(cont_mem_mi, init_mem_mi)
+    def shutdown(self) -> None:
+        self.pool.shutdown(wait=False, cancel_futures=True)
 
 
-def pod_has_container_name(pod: dict, container_name: str) -> bool:
-    spec = pod.get("spec", {}) or {}
-    for c in spec.get("containers", []) or []:
-        if c.get("name") == container_name:
-            return True
-    return False
+class ResolutionGovernor:
+    """Coarsen the p95 subquery resolution when measured latency would overrun the run budget.
 
+    Each adaptive query asks for its resolution when it starts. The projection is the elapsed
+    time plus the adaptive queries still waiting, at the mean latency for the current resolution,
+    spread over the pool's concurrency. When that passes the budget the governor steps to the
+    next coarser resolution and keeps it for the rest of the run.
+    """
 
-def build_pod_placement_index(pods: list[dict]) -> dict[tuple[str, str], dict[str, int]]:
-    """Return (release, container) -> {nodeName: pod_count} for scheduled pods."""
+    def __init__(self, resolutions: list[str], budget_seconds: float, concurrency: int) -> None:
+        self.resolutions = resolutions
+        self.step_seconds = [parse_duration_seconds(value) or 1 for value in resolutions]
+        self.budget_seconds = budget_seconds
+        self.concurrency = max(1, concurrency)
+        self.started_at = time.monotonic()
+        self.lock = threading.Lock()
+        self.level = 0
+        self.pending = 0
+        self.latency: dict[int, list[float]] = {}
+        self.steps: list[dict] = []
+
+    def mean_latency(self) -> float | None:
+        """Mean latency at the current level, scaled from a finer level until it has samples of its own."""
+
+        for level in range(self.level, -1, -1):
+            count, total = self.latency.get(level, (0, 0.0))
+            if count >= min(self.concurrency, 2):
+                return (total / count) * self.step_seconds[level] / self.step_seconds[self.level]
+        return None
+
+    def choose(self) -> int:
+        with self.lock:
+            self.pending = max(0, self.pending - 1)
+            mean = self.mean_latency()
+            if mean is not None and self.level < len(self.resolutions) - 1:
+                elapsed = time.monotonic() - self.started_at
+                projected = elapsed + (self.pending + 1) * mean / self.concurrency
+                if projected > self.budget_seconds:
+                    self.level += 1
+                    self.steps.append(
+                        {
+                            "resolution": self.resolutions[self.level],
+                            "elapsed_seconds": round(elapsed, 1),
+                            "projected_seconds": round(projected, 1),
+                            "queries_remaining": self.pending + 1,
+                        }
+                    )
+                    log(
+                        f"Projected query time {projected:.0f}s exceeds RUN_TIME_BUDGET_SECONDS="
+                        f"{self.budget_seconds:g}; coarsening resolution to {self.resolutions[self.level]}"
+                    )
+            return self.level
+
+    def observe(self, level: int, seconds: float) -> None:
+        with self.lock:
+            count, total = self.latency.get(level, (0, 0.0))
+            self.latency[level] = [count + 1, total + seconds]
+
+    def run(self, fetch: Callable[[Any], Any], build: Callable[[str], Any], chosen: dict[str, str], key: str) -> Any:
+        level = self.choose()
+        resolution = self.resolutions[level]
+        chosen[key] = resolution
+        started = time.monotonic()
+        try:
+            return fetch(build(resolution))
+        finally:
+            self.observe(level, time.monotonic() - started)
+
+    def submit(
+        self,
+        executor: "PromQueryExecutor",
+        fetch: Callable[[Any], Any],
+        build: Callable[[str], Any],
+        chosen: dict[str, str],
+        key: str,
+    ) -> Future:
+        """Queue a query whose resolution is picked when it starts; the pick is stored in chosen[key].
+
+        build turns the picked resolution into fetch's argument: a query string, or a step in seconds
+        for the usage cache's range fetches.
+        """
+
+        with self.lock:
+            self.pending += 1
+        return executor.submit(self.run, fetch, build, chosen, key)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "budget_seconds": self.budget_seconds,
+                "configured_resolution": self.resolutions[0],
+                "final_resolution": self.resolutions[self.level],
+                "steps": list(self.steps),
+            }
 
-    index: dict[tuple[str, str], dict[str, int]] = {}
-    for pod in pods:
-        spec = pod.get("spec", {}) or {}
-        node = spec.get("nodeName")
-        if not node:
-            continue
 
-        meta = pod.get("metadata", {}) or {}
-        labels = meta.get("labels", {}) or {}
-        release = labels.get("app.kubernetes.io/instance") or ""
-        if not release:
-            continue
+def resolution_ladder(metrics_resolution: str, fallbacks: list[str]) -> list[str]:
+    """The configured resolution followed by the coarser fallbacks, finest first."""
 
-        for c in spec.get("containers", []) or []:
-            name = c.get("name") or ""
-            if not name:
-                continue
-            key = (release, name)
-            index.setdefault(key, {})
-            index[key][node] = index[key].get(node, 0) + 1
-    return index
+    base_seconds = parse_duration_seconds(metrics_resolution)
+    if not base_seconds:
+        return [metrics_resolution]
+    coarser = {}
+    for value in fallbacks:
+        seconds = parse_duration_seconds(value)
+        if seconds and seconds > base_seconds:
+            coarser.setdefault(seconds, value)
+    return [metrics_resolution] + [coarser[seconds] for seconds in sorted(coarser)]
 
 
-def build_node_request_footprint(pods: list[dict]) -> tuple[dict[str, dict[str, float]], float, float]:
-    """Return per-node request totals and cluster totals (CPU m, Memory Mi)."""
+def coarsest_resolution(resolutions: Iterable[str], default: str) -> str:
+    return max(resolutions, key=lambda value: parse_duration_seconds(value) or 0, default=default)
 
-    per_node: dict[str, dict[str, float]] = {}
-    total_cpu_m = 0.0
-    total_mem_mi = 0.0
 
-    for pod in pods:
-        spec = pod.get("spec", {}) or {}
-        node = spec.get("nodeName")
+def open_resolution_governor(
+    metrics_resolution: str, concurrency: int, query_budget_seconds: float = 0.0
+) -> ResolutionGovernor | None:
+    """Return a governor when RUN_TIME_BUDGET_SECONDS is set and a coarser fallback exists.
+
+    RUN_TIME_BUDGET_SECONDS is the soft target the governor degrades resolution to meet;
+    PROM_QUERY_BUDGET_SECONDS stays the hard limit that fails the run, so it should be the larger.
+    """
+
+    budget_seconds = env_float("RUN_TIME_BUDGET_SECONDS", 0.0)
+    if budget_seconds <= 0.0:
+        return None
+    if 0.0 < query_budget_seconds <= budget_seconds:
+        log(
+            f"RUN_TIME_BUDGET_SECONDS={budget_seconds:g} is not below PROM_QUERY_BUDGET_SECONDS="
+            f"{query_budget_seconds:g}; the run fails before the governor can coarsen enough"
+        )
+    ladder = resolution_ladder(metrics_resolution, env_list("METRICS_RESOLUTION_FALLBACKS", "2h,6h"))
+    if len(ladder) < 2:
+        log(f"RUN_TIME_BUDGET_SECONDS is set but no fallback is coarser than {metrics_resolution!r}; not adapting")
+        return None
+    return ResolutionGovernor(ladder, budget_seconds, concurrency)
+
+
+# Pod name suffixes the controllers append: <statefulset>-<ordinal> and <deployment>-<pod-template-hash>-<random>.
+# Anchoring both segments keeps "immich" from claiming "immich-postgres-0" or "immich-server-<hash>-<random>".
+POD_NAME_SUFFIXES = {"statefulsets": "-[0-9]+", "deployments": "-[a-z0-9]+-[a-z0-9]{5}"}
+POD_OWNER_NAME_RES = tuple((kind, re.compile(f"(.+){suffix}")) for kind, suffix in POD_NAME_SUFFIXES.items())
+
+
+def pod_regex_for_workload(workload: str, kind: str) -> str:
+    escaped = re.escape(workload).replace("\\-", "-")
+    return escaped + POD_NAME_SUFFIXES["statefulsets" if kind == "statefulsets" else "deployments"]
+
+
+class PodOwnerIndex:
+    """Resolve pods to their (kind, workload) owner, built once per snapshot.
+
+    Live pods resolve through controller ownerReferences (Pod -> ReplicaSet -> Deployment, or Pod ->
+    StatefulSet). Pods known only by name, such as Prometheus series of pods that no longer exist,
+    resolve by the controller naming scheme against the known workloads. Lookups are memoised.
+    """
+
+    def __init__(
+        self,
+        workloads: Iterable[tuple[str, str, str]],
+        pods: Iterable[dict] = (),
+        replicasets: Iterable[dict] = (),
+    ) -> None:
+        self.workloads = set(workloads)
+        deployment_of_replicaset: dict[tuple[str, str], str] = {}
+        for replicaset in replicasets:
+            meta = replicaset.get("metadata", {}) or {}
+            for ref in meta.get("ownerReferences") or []:
+                if ref.get("controller") and ref.get("kind") == "Deployment":
+                    deployment_of_replicaset[(str(meta.get("namespace") or ""), str(meta.get("name") or ""))] = str(
+                        ref.get("name") or ""
+                    )
+        self.owners: dict[tuple[str, str], tuple[str, str] | None] = {}
+        for pod in pods:
+            meta = pod.get("metadata", {}) or {}
+            namespace, name = str(meta.get("namespace") or ""), str(meta.get("name") or "")
+            for ref in meta.get("ownerReferences") or []:
+                if not ref.get("controller"):
+                    continue
+                owner_name = str(ref.get("name") or "")
+                if ref.get("kind") == "StatefulSet":
+                    self.owners[(namespace, name)] = ("statefulsets", owner_name)
+                elif ref.get("kind") == "ReplicaSet":
+                    # A ReplicaSet is named <deployment>-<pod-template-hash> when its owner was not listed.
+                    deployment = deployment_of_replicaset.get((namespace, owner_name)) or owner_name.rsplit("-", 1)[0]
+                    self.owners[(namespace, name)] = ("deployments", deployment)
+                else:
+                    self.owners[(namespace, name)] = None
+
+    def owner(self, namespace: str, pod_name: str) -> tuple[str, str] | None:
+        key = (namespace, pod_name)
+        if key not in self.owners:
+            self.owners[key] = None
+            for kind, name_re in POD_OWNER_NAME_RES:
+                match = name_re.fullmatch(pod_name)
+                if match and (namespace, kind, match.group(1)) in self.workloads:
+                    self.owners[key] = (kind, match.group(1))
+                    break
+        return self.owners[key]
+
+
+USAGE_MAX_FIELDS = ("cpu_p95_cores", "mem_p95_bytes")
+USAGE_SUM_FIELDS = ("restarts", "throttled_periods", "cfs_periods")
+USAGE_QUANTILE = 0.95
+USAGE_SUMMARY_QUANTILES = (("p50", 0.50), ("p90", 0.90), ("p95", USAGE_QUANTILE), ("p99", 0.99), ("max", 1.0))
+USAGE_SUMMARY_STATS = tuple(name for name, _q in USAGE_SUMMARY_QUANTILES) + ("mean",)
+METRICS_COLLECTION_MODES = ("batched", "per-container", "range")
+# Buckets this close to "now" may still be missing scrapes, so they are fetched but not cached.
+USAGE_CACHE_SETTLE_SECONDS = 600
+
+
+def usage_selectors(namespace: str, pod_regex: str | None = None, container_name: str | None = None) -> tuple[str, str]:
+    """Return the (usage, plain) label selectors for one workload container or a whole namespace."""
+
+    if pod_regex is None:
+        return (
+            f'namespace="{namespace}",container!="",image!=""',
+            f'namespace="{namespace}",container!=""',
+        )
+    return (
+        f'namespace="{namespace}",pod=~"{pod_regex}",container="{container_name}",image!=""',
+        f'namespace="{namespace}",pod=~"{pod_regex}",container="{container_name}"',
+    )
+
+
+def aligned_steps(now: float, window_seconds: int, step_seconds: int) -> range:
+    """Evaluation timestamps of a [window:step] subquery at now: step multiples in (now - window, now]."""
+
+    first = (math.floor((now - window_seconds) / step_seconds) + 1) * step_seconds
+    last = math.floor(now / step_seconds) * step_seconds
+    return range(first, last + step_seconds, step_seconds)
+
+
+def usage_queries(
+    namespace: str,
+    metrics_window: str,
+    metrics_resolution: str,
+    cpu_throttle_window: str,
+    pod_regex: str | None = None,
+    container_name: str | None = None,
+) -> dict[str, str]:
+    """Return the usage queries for one workload container, or grouped for a whole namespace.
+
+    With a pod regex and container name each query aggregates to a scalar. Without them
+    each query returns one sample per (namespace, pod, container) for local joining.
+    """
+
+    usage_selector, plain_selector = usage_selectors(namespace, pod_regex, container_name)
+    if pod_regex is None:
+
+        def peak(query: str) -> str:
+            return f"max by (namespace, pod, container) ({query})"
+
+        def total(query: str) -> str:
+            return f"sum by (namespace, pod, container) ({query})"
+
+    else:
+
+        def peak(query: str) -> str:
+            return query
+
+        def total(query: str) -> str:
+            return f"sum({query})"
+
+    return {
+        "cpu_p95_cores": peak(
+            f"quantile_over_time(0.95, rate(container_cpu_usage_seconds_total{{{usage_selector}}}[5m])"
+            f"[{metrics_window}:{metrics_resolution}])"
+        ),
+        "mem_p95_bytes": peak(
+            f"quantile_over_time(0.95, container_memory_working_set_bytes{{{usage_selector}}}"
+            f"[{metrics_window}:{metrics_resolution}])"
+        ),
+        "restarts": total(f"increase(kube_pod_container_status_restarts_total{{{plain_selector}}}[{metrics_window}])"),
+        "throttled_periods": total(
+            f"increase(container_cpu_cfs_throttled_periods_total{{{plain_selector}}}[{cpu_throttle_window}])"
+        ),
+        "cfs_periods": total(f"increase(container_cpu_cfs_periods_total{{{plain_selector}}}[{cpu_throttle_window}])"),
+    }
+
+
+class NamespaceUsage:
+    """Grouped per-(pod, container) usage samples for one namespace, joined to workloads locally.
+
+    Each pod is resolved to its owning workload once, so a container lookup is a dict hit.
+    """
+
+    def __init__(
+        self, vectors: dict[str, list[tuple[dict[str, str], float]] | None], namespace: str, owners: PodOwnerIndex
+    ) -> None:
+        self.namespace = namespace
+        self.owners = owners
+        self.by_field: dict[str, dict[tuple[str, str, str], list[float]]] = {}
+        for field, samples in vectors.items():
+            by_container: dict[tuple[str, str, str], list[float]] = {}
+            for labels, value in samples or []:
+                container = str(labels.get("container") or "")
+                owner = owners.owner(namespace, str(labels.get("pod") or "")) if container else None
+                if owner:
+                    by_container.setdefault((*owner, container), []).append(value)
+            self.by_field[field] = by_container
+
+    def for_container(self, owner: tuple[str, str], container_name: str) -> dict[str, float | None]:
+        usage: dict[str, float | None] = {}
+        for field, by_container in self.by_field.items():
+            values = by_container.get((*owner, container_name))
+            if not values:
+                usage[field] = None
+            elif field in USAGE_MAX_FIELDS:
+                usage[field] = max(values)
+            else:
+                usage[field] = sum(values)
+        return usage
+
+
+def worst_summary(summaries: list[dict[str, float]]) -> dict[str, float]:
+    """Combine per-pod window statistics into the worst pod's value for each statistic."""
+
+    return {name: max(summary[name] for summary in summaries) for name in USAGE_SUMMARY_STATS}
+
+
+def usage_history_expressions(
+    namespace: str, pod_regex: str | None = None, container_name: str | None = None
+) -> dict[str, str]:
+    """Return the per-(pod, container) series whose resolution-aligned samples feed the p95 fields."""
+
+    usage_selector, _plain_selector = usage_selectors(namespace, pod_regex, container_name)
+    return {
+        "cpu_p95_cores": (
+            f"max by (namespace, pod, container) (rate(container_cpu_usage_seconds_total{{{usage_selector}}}[5m]))"
+        ),
+        "mem_p95_bytes": f"max by (namespace, pod, container) (container_memory_working_set_bytes{{{usage_selector}}})",
+    }
+
+
+class QuantileSketch:
+    """DDSketch-style mergeable quantile sketch with bounded relative error.
+
+    Positive values land in logarithmic bins, so every quantile is returned within
+    RELATIVE_ACCURACY of a real sample; zeros (idle CPU) are counted separately. Past MAX_BINS
+    the lowest bins are folded together, which bounds a sketch to a few KB while keeping the
+    upper quantiles the advisor sizes from accurate.
+    """
+
+    RELATIVE_ACCURACY = 0.01
+    MAX_BINS = 512
+    MIN_VALUE = 1e-9
+
+    def __init__(self) -> None:
+        self.gamma = (1.0 + self.RELATIVE_ACCURACY) / (1.0 - self.RELATIVE_ACCURACY)
+        self.log_gamma = math.log(self.gamma)
+        self.bins: dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float, count: int = 1) -> None:
+        if value <= self.MIN_VALUE:
+            self.zero_count += count
+        else:
+            index = math.ceil(math.log(value) / self.log_gamma)
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.count += count
+        self.total += value * count
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.collapse()
+
+    def extend(self, values: array.array) -> None:
+        """Add a batch of samples, binned with NumPy when importable."""
+
+        if not values:
+            return
+        if numpy is None:
+            for value in values:
+                self.add(value)
+            return
+        data = numpy.frombuffer(values, dtype=numpy.float64)
+        positive = data[data > self.MIN_VALUE]
+        indexes, counts = numpy.unique(numpy.ceil(numpy.log(positive) / self.log_gamma), return_counts=True)
+        for index, count in zip(indexes.tolist(), counts.tolist()):
+            self.bins[int(index)] = self.bins.get(int(index), 0) + count
+        self.zero_count += len(data) - len(positive)
+        self.count += len(data)
+        self.total += float(data.sum())
+        self.min = min(self.min, float(data.min()))
+        self.max = max(self.max, float(data.max()))
+        self.collapse()
+
+    def merge(self, other: "QuantileSketch") -> None:
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.collapse()
+
+    def collapse(self) -> None:
+        if len(self.bins) <= self.MAX_BINS:
+            return
+        indexes = sorted(self.bins)
+        keep_from = indexes[len(indexes) - self.MAX_BINS]
+        for index in indexes[: len(indexes) - self.MAX_BINS]:
+            self.bins[keep_from] += self.bins.pop(index)
+
+    def value_at_rank(self, rank: int, indexes: list[int]) -> float:
+        seen = self.zero_count
+        if rank < seen:
+            return clamp(0.0, self.min, self.max)
+        for index in indexes:
+            seen += self.bins[index]
+            if rank < seen:
+                return clamp(2.0 * self.gamma**index / (self.gamma + 1.0), self.min, self.max)
+        return self.max
+
+    def quantile(self, q: float) -> float | None:
+        """Quantile with PromQL's interpolation between neighbouring ranks."""
+
+        if self.count <= 0:
+            return None
+        indexes = sorted(self.bins)
+        rank = q * (self.count - 1)
+        lower = max(0, math.floor(rank))
+        upper = min(self.count - 1, lower + 1)
+        weight = rank - math.floor(rank)
+        return self.value_at_rank(lower, indexes) * (1.0 - weight) + self.value_at_rank(upper, indexes) * weight
+
+    def summary(self) -> dict[str, float]:
+        stats = {name: self.quantile(q) for name, q in USAGE_SUMMARY_QUANTILES}
+        stats["mean"] = self.total / self.count
+        return stats
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "zero_count": self.zero_count,
+            "min": self.min,
+            "max": self.max,
+            "bins": [[index, self.bins[index]] for index in sorted(self.bins)],
+        }
+
+    @classmethod
+    def from_dict(cls, payload: dict) -> "QuantileSketch":
+        sketch = cls()
+        sketch.count = int(payload.get("count", 0))
+        sketch.zero_count = int(payload.get("zero_count", 0))
+        sketch.total = float(payload.get("sum", 0.0))
+        sketch.min = float(payload.get("min", math.inf))
+        sketch.max = float(payload.get("max", -math.inf))
+        sketch.bins = {int(index): int(count) for index, count in payload.get("bins", [])}
+        return sketch
+
+
+class UsageHistoryCache:
+    """Resolution-aligned usage history kept on disk between runs.
+
+    Each (namespace, pod selector, container, field) scope is one JSON file. Buckets of the
+    current UTC day hold the raw per-(pod, container) samples Prometheus evaluated at each
+    step; once a day has settled its buckets are folded into one QuantileSketch per series.
+    A run therefore range-queries only the buckets it has not seen and derives the window's
+    quantiles by merging daily sketches locally. Days leave a file once they no longer
+    overlap the metrics window, so the oldest day is kept whole; whole files are dropped
+    oldest first when the directory grows past max_bytes.
+    """
+
+    VERSION = 3
+    DAY_SECONDS = 86400
+
+    def __init__(
+        self,
+        directory: Path,
+        window_seconds: int,
+        step_seconds: int,
+        max_bytes: int,
+        now: float | None = None,
+    ) -> None:
+        self.directory = directory
+        self.window_seconds = window_seconds
+        self.step_seconds = step_seconds
+        self.max_bytes = max(0, max_bytes)
+        self.now = time.time() if now is None else now
+        window_buckets = aligned_steps(self.now, window_seconds, step_seconds)
+        self.first_bucket = window_buckets[0]
+        self.last_bucket = window_buckets[-1]
+        self.settled_until = self.now - USAGE_CACHE_SETTLE_SECONDS
+        self.lock = threading.Lock()
+        self.counters = {"buckets_reused": 0, "buckets_fetched": 0, "range_queries": 0, "range_failures": 0}
+        self.summaries: dict[str, dict[tuple[str, str, str], dict[str, float]]] = {}
+
+    def stats(self) -> dict[str, int]:
+        with self.lock:
+            return dict(self.counters)
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self.lock:
+            self.counters[name] += amount
+
+    def buckets(self) -> range:
+        return range(self.first_bucket, self.last_bucket + self.step_seconds, self.step_seconds)
+
+    def day_of(self, bucket: int) -> int:
+        return bucket - bucket % self.DAY_SECONDS
+
+    def day_settled(self, day: int) -> bool:
+        last_bucket_of_day = ((day + self.DAY_SECONDS - 1) // self.step_seconds) * self.step_seconds
+        return last_bucket_of_day <= self.settled_until
+
+    def path_for(self, namespace: str, pod_selector: str, container: str, field: str) -> Path:
+        digest = hashlib.sha256("\0".join((namespace, pod_selector, container, field)).encode("utf-8"))
+        return self.directory / f"{digest.hexdigest()[:32]}.json"
+
+    def load(
+        self, path: Path, expression: str
+    ) -> tuple[dict[int, dict[tuple[str, str], QuantileSketch]], dict[int, list]]:
+        try:
+            payload = json.loads(path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return {}, {}
+        except (OSError, ValueError) as exc:
+            log(f"Ignoring unreadable usage cache file {path.name}: {exc}")
+            return {}, {}
+        if (
+            payload.get("version") != self.VERSION
+            or payload.get("step_seconds") != self.step_seconds
+            or payload.get("expression") != expression
+        ):
+            return {}, {}
+        days = {
+            int(day): {(pod, container): QuantileSketch.from_dict(sketch) for pod, container, sketch in series}
+            for day, series in (payload.get("days", {}) or {}).items()
+            if int(day) + self.DAY_SECONDS > self.first_bucket
+        }
+        buckets = {
+            int(bucket): samples
+            for bucket, samples in (payload.get("buckets", {}) or {}).items()
+            if self.first_bucket <= int(bucket) <= self.last_bucket and self.day_of(int(bucket)) not in days
+        }
+        return days, buckets
+
+    def save(
+        self,
+        path: Path,
+        scope: dict[str, str],
+        expression: str,
+        days: dict[int, dict[tuple[str, str], QuantileSketch]],
+        buckets: dict[int, list],
+    ) -> None:
+        payload = {
+            "version": self.VERSION,
+            "step_seconds": self.step_seconds,
+            "expression": expression,
+            **scope,
+            "days": {
+                str(day): [[pod, container, sketch.to_dict()] for (pod, container), sketch in sorted(days[day].items())]
+                for day in sorted(days)
+            },
+            "buckets": {str(bucket): buckets[bucket] for bucket in sorted(buckets)},
+        }
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        tmp_path.write_text(json.dumps(payload, separators=(",", ":")), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+    def usage_vector(
+        self,
+        prom: PromClient,
+        namespace: str,
+        pod_selector: str,
+        container: str,
+        field: str,
+        expression: str,
+        step_seconds: int | None = None,
+    ) -> list[tuple[dict[str, str], float]] | None:
+        """Return per-(pod, container) p95 samples over the window, fetching only uncached buckets.
+
+        Each contiguous run of missing buckets is one range query. If any of them fails the field is
+        missing (None), as in range mode, rather than a p95 over partial history; the runs that did
+        succeed are still cached. A step_seconds coarser than the cache's (the resolution governor
+        stepping down) fetches the missing buckets at that step for this run only: coarse samples are
+        never stored, so the cache keeps one resolution and warms up over later runs.
+        """
+
+        path = self.path_for(namespace, pod_selector, container, field)
+        days, history = self.load(path, expression)
+        missing = [bucket for bucket in self.buckets() if bucket not in history and self.day_of(bucket) not in days]
+        self.count("buckets_reused", len(self.buckets()) - len(missing))
+
+        fetch_step = max(self.step_seconds, step_seconds or self.step_seconds)
+        fetched: dict[int, list] = {}
+        complete = True
+        for run in contiguous_runs(missing, self.step_seconds):
+            self.count("range_queries")
+            series = prom.query_range(expression, run[0], run[-1], fetch_step)
+            if series is None:
+                self.count("range_failures")
+                complete = False
+                continue
+            run_buckets: dict[int, list] = {bucket: [] for bucket in range(run[0], run[-1] + 1, fetch_step)}
+            for labels, points in series:
+                pod = str(labels.get("pod") or "")
+                container_name = str(labels.get("container") or "")
+                if not pod or not container_name:
+                    continue
+                for timestamp, value in points:
+                    bucket = int(round(timestamp))
+                    if bucket in run_buckets and math.isfinite(value):
+                        run_buckets[bucket].append([pod, container_name, value])
+            self.count("buckets_fetched", len(run_buckets))
+            fetched.update(run_buckets)
+        transient: dict[int, list] = {}
+        if fetch_step == self.step_seconds:
+            history.update(fetched)
+        else:
+            transient, fetched = fetched, {}
+
+        # Fold every settled day into per-series sketches; only the open day keeps raw buckets. A coarse
+        # run leaves gaps in history, so nothing is folded until a run fills them at the cache's step.
+        compacted = False
+        if complete and not transient:
+            for day in sorted({self.day_of(bucket) for bucket in history}):
+                if day in days or not self.day_settled(day):
+                    continue
+                sketches: dict[tuple[str, str], QuantileSketch] = {}
+                for bucket in [bucket for bucket in history if self.day_of(bucket) == day]:
+                    for pod, container_name, value in history.pop(bucket):
+                        sketches.setdefault((pod, container_name), QuantileSketch()).add(value)
+                days[day] = sketches
+                compacted = True
+
+        if fetched or compacted:
+            settled = {bucket: samples for bucket, samples in history.items() if bucket <= self.settled_until}
+            scope = {"namespace": namespace, "pod_selector": pod_selector, "container": container, "field": field}
+            try:
+                self.save(path, scope, expression, days, settled)
+            except OSError as exc:
+                log(f"Failed to write usage cache file {path.name}: {exc}")
+
+        if not complete:
+            return None
+        merged: dict[tuple[str, str], QuantileSketch] = {}
+        for sketches in days.values():
+            for key, sketch in sketches.items():
+                merged.setdefault(key, QuantileSketch()).merge(sketch)
+        for samples in (*history.values(), *transient.values()):
+            for pod, container_name, value in samples:
+                merged.setdefault((pod, container_name), QuantileSketch()).add(value)
+
+        summaries = {key: sketch.summary() for key, sketch in sorted(merged.items()) if sketch.count}
+        with self.lock:
+            by_series = self.summaries.setdefault(field, {})
+            for (pod, container_name), summary in summaries.items():
+                by_series[(namespace, pod, container_name)] = summary
+        return [
+            ({"namespace": namespace, "pod": pod, "container": container_name}, summary["p95"])
+            for (pod, container_name), summary in summaries.items()
+        ]
+
+    def usage_scalar(
+        self,
+        prom: PromClient,
+        namespace: str,
+        pod_selector: str,
+        container: str,
+        field: str,
+        expression: str,
+        step_seconds: int | None = None,
+    ) -> float | None:
+        samples = self.usage_vector(prom, namespace, pod_selector, container, field, expression, step_seconds)
+        if not samples:
+            return None
+        return max(value for _labels, value in samples)
+
+    def summary(self, field: str, namespace: str, pod_regex: str, container_name: str) -> dict[str, float] | None:
+        """Return the worst pod's window quantiles for one workload container, or None without history."""
+
+        pod_re = re.compile(pod_regex)
+        with self.lock:
+            matches = [
+                summary
+                for (series_namespace, pod, series_container), summary in self.summaries.get(field, {}).items()
+                if series_namespace == namespace and series_container == container_name and pod_re.fullmatch(pod)
+            ]
+        if not matches:
+            return None
+        return worst_summary(matches)
+
+    def evict(self) -> int:
+        """Drop files untouched for a whole window, then the oldest files beyond max_bytes."""
+
+        if not self.directory.is_dir():
+            return 0
+        entries = []
+        for path in self.directory.iterdir():
+            if path.suffix not in (".json", ".tmp"):
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        removed = 0
+        total_bytes = 0
+        for mtime, size, path in sorted(entries, key=lambda entry: entry[0], reverse=True):
+            stale = path.suffix == ".tmp" or mtime < self.now - self.window_seconds
+            if not stale and total_bytes + size <= self.max_bytes:
+                total_bytes += size
+                continue
+            try:
+                path.unlink()
+                removed += 1
+            except OSError as exc:
+                log(f"Failed to evict usage cache file {path.name}: {exc}")
+        return removed
+
+
+def contiguous_runs(buckets: list[int], step_seconds: int) -> list[list[int]]:
+    """Split ascending step-aligned buckets into runs without gaps, one range query each."""
+
+    runs: list[list[int]] = []
+    for bucket in buckets:
+        if runs and bucket - runs[-1][-1] == step_seconds:
+            runs[-1].append(bucket)
+        else:
+            runs.append([bucket])
+    return runs
+
+
+def open_usage_history(metrics_window: str, metrics_resolution: str) -> UsageHistoryCache | None:
+    directory = os.getenv("USAGE_CACHE_DIR", "").strip()
+    if not directory:
+        return None
+    window_seconds = parse_duration_seconds(metrics_window)
+    step_seconds = parse_duration_seconds(metrics_resolution)
+    if not window_seconds or not step_seconds:
+        log(f"Usage cache disabled: cannot align to window={metrics_window!r} resolution={metrics_resolution!r}")
+        return None
+    return UsageHistoryCache(
+        Path(directory),
+        window_seconds,
+        step_seconds,
+        max(1, env_int("USAGE_CACHE_MAX_MB", 64)) * 1024 * 1024,
+    )
+
+
+def submit_container_usage(
+    executor: PromQueryExecutor,
+    prom: PromClient,
+    namespace: str,
+    pod_regex: str,
+    container_name: str,
+    metrics_window: str,
+    metrics_resolution: str,
+    cpu_throttle_window: str,
+    history: UsageHistoryCache | None = None,
+    governor: ResolutionGovernor | None = None,
+    resolutions: dict[str, str] | None = None,
+) -> dict[str, Future]:
+    def queries_at(resolution: str) -> dict[str, str]:
+        return usage_queries(
+            namespace,
+            metrics_window,
+            resolution,
+            cpu_throttle_window,
+            pod_regex=pod_regex,
+            container_name=container_name,
+        )
+
+    queries = queries_at(metrics_resolution)
+    history_expressions = usage_history_expressions(namespace, pod_regex, container_name) if history else {}
+    futures = {}
+    for field, query in queries.items():
+        if history and field in history_expressions:
+            fetch = functools.partial(
+                history.usage_scalar, prom, namespace, pod_regex, container_name, field, history_expressions[field]
+            )
+            if governor is not None:
+                chosen = resolutions if resolutions is not None else {}
+                futures[field] = governor.submit(executor, fetch, parse_duration_seconds, chosen, field)
+            else:
+                futures[field] = executor.submit(fetch)
+        elif governor is not None and field in USAGE_MAX_FIELDS:
+            futures[field] = governor.submit(
+                executor,
+                prom.query_scalar,
+                lambda resolution, field=field: queries_at(resolution)[field],
+                resolutions if resolutions is not None else {},
+                field,
+            )
+        else:
+            futures[field] = executor.submit(prom.query_scalar, query)
+    return futures
+
+
+def submit_namespace_usage(
+    executor: PromQueryExecutor,
+    prom: PromClient,
+    namespace: str,
+    metrics_window: str,
+    metrics_resolution: str,
+    cpu_throttle_window: str,
+    history: UsageHistoryCache | None = None,
+    governor: ResolutionGovernor | None = None,
+    resolutions: dict[str, str] | None = None,
+) -> dict[str, Future]:
+    def queries_at(resolution: str) -> dict[str, str]:
+        return usage_queries(namespace, metrics_window, resolution, cpu_throttle_window)
+
+    queries = queries_at(metrics_resolution)
+    history_expressions = usage_history_expressions(namespace) if history else {}
+    futures = {}
+    for field, query in queries.items():
+        if history and field in history_expressions:
+            fetch = functools.partial(history.usage_vector, prom, namespace, "", "", field, history_expressions[field])
+            if governor is not None:
+                chosen = resolutions if resolutions is not None else {}
+                futures[field] = governor.submit(executor, fetch, parse_duration_seconds, chosen, field)
+            else:
+                futures[field] = executor.submit(fetch)
+        elif governor is not None and field in USAGE_MAX_FIELDS:
+            futures[field] = governor.submit(
+                executor,
+                prom.query_vector,
+                lambda resolution, field=field: queries_at(resolution)[field],
+                resolutions if resolutions is not None else {},
+                field,
+            )
+        else:
+            futures[field] = executor.submit(prom.query_vector, query)
+    return futures
+
+
+def range_usage_expressions(namespace: str, step_seconds: int) -> dict[str, str]:
+    """Return per-(pod, container) range-query expressions for every usage field.
+
+    Counter fields are per-step increases, so summing the steps of a window gives the
+    increase over that window.
+    """
+
+    _usage_selector, plain_selector = usage_selectors(namespace)
+
+    def per_step_increase(metric: str) -> str:
+        return f"sum by (namespace, pod, container) (increase({metric}{{{plain_selector}}}[{step_seconds}s]))"
+
+    return {
+        **usage_history_expressions(namespace),
+        "restarts": per_step_increase("kube_pod_container_status_restarts_total"),
+        "throttled_periods": per_step_increase("container_cpu_cfs_throttled_periods_total"),
+        "cfs_periods": per_step_increase("container_cpu_cfs_periods_total"),
+    }
+
+
+def fetch_range_series(
+    prom: PromClient, query: str, start: int, end: int, step: int
+) -> dict[tuple[str, str], tuple[array.array, array.array]] | None:
+    """Range-query one chunk and pack each (pod, container) series into float arrays."""
+
+    series = prom.query_range(query, start, end, step)
+    if series is None:
+        return None
+    packed: dict[tuple[str, str], tuple[array.array, array.array]] = {}
+    for labels, points in series:
+        pod = str(labels.get("pod") or "")
+        container = str(labels.get("container") or "")
+        if not pod or not container:
+            continue
+        timestamps, values = packed.setdefault((pod, container), (array.array("d"), array.array("d")))
+        for timestamp, value in points:
+            if math.isfinite(value):
+                timestamps.append(timestamp)
+                values.append(value)
+    return packed
+
+
+def windowed_sum(timestamps: array.array, values: array.array, since: float) -> float:
+    if numpy is not None:
+        data = numpy.frombuffer(values, dtype=numpy.float64)
+        return float(data[numpy.frombuffer(timestamps, dtype=numpy.float64) > since].sum())
+    return math.fsum(value for timestamp, value in zip(timestamps, values) if timestamp > since)
+
+
+class RangeFieldReducer:
+    """Fold one field's range-query chunks into per-series state as each chunk completes.
+
+    Max fields merge every chunk into a QuantileSketch per (pod, container); counter fields keep
+    a running sum of the per-step increases after `since`. A chunk's arrays are released as soon
+    as it is folded, so memory holds the sketches plus the chunks in flight on the query pool
+    rather than the whole window.
+    """
+
+    def __init__(self, field: str, since: float) -> None:
+        self.field = field
+        self.since = since
+        self.lock = threading.Lock()
+        self.failed = False
+        self.sketches: dict[tuple[str, str], QuantileSketch] = {}
+        self.sums: dict[tuple[str, str], float] = {}
+
+    def fetch(self, prom: PromClient, query: str, start: int, end: int, step: int) -> "RangeFieldReducer":
+        self.fold(fetch_range_series(prom, query, start, end, step))
+        return self
+
+    def fold(self, chunk: dict[tuple[str, str], tuple[array.array, array.array]] | None) -> None:
+        if chunk is None:
+            with self.lock:
+                self.failed = True
+            return
+        # Reduce outside the lock so chunks of the same field fold concurrently; only the merge is serialized.
+        partial: dict[tuple[str, str], Any] = {}
+        while chunk:
+            series_key, (timestamps, values) = chunk.popitem()
+            if not values:
+                continue
+            if self.field in USAGE_MAX_FIELDS:
+                partial[series_key] = QuantileSketch()
+                partial[series_key].extend(values)
+            else:
+                partial[series_key] = windowed_sum(timestamps, values, self.since)
+        with self.lock:
+            for series_key, reduced in partial.items():
+                if self.field not in USAGE_MAX_FIELDS:
+                    self.sums[series_key] = self.sums.get(series_key, 0.0) + reduced
+                elif series_key in self.sketches:
+                    self.sketches[series_key].merge(reduced)
+                else:
+                    self.sketches[series_key] = reduced
+
+
+class NamespaceRangeUsage(NamespaceUsage):
+    """Namespace usage from range-query chunks already folded by RangeFieldReducer.
+
+    Max fields keep per-series window statistics from the merged sketches for the report;
+    counter fields use the summed per-step increases. A field with any failed chunk is treated
+    as missing rather than computed from partial data.
+    """
+
+    def __init__(self, results: dict[str, Any], namespace: str, owners: PodOwnerIndex) -> None:
+        vectors: dict[str, list[tuple[dict[str, str], float]] | None] = {}
+        reducers: dict[str, RangeFieldReducer] = {}
+        for key, result in results.items():
+            field, chunked, _chunk_start = key.partition("@")
+            if chunked:
+                # Every chunk of a field resolves to the same reducer.
+                reducers[field] = result
+            else:
+                # Already reduced elsewhere (the usage cache), one value per (pod, container).
+                vectors[field] = result
+
+        self.summaries: dict[str, dict[tuple[str, str, str], list[dict[str, float]]]] = {}
+        for field, reducer in reducers.items():
+            if reducer.failed:
+                vectors[field] = None
+                continue
+            samples: list[tuple[dict[str, str], float]] = []
+            if field in USAGE_MAX_FIELDS:
+                for (pod, container), sketch in sorted(reducer.sketches.items()):
+                    summary = sketch.summary()
+                    owner = owners.owner(namespace, pod)
+                    if owner:
+                        self.summaries.setdefault(field, {}).setdefault((*owner, container), []).append(summary)
+                    samples.append(({"pod": pod, "container": container}, summary["p95"]))
+            else:
+                for (pod, container), total in sorted(reducer.sums.items()):
+                    samples.append(({"pod": pod, "container": container}, total))
+            vectors[field] = samples
+        super().__init__(vectors, namespace, owners)
+
+    def summary(self, field: str, owner: tuple[str, str], container_name: str) -> dict[str, float] | None:
+        matches = self.summaries.get(field, {}).get((*owner, container_name))
+        if not matches:
+            return None
+        return worst_summary(matches)
+
+
+RANGE_THROTTLE_FIELDS = ("throttled_periods", "cfs_periods")
+
+
+def submit_namespace_range_usage(
+    executor: PromQueryExecutor,
+    prom: PromClient,
+    namespace: str,
+    steps: range,
+    chunk_steps: int,
+    metrics_since: float,
+    throttle_since: float,
+    history: UsageHistoryCache | None = None,
+) -> dict[str, Future]:
+    """Queue one range query per field and time chunk; chunks bound each response's size.
+
+    Each chunk is folded into its field's RangeFieldReducer on the worker that fetched it, and
+    every chunk future resolves to that shared reducer.
+    """
+
+    history_expressions = usage_history_expressions(namespace) if history else {}
+    futures = {}
+    for field, expression in range_usage_expressions(namespace, steps.step).items():
+        if history and field in history_expressions:
+            futures[field] = executor.submit(
+                history.usage_vector, prom, namespace, "", "", field, history_expressions[field]
+            )
+            continue
+        reducer = RangeFieldReducer(field, throttle_since if field in RANGE_THROTTLE_FIELDS else metrics_since)
+        for offset in range(0, len(steps), max(1, chunk_steps)):
+            chunk = steps[offset : offset + max(1, chunk_steps)]
+            futures[f"{field}@{chunk[0]}"] = executor.submit(
+                reducer.fetch, prom, expression, chunk[0], chunk[-1], steps.step
+            )
+    return futures
+
+
+RECORDING_RULES_NAME = "resource-advisor-recording"
+RECORDED_SERIES = {
+    "cpu_p95_cores": "resource_advisor:workload_container_cpu_usage_cores:rate5m",
+    "mem_p95_bytes": "resource_advisor:workload_container_memory_working_set_bytes:max",
+    "restarts": "resource_advisor:workload_container_restarts:increase1h",
+    "throttled_periods": "resource_advisor:workload_container_cpu_cfs_throttled_periods:increase1h",
+    "cfs_periods": "resource_advisor:workload_container_cpu_cfs_periods:increase1h",
+}
+RECORDED_THROTTLE_RATIO = "resource_advisor:workload_container_cpu_cfs_throttled:ratio1h"
+# Per-series age of the recorded CPU series, queried next to the usage fields but not one of them.
+RECORDED_COVERAGE_KEY = "recorded_seconds"
+
+
+def recording_rule_exprs(namespace: str, workload: str, kind: str) -> dict[str, str]:
+    """Per-(namespace, container) expressions for one workload's recording rules; the rule adds kind and workload."""
+
+    plain_selector = f'namespace="{namespace}",pod=~"{pod_regex_for_workload(workload, kind)}",container!=""'
+    usage_selector = f'{plain_selector},image!=""'
+
+    def hourly_increase(metric: str) -> str:
+        return f"sum by (namespace, container) (increase({metric}{{{plain_selector}}}[1h]))"
+
+    return {
+        "cpu_p95_cores": (
+            f"max by (namespace, container) (rate(container_cpu_usage_seconds_total{{{usage_selector}}}[5m]))"
+        ),
+        "mem_p95_bytes": f"max by (namespace, container) (container_memory_working_set_bytes{{{usage_selector}}})",
+        "restarts": hourly_increase("kube_pod_container_status_restarts_total"),
+        "throttled_periods": hourly_increase("container_cpu_cfs_throttled_periods_total"),
+        "cfs_periods": hourly_increase("container_cpu_cfs_periods_total"),
+    }
+
+
+def render_recording_rules(workloads: list[tuple[str, str, str]]) -> str:
+    """Render a PrometheusRule manifest recording the advisor's inputs per workload container.
+
+    Each workload gets one rule per input, selecting its pods with the same anchored regex the
+    advisor's raw queries use and stamping static kind and workload labels, so build_report can
+    read one pre-aggregated series per (namespace, kind, workload, container) instead of
+    re-evaluating rate() over every raw series for the whole window. The kind keeps a Deployment
+    and a StatefulSet of the same name apart.
+    """
+
+    schema = "https://raw.githubusercontent.com/yannh/kubernetes-json-schema/master/v1.32.0-standalone-strict/all.json"
+    lines = [
+        f"# yaml-language-server: $schema={schema}",
+        "# Generated by resource-advisor from the workloads it analyzes; regenerate rather than editing by hand.",
+        "---",
+        "apiVersion: monitoring.coreos.com/v1",
+        "kind: PrometheusRule",
+        "metadata:",
+        f"  name: {RECORDING_RULES_NAME}",
+        "  namespace: monitoring",
+        "  labels:",
+        "    release: kube-prometheus-stack",
+        "spec:",
+        "  groups:",
+        "    - name: resource-advisor.rules",
+        "      interval: 1m",
+        "      rules:",
+    ]
+    for namespace, kind, workload in sorted(set(workloads)):
+        for field, expr in recording_rule_exprs(namespace, workload, kind).items():
+            lines.extend(
+                [
+                    f"        - record: {RECORDED_SERIES[field]}",
+                    f"          expr: {json.dumps(expr)}",
+                    "          labels:",
+                    f"            kind: {json.dumps(kind)}",
+                    f"            workload: {json.dumps(workload)}",
+                ]
+            )
+    ratio_expr = (
+        f"{RECORDED_SERIES['throttled_periods']} / on (namespace, kind, workload, container) "
+        f"({RECORDED_SERIES['cfs_periods']} > 0)"
+    )
+    lines.extend(
+        [
+            f"        - record: {RECORDED_THROTTLE_RATIO}",
+            f"          expr: {json.dumps(ratio_expr)}",
+        ]
+    )
+    return "\n".join(lines) + "\n"
+
+
+WORKLOAD_KINDS = ("deployments", "statefulsets")
+
+
+def discover_workloads(kube: KubeClient, namespaces: list[str]) -> Iterator[tuple[str, str, list[dict]]]:
+    """Yield (namespace, kind, workloads) for every target namespace and kind, in that order.
+
+    All list calls are issued up front on KUBE_DISCOVERY_CONCURRENCY threads (default 4), so the
+    caller can start on the first namespace while later ones are still being listed, and the
+    wait is bounded by the slowest list rather than their sum.
+    """
+
+    pairs = [(namespace, kind) for namespace in namespaces for kind in WORKLOAD_KINDS]
+    if not pairs:
+        return
+    pool = ThreadPoolExecutor(
+        max_workers=max(1, min(env_int("KUBE_DISCOVERY_CONCURRENCY", 4), len(pairs))),
+        thread_name_prefix="kube-discovery",
+    )
+
+    def list_workloads(namespace: str, kind: str) -> list[dict]:
+        with RUN_STATS.stage("discovery"):
+            return kube.list_workloads(namespace, kind)
+
+    try:
+        futures = [(namespace, kind, pool.submit(list_workloads, namespace, kind)) for namespace, kind in pairs]
+        for namespace, kind, future in futures:
+            yield namespace, kind, future.result()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def recording_rules_cover_window(prom: PromClient, metrics_window: str, metrics_resolution: str) -> bool:
+    """True once some recorded series reaches back over the whole metrics window.
+
+    This only decides whether the recorded queries are worth running; RecordedUsage then checks each
+    workload container's own series, since rules for newly added workloads start later.
+    """
+
+    window_seconds = parse_duration_seconds(metrics_window)
+    step_seconds = parse_duration_seconds(metrics_resolution)
+    if not window_seconds or not step_seconds:
+        return False
+    age = prom.query_scalar(
+        f"time() - min_over_time(timestamp(count({RECORDED_SERIES['cpu_p95_cores']}))"
+        f"[{metrics_window}:{metrics_resolution}])"
+    )
+    return age is not None and age >= window_seconds - step_seconds
+
+
+def recorded_usage_queries(
+    namespace: str, metrics_window: str, metrics_resolution: str, cpu_throttle_window: str
+) -> dict[str, str]:
+    """Grouped per-(kind, workload, container) usage queries over the recorded series of one namespace."""
+
+    def series(field: str) -> str:
+        return f'{RECORDED_SERIES[field]}{{namespace="{namespace}"}}'
+
+    def peak(field: str) -> str:
+        return (
+            f"max by (namespace, kind, workload, container) "
+            f"(quantile_over_time({USAGE_QUANTILE}, {series(field)}[{metrics_window}:{metrics_resolution}]))"
+        )
+
+    def total(field: str, window: str) -> str:
+        # The recorded increases are per hour, so sample them hourly to add up the window.
+        return f"sum by (namespace, kind, workload, container) (sum_over_time({series(field)}[{window}:1h]))"
+
+    return {
+        RECORDED_COVERAGE_KEY: (
+            f"max by (namespace, kind, workload, container) (time() - min_over_time(timestamp("
+            f"{series('cpu_p95_cores')})[{metrics_window}:{metrics_resolution}]))"
+        ),
+        "cpu_p95_cores": peak("cpu_p95_cores"),
+        "mem_p95_bytes": peak("mem_p95_bytes"),
+        "restarts": total("restarts", metrics_window),
+        "throttled_periods": total("throttled_periods", cpu_throttle_window),
+        "cfs_periods": total("cfs_periods", cpu_throttle_window),
+    }
+
+
+def submit_recorded_usage(
+    executor: PromQueryExecutor,
+    prom: PromClient,
+    namespace: str,
+    metrics_window: str,
+    metrics_resolution: str,
+    cpu_throttle_window: str,
+    governor: ResolutionGovernor | None = None,
+    resolutions: dict[str, str] | None = None,
+) -> dict[str, Future]:
+    def queries_at(resolution: str) -> dict[str, str]:
+        return recorded_usage_queries(namespace, metrics_window, resolution, cpu_throttle_window)
+
+    futures = {}
+    for field, query in queries_at(metrics_resolution).items():
+        if governor is not None and field in USAGE_MAX_FIELDS:
+            futures[field] = governor.submit(
+                executor,
+                prom.query_vector,
+                lambda resolution, field=field: queries_at(resolution)[field],
+                resolutions if resolutions is not None else {},
+                field,
+            )
+        else:
+            futures[field] = executor.submit(prom.query_vector, query)
+    return futures
+
+
+class RecordedUsage:
+    """Recorded per-(kind, workload, container) usage for one namespace.
+
+    A container whose recorded series is younger than min_seconds (its rule was added partway through
+    the window) has no recorded usage, so it falls back to raw queries instead of a short-window p95.
+    """
+
+    def __init__(self, vectors: dict[str, list[tuple[dict[str, str], float]] | None], min_seconds: float) -> None:
+        self.min_seconds = min_seconds
+        self.by_field: dict[str, dict[tuple[str, str, str], float]] = {}
+        for field, samples in vectors.items():
+            self.by_field[field] = {
+                (
+                    str(labels.get("kind") or ""),
+                    str(labels.get("workload") or ""),
+                    str(labels.get("container") or ""),
+                ): value
+                for labels, value in samples or []
+            }
+
+    def for_container(self, owner: tuple[str, str], container_name: str) -> dict[str, float | None] | None:
+        """Usage for one (kind, workload) container, or None when it has no recorded usage series yet."""
+
+        key = (*owner, container_name)
+        recorded_seconds = self.by_field.get(RECORDED_COVERAGE_KEY, {}).get(key)
+        if recorded_seconds is None or recorded_seconds < self.min_seconds:
+            return None
+        if not any(key in self.by_field.get(field, {}) for field in USAGE_MAX_FIELDS):
+            return None
+        return {field: by_key.get(key) for field, by_key in self.by_field.items() if field != RECORDED_COVERAGE_KEY}
+
+
+def recommend(current: float, target: float, max_step_percent: float) -> float:
+    if current <= 0:
+        return target
+    step = max_step_percent / 100.0
+    low = current * (1.0 - step)
+    high = current * (1.0 + step)
+    return clamp(target, low, high)
+
+
+RECOMMENDATION_INPUTS = (
+    "release",
+    "degraded_resolution",
+    "cur_req_cpu",
+    "cur_req_mem",
+    "cur_lim_cpu",
+    "cur_lim_mem",
+    "cpu_p95_m",
+    "mem_p95_mi",
+    "restarts",
+    "cpu_throttled_periods",
+    "cpu_throttle_ratio",
+)
+RECOMMENDATION_NOTES = (
+    "degraded_resolution",
+    "cpu_throttle_guard",
+    "restart_guard",
+    "profile_burst_request_floor",
+    "request_floor_guard",
+    "profile_limit_downsize_guard",
+    "downscale_excluded",
+)
+RECOMMENDATION_RESULTS = (
+    "rec_req_cpu",
+    "rec_req_mem",
+    "rec_lim_cpu",
+    "rec_lim_mem",
+    "req_cpu_delta",
+    "req_mem_delta",
+    "lim_cpu_delta",
+    "lim_mem_delta",
+    "action",
+    "notes",
+)
+RECOMMENDATION_ACTIONS = (None, "no-change", "downsize", "upsize")
+
+
+def recommend_columns(
+    columns: dict[str, list], settings: dict[str, float], downscale_exclude: set[str]
+) -> dict[str, list]:
+    """Recommend requests and limits for every container in the parallel RECOMMENDATION_INPUTS columns.
+
+    Returns parallel columns of the recommended values, the four delta percentages, the action (None
+    when no delta clears the deadband) and the notes. NumPy evaluates each step over the whole batch when
+    it is installed; otherwise the rows go through the scalar helpers. Both give identical results.
+    """
+
+    if numpy is not None:
+        return recommend_columns_numpy(columns, settings, downscale_exclude)
+
+    max_step_percent = settings["max_step_percent"]
+    request_factor = 1.0 + settings["request_buffer_percent"] / 100.0
+    limit_factor = 1.0 + settings["limit_buffer_percent"] / 100.0
+    throttle_step = 1.0 + (max_step_percent / 100.0)
+    deadband_percent = settings["deadband_percent"]
+    deadband_cpu_m = settings["deadband_cpu_m"]
+    deadband_mem_mi = settings["deadband_mem_mi"]
+    results: dict[str, list] = {name: [] for name in RECOMMENDATION_RESULTS}
+
+    for (
+        release,
+        degraded_resolution,
+        cur_req_cpu,
+        cur_req_mem,
+        cur_lim_cpu,
+        cur_lim_mem,
+        cpu_p95_m,
+        mem_p95_mi,
+        restarts,
+        cpu_throttled_periods,
+        cpu_throttle_ratio,
+    ) in zip(*(columns[name] for name in RECOMMENDATION_INPUTS)):
+        target_req_cpu = max(settings["min_cpu_m"], cpu_p95_m * request_factor)
+        target_req_mem = max(settings["min_mem_mi"], mem_p95_mi * request_factor)
+        target_lim_cpu = max(target_req_cpu * 2.0, cpu_p95_m * limit_factor)
+        target_lim_mem = max(target_req_mem * 1.5, mem_p95_mi * limit_factor)
+
+        notes: list[str] = []
+        if degraded_resolution:
+            notes.append("degraded_resolution")
+        if (
+            cur_lim_cpu > 0.0
+            and cpu_throttle_ratio >= settings["cpu_throttle_ratio_upsize_threshold"]
+            and cpu_throttled_periods >= settings["cpu_throttle_min_periods"]
+        ):
+            target_lim_cpu = max(target_lim_cpu, cur_lim_cpu * throttle_step)
+            if cur_req_cpu > 0.0:
+                target_req_cpu = max(target_req_cpu, min(cur_lim_cpu, cur_req_cpu * throttle_step))
+            notes.append("cpu_throttle_guard")
+
+        rec_req_cpu = recommend(cur_req_cpu, target_req_cpu, max_step_percent)
+        rec_req_mem = recommend(cur_req_mem, target_req_mem, max_step_percent)
+        rec_lim_cpu = recommend(cur_lim_cpu, target_lim_cpu, max_step_percent)
+        rec_lim_mem = recommend(cur_lim_mem, target_lim_mem, max_step_percent)
+
+        if restarts > 0:
+            if rec_req_mem < cur_req_mem:
+                rec_req_mem = cur_req_mem
+            if rec_lim_mem < cur_lim_mem:
+                rec_lim_mem = cur_lim_mem
+            notes.append("restart_guard")
+
+        rec_req_cpu, rec_req_mem, rec_lim_cpu, rec_lim_mem = apply_service_tuning_policy(
+            release,
+            notes,
+            cur_req_cpu,
+            cur_req_mem,
+            cur_lim_cpu,
+            cur_lim_mem,
+            rec_req_cpu,
+            rec_req_mem,
+            rec_lim_cpu,
+            rec_lim_mem,
+        )
+
+        if release in downscale_exclude:
+            if rec_req_cpu < cur_req_cpu:
+                rec_req_cpu = cur_req_cpu
+            if rec_req_mem < cur_req_mem:
+                rec_req_mem = cur_req_mem
+            if rec_lim_cpu < cur_lim_cpu:
+                rec_lim_cpu = cur_lim_cpu
+            if rec_lim_mem < cur_lim_mem:
+                rec_lim_mem = cur_lim_mem
+            notes.append("downscale_excluded")
+
+        req_cpu_delta = pct_delta(cur_req_cpu, rec_req_cpu)
+        req_mem_delta = pct_delta(cur_req_mem, rec_req_mem)
+        lim_cpu_delta = pct_delta(cur_lim_cpu, rec_lim_cpu)
+        lim_mem_delta = pct_delta(cur_lim_mem, rec_lim_mem)
+
+        req_cpu_material = is_material_delta(
+            req_cpu_delta, rec_req_cpu - cur_req_cpu, deadband_percent, deadband_cpu_m
+        )
+        req_mem_material = is_material_delta(
+            req_mem_delta, rec_req_mem - cur_req_mem, deadband_percent, deadband_mem_mi
+        )
+        lim_cpu_material = is_material_delta(
+            lim_cpu_delta, rec_lim_cpu - cur_lim_cpu, deadband_percent, deadband_cpu_m
+        )
+        lim_mem_material = is_material_delta(
+            lim_mem_delta, rec_lim_mem - cur_lim_mem, deadband_percent, deadband_mem_mi
+        )
+
+        if not (req_cpu_material or req_mem_material or lim_cpu_material or lim_mem_material):
+            action = None
+        elif (
+            (rec_req_cpu > cur_req_cpu and req_cpu_material)
+            or (rec_req_mem > cur_req_mem and req_mem_material)
+            or (rec_lim_cpu > cur_lim_cpu and lim_cpu_material)
+            or (rec_lim_mem > cur_lim_mem and lim_mem_material)
+        ):
+            action = "upsize"
+        elif (rec_req_cpu < cur_req_cpu and req_cpu_material) or (rec_req_mem < cur_req_mem and req_mem_material):
+            action = "downsize"
+        else:
+            action = "no-change"
+
+        for name, value in zip(
+            RECOMMENDATION_RESULTS,
+            (
+                rec_req_cpu,
+                rec_req_mem,
+                rec_lim_cpu,
+                rec_lim_mem,
+                req_cpu_delta,
+                req_mem_delta,
+                lim_cpu_delta,
+                lim_mem_delta,
+                action,
+                notes,
+            ),
+        ):
+            results[name].append(value)
+    return results
+
+
+def recommend_columns_numpy(
+    columns: dict[str, list], settings: dict[str, float], downscale_exclude: set[str]
+) -> dict[str, list]:
+    """Vectorised recommend_columns; every step mirrors the scalar path so the floats come out bit-identical.
+
+    max() and min() keep their first argument unless the second compares strictly greater (or smaller),
+    so they are spelled as where() rather than numpy.maximum/minimum, which would propagate NaN samples.
+    """
+
+    def larger(first: Any, second: Any) -> Any:
+        return numpy.where(second > first, second, first)
+
+    def smaller(first: Any, second: Any) -> Any:
+        return numpy.where(second < first, second, first)
+
+    def column(name: str) -> Any:
+        return numpy.asarray(columns[name], dtype=numpy.float64)
+
+    def material(delta: Any, current: Any, recommended: Any, deadband_absolute: float) -> Any:
+        return (numpy.abs(delta) >= max(0.0, settings["deadband_percent"])) | (
+            numpy.abs(recommended - current) >= max(0.0, deadband_absolute)
+        )
+
+    def step_clamp(current: Any, target: Any) -> Any:
+        step = settings["max_step_percent"] / 100.0
+        clamped = larger(current * (1.0 - step), smaller(target, current * (1.0 + step)))
+        return numpy.where(current <= 0, target, clamped)
+
+    def delta_percent(old: Any, new: Any) -> Any:
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            return numpy.where(old <= 0, numpy.where(new > 0, 100.0, 0.0), ((new - old) / old) * 100.0)
+
+    def raise_to(recommended: Any, current: Any, mask: Any) -> tuple[Any, Any]:
+        hit = mask & (recommended < current)
+        return numpy.where(hit, current, recommended), hit
+
+    releases = columns["release"]
+    cur_req_cpu = column("cur_req_cpu")
+    cur_req_mem = column("cur_req_mem")
+    cur_lim_cpu = column("cur_lim_cpu")
+    cur_lim_mem = column("cur_lim_mem")
+    cpu_p95_m = column("cpu_p95_m")
+    mem_p95_mi = column("mem_p95_mi")
+
+    request_factor = 1.0 + settings["request_buffer_percent"] / 100.0
+    limit_factor = 1.0 + settings["limit_buffer_percent"] / 100.0
+    throttle_step = 1.0 + (settings["max_step_percent"] / 100.0)
+    target_req_cpu = larger(settings["min_cpu_m"], cpu_p95_m * request_factor)
+    target_req_mem = larger(settings["min_mem_mi"], mem_p95_mi * request_factor)
+    target_lim_cpu = larger(target_req_cpu * 2.0, cpu_p95_m * limit_factor)
+    target_lim_mem = larger(target_req_mem * 1.5, mem_p95_mi * limit_factor)
+
+    throttle_guard = (
+        (cur_lim_cpu > 0.0)
+        & (column("cpu_throttle_ratio") >= settings["cpu_throttle_ratio_upsize_threshold"])
+        & (column("cpu_throttled_periods") >= settings["cpu_throttle_min_periods"])
+    )
+    target_lim_cpu = numpy.where(throttle_guard, larger(target_lim_cpu, cur_lim_cpu * throttle_step), target_lim_cpu)
+    target_req_cpu = numpy.where(
+        throttle_guard & (cur_req_cpu > 0.0),
+        larger(target_req_cpu, smaller(cur_lim_cpu, cur_req_cpu * throttle_step)),
+        target_req_cpu,
+    )
+
+    rec_req_cpu = step_clamp(cur_req_cpu, target_req_cpu)
+    rec_req_mem = step_clamp(cur_req_mem, target_req_mem)
+    rec_lim_cpu = step_clamp(cur_lim_cpu, target_lim_cpu)
+    rec_lim_mem = step_clamp(cur_lim_mem, target_lim_mem)
+
+    restart_guard = column("restarts") > 0
+    rec_req_mem, _hit = raise_to(rec_req_mem, cur_req_mem, restart_guard)
+    rec_lim_mem, _hit = raise_to(rec_lim_mem, cur_lim_mem, restart_guard)
+
+    # Service tuning policies are per release, so they are resolved once per distinct release.
+    policies: dict[str, tuple[bool, float, float]] = {}
+    for release in set(releases):
+        policy = service_tuning_policy(release)
+        policies[release] = (
+            str(policy.get("profile") or "") == BURST_REQUEST_FLOOR_PROFILE,
+            max(0.0, policy_float(policy, "min_request_cpu_m", 0.0)),
+            max(0.0, policy_float(policy, "min_request_memory_mi", 0.0)),
+        )
+    burst_floor = numpy.array([policies[release][0] for release in releases], dtype=bool)
+    floor_cpu = numpy.array([policies[release][1] for release in releases], dtype=numpy.float64)
+    floor_mem = numpy.array([policies[release][2] for release in releases], dtype=numpy.float64)
+    floor_cpu_hit = burst_floor & (rec_req_cpu < cur_req_cpu) & (rec_req_cpu < floor_cpu)
+    floor_mem_hit = burst_floor & (rec_req_mem < cur_req_mem) & (rec_req_mem < floor_mem)
+    rec_req_cpu = numpy.where(floor_cpu_hit, smaller(cur_req_cpu, larger(rec_req_cpu, floor_cpu)), rec_req_cpu)
+    rec_req_mem = numpy.where(floor_mem_hit, smaller(cur_req_mem, larger(rec_req_mem, floor_mem)), rec_req_mem)
+    rec_lim_cpu, limit_cpu_hit = raise_to(rec_lim_cpu, cur_lim_cpu, burst_floor)
+    rec_lim_mem, limit_mem_hit = raise_to(rec_lim_mem, cur_lim_mem, burst_floor)
+
+    excluded = numpy.array([release in downscale_exclude for release in releases], dtype=bool)
+    rec_req_cpu, _hit = raise_to(rec_req_cpu, cur_req_cpu, excluded)
+    rec_req_mem, _hit = raise_to(rec_req_mem, cur_req_mem, excluded)
+    rec_lim_cpu, _hit = raise_to(rec_lim_cpu, cur_lim_cpu, excluded)
+    rec_lim_mem, _hit = raise_to(rec_lim_mem, cur_lim_mem, excluded)
+
+    req_cpu_delta = delta_percent(cur_req_cpu, rec_req_cpu)
+    req_mem_delta = delta_percent(cur_req_mem, rec_req_mem)
+    lim_cpu_delta = delta_percent(cur_lim_cpu, rec_lim_cpu)
+    lim_mem_delta = delta_percent(cur_lim_mem, rec_lim_mem)
+    req_cpu_material = material(req_cpu_delta, cur_req_cpu, rec_req_cpu, settings["deadband_cpu_m"])
+    req_mem_material = material(req_mem_delta, cur_req_mem, rec_req_mem, settings["deadband_mem_mi"])
+    lim_cpu_material = material(lim_cpu_delta, cur_lim_cpu, rec_lim_cpu, settings["deadband_cpu_m"])
+    lim_mem_material = material(lim_mem_delta, cur_lim_mem, rec_lim_mem, settings["deadband_mem_mi"])
+
+    upsize = (
+        ((rec_req_cpu > cur_req_cpu) & req_cpu_material)
+        | ((rec_req_mem > cur_req_mem) & req_mem_material)
+        | ((rec_lim_cpu > cur_lim_cpu) & lim_cpu_material)
+        | ((rec_lim_mem > cur_lim_mem) & lim_mem_material)
+    )
+    downsize = ((rec_req_cpu < cur_req_cpu) & req_cpu_material) | ((rec_req_mem < cur_req_mem) & req_mem_material)
+    significant = req_cpu_material | req_mem_material | lim_cpu_material | lim_mem_material
+    # Indexes into RECOMMENDATION_ACTIONS: 0 is below the deadband, then no-change, downsize, upsize.
+    action_codes = numpy.where(significant, numpy.where(upsize, 3, numpy.where(downsize, 2, 1)), 0)
+
+    note_flags = (
+        numpy.asarray(columns["degraded_resolution"], dtype=bool),
+        throttle_guard,
+        restart_guard,
+        burst_floor,
+        floor_cpu_hit | floor_mem_hit,
+        limit_cpu_hit | limit_mem_hit,
+        excluded,
+    )
+    return {
+        "rec_req_cpu": rec_req_cpu.tolist(),
+        "rec_req_mem": rec_req_mem.tolist(),
+        "rec_lim_cpu": rec_lim_cpu.tolist(),
+        "rec_lim_mem": rec_lim_mem.tolist(),
+        "req_cpu_delta": req_cpu_delta.tolist(),
+        "req_mem_delta": req_mem_delta.tolist(),
+        "lim_cpu_delta": lim_cpu_delta.tolist(),
+        "lim_mem_delta": lim_mem_delta.tolist(),
+        "action": [RECOMMENDATION_ACTIONS[code] for code in action_codes.tolist()],
+        "notes": [
+            [note for note, flag in zip(RECOMMENDATION_NOTES, flags) if flag]
+            for flags in zip(*(flag.tolist() for flag in note_flags))
+        ],
+    }
+
+
+def pod_effective_requests(pod: dict) -> tuple[float, float]:
+    """Return the pod's effective CPU(m) and memory(Mi) requests.
+
+    Scheduler semantics: sum(containers) vs max(initContainers), per resource.
+    """
+
+    spec = pod.get("spec", {}) or {}
+
+    def sum_requests(containers: list[dict] | None) -> tuple[float, float]:
+        cpu_m = 0.0
+        mem_mi = 0.0
+        for c in containers or []:
+            req = (c.get("resources", {}) or {}).get("requests", {}) or {}
+            cpu_m += parse_cpu_to_m(req.get("cpu"))
+            mem_mi += parse_mem_to_mi(req.get("memory"))
+        return cpu_m, mem_mi
+
+    def max_requests(containers: list[dict] | None) -> tuple[float, float]:
+        cpu_m = 0.0
+        mem_mi = 0.0
+        for c in containers or []:
+            req = (c.get("resources", {}) or {}).get("requests", {}) or {}
+            cpu_m = max(cpu_m, parse_cpu_to_m(req.get("cpu")))
+            mem_mi = max(mem_mi, parse_mem_to_mi(req.get("memory")))
+        return cpu_m, mem_mi
+
+    cont_cpu_m, cont_mem_mi = sum_requests(spec.get("containers"))
+    init_cpu_m, init_mem_mi = max_requests(spec.get("initContainers"))
+    return max(cont_cpu_m, init_cpu_m), max(cont_mem_mi, init_mem_mi)
+
+
+def pod_has_container_name(pod: dict, container_name: str) -> bool:
+    spec = pod.get("spec", {}) or {}
+    for c in spec.get("containers", []) or []:
+        if c.get("name") == container_name:
+            return True
+    return False
+
+
+NODE_FIT_PLACEMENT_MODES = ("current", "scheduler")
+SCHEDULER_SCORING_STRATEGIES = ("LeastAllocated", "MostAllocated")
+# kube-scheduler scores pods without requests as if they asked for this much (NonZeroRequested).
+SCHEDULER_DEFAULT_CPU_M = 100.0
+SCHEDULER_DEFAULT_MEM_MI = 200.0
+
+
+def toleration_matches(toleration: dict, taint: dict) -> bool:
+    effect = toleration.get("effect") or ""
+    if effect and effect != taint.get("effect"):
+        return False
+    key = toleration.get("key") or ""
+    if (toleration.get("operator") or "Equal") == "Exists":
+        return not key or key == taint.get("key")
+    return key == taint.get("key") and (toleration.get("value") or "") == (taint.get("value") or "")
+
+
+def node_selector_requirement_matches(requirement: dict, values: dict[str, str]) -> bool:
+    key = requirement.get("key") or ""
+    operator = requirement.get("operator") or ""
+    wanted = [str(value) for value in requirement.get("values") or []]
+    if operator == "In":
+        return key in values and values[key] in wanted
+    if operator == "NotIn":
+        return key not in values or values[key] not in wanted
+    if operator == "Exists":
+        return key in values
+    if operator == "DoesNotExist":
+        return key not in values
+    if operator in ("Gt", "Lt") and key in values and len(wanted) == 1:
+        try:
+            actual, bound = int(values[key]), int(wanted[0])
+        except ValueError:
+            return False
+        return actual > bound if operator == "Gt" else actual < bound
+    return False
+
+
+class SchedulerSimulation:
+    """Re-place pods whose requests change the way kube-scheduler would.
+
+    observe() records each running pod's node, effective requests and scheduling constraints while
+    summarize_pods streams the pod list. Nodes are filtered with the scheduler's static predicates
+    (nodeSelector, required node affinity, NoSchedule/NoExecute taints, cordons) once per distinct
+    constraint set. place() then only checks resource fit and scores the eligible nodes against the
+    projection's free capacity, so each re-placed pod costs one pass over its eligible nodes.
+    """
+
+    def __init__(self, nodes: list[dict], strategy: str = "LeastAllocated") -> None:
+        self.strategy = strategy
+        self.labels: dict[str, dict[str, str]] = {}
+        self.taints: dict[str, list[dict]] = {}
+        for node in nodes:
+            meta = node.get("metadata", {}) or {}
+            name = meta.get("name") or ""
+            if not name:
+                continue
+            spec = node.get("spec", {}) or {}
+            taints = [
+                taint
+                for taint in spec.get("taints") or []
+                if isinstance(taint, dict) and taint.get("effect") in ("NoSchedule", "NoExecute")
+            ]
+            if spec.get("unschedulable"):
+                taints.append({"key": "node.kubernetes.io/unschedulable", "effect": "NoSchedule"})
+            self.labels[name] = {str(k): str(v) for k, v in (meta.get("labels") or {}).items()}
+            self.taints[name] = taints
+        self.pods: dict[str, tuple[str, float, float]] = {}
+        self.pod_constraints: dict[str, str] = {}
+        self.pods_by_container: dict[tuple[str, str], list[str]] = {}
+        self.constraints: dict[str, dict] = {}
+        self.eligible_by_constraints: dict[str, list[str]] = {}
+
+    def observe(self, pod: dict, node: str, cpu_m: float, mem_mi: float) -> None:
+        meta = pod.get("metadata", {}) or {}
+        spec = pod.get("spec", {}) or {}
+        release = (meta.get("labels", {}) or {}).get("app.kubernetes.io/instance") or ""
+        if not release:
+            return
+        pod_id = f"{meta.get('namespace') or ''}/{meta.get('name') or ''}"
+        constraints = {
+            "nodeSelector": spec.get("nodeSelector") or {},
+            "nodeSelectorTerms": (
+                (((spec.get("affinity") or {}).get("nodeAffinity") or {}).get(
+                    "requiredDuringSchedulingIgnoredDuringExecution"
+                ) or {}).get("nodeSelectorTerms")
+            ),
+            "tolerations": spec.get("tolerations") or [],
+        }
+        key = json.dumps(constraints, sort_keys=True)
+        self.constraints.setdefault(key, constraints)
+        self.pods[pod_id] = (node, cpu_m, mem_mi)
+        self.pod_constraints[pod_id] = key
+        for c in spec.get("containers", []) or []:
+            name = c.get("name") or ""
+            if name:
+                self.pods_by_container.setdefault((release, name), []).append(pod_id)
+
+    def pods_for(self, release: str, container: str) -> tuple[str, ...]:
+        return tuple(sorted(self.pods_by_container.get((release, container), ())))
+
+    def node_eligible(self, name: str, constraints: dict) -> bool:
+        labels = self.labels.get(name, {})
+        for key, value in (constraints["nodeSelector"] or {}).items():
+            if labels.get(key) != str(value):
+                return False
+        terms = constraints["nodeSelectorTerms"]
+        if terms is not None:
+            fields = {"metadata.name": name}
+            if not any(
+                (term.get("matchExpressions") or term.get("matchFields"))
+                and all(node_selector_requirement_matches(r, labels) for r in term.get("matchExpressions") or [])
+                and all(node_selector_requirement_matches(r, fields) for r in term.get("matchFields") or [])
+                for term in terms
+                if isinstance(term, dict)
+            ):
+                return False
+        tolerations = [t for t in constraints["tolerations"] if isinstance(t, dict)]
+        return all(any(toleration_matches(t, taint) for t in tolerations) for taint in self.taints.get(name, []))
+
+    def eligible(self, key: str, node_order: Iterable[str]) -> list[str]:
+        if key not in self.eligible_by_constraints:
+            constraints = self.constraints[key]
+            self.eligible_by_constraints[key] = [
+                name for name in node_order if self.node_eligible(name, constraints)
+            ]
+        return self.eligible_by_constraints[key]
+
+    def place(
+        self, projection: "NodeProjection", pod_ids: tuple[str, ...], delta_cpu_per_pod: float, delta_mem_per_pod: float
+    ) -> tuple[dict[str, list[float]], dict[str, tuple[str, float, float]]]:
+        """Return per-node request changes and new pod states for re-placing pod_ids with the deltas.
+
+        The pods leave their nodes first, then are placed one at a time in pod order on the best
+        scoring eligible node with room. A pod that fits nowhere stays on its current node, so the
+        projection reports the overage.
+        """
+
+        changes: dict[str, list[float]] = {}
+        for pod_id in pod_ids:
+            node, cpu_m, mem_mi = projection.pods[pod_id]
+            if node in projection.by_node:
+                change = changes.setdefault(node, [0.0, 0.0])
+                change[0] -= cpu_m
+                change[1] -= mem_mi
+
+        moved: dict[str, tuple[str, float, float]] = {}
+        most_allocated = self.strategy == "MostAllocated"
+        for pod_id in pod_ids:
+            node, cpu_m, mem_mi = projection.pods[pod_id]
+            want_cpu = max(0.0, cpu_m + delta_cpu_per_pod)
+            want_mem = max(0.0, mem_mi + delta_mem_per_pod)
+            score_cpu = want_cpu or SCHEDULER_DEFAULT_CPU_M
+            score_mem = want_mem or SCHEDULER_DEFAULT_MEM_MI
+            target, best = node, -1.0
+            for name in self.eligible(self.pod_constraints[pod_id], projection.node_alloc):
+                alloc = projection.node_alloc[name]
+                used = projection.by_node[name]
+                change = changes.get(name, (0.0, 0.0))
+                used_cpu = used["cpu_m"] + change[0]
+                used_mem = used["mem_mi"] + change[1]
+                if (
+                    used_cpu + want_cpu > alloc["cpu_m"] + projection.SLACK
+                    or used_mem + want_mem > alloc["mem_mi"] + projection.SLACK
+                ):
+                    continue
+                cpu_share = min(1.0, (used_cpu + score_cpu) / alloc["cpu_m"]) if alloc["cpu_m"] > 0 else 1.0
+                mem_share = min(1.0, (used_mem + score_mem) / alloc["mem_mi"]) if alloc["mem_mi"] > 0 else 1.0
+                score = (cpu_share + mem_share) / 2.0 if most_allocated else 1.0 - (cpu_share + mem_share) / 2.0
+                if score > best:
+                    target, best = name, score
+            if target in projection.by_node:
+                change = changes.setdefault(target, [0.0, 0.0])
+                change[0] += want_cpu
+                change[1] += want_mem
+            moved[pod_id] = (target, want_cpu, want_mem)
+        return changes, moved
+
+
+def summarize_pods(
+    pods: Iterable[dict], simulation: "SchedulerSimulation | None" = None
+) -> tuple[dict[tuple[str, str], dict[str, int]], dict[str, dict[str, float]], float, float]:
+    """Fold a pod stream into the placement index and the node request footprint in one pass.
+
+    Returns (placement_index, per_node_requests, total_cpu_m, total_mem_mi). Pods are consumed
+    one at a time, so a streamed list response never has to be materialised. Running pods are also
+    passed to simulation, when given, for scheduler-faithful node-fit.
+    """
+
+    index: dict[tuple[str, str], dict[str, int]] = {}
+    per_node: dict[str, dict[str, float]] = {}
+    total_cpu_m = 0.0
+    total_mem_mi = 0.0
+
+    for pod in pods:
+        spec = pod.get("spec", {}) or {}
+        node = spec.get("nodeName")
         if not node:
             continue
 
+        meta = pod.get("metadata", {}) or {}
+        labels = meta.get("labels", {}) or {}
+        release = labels.get("app.kubernetes.io/instance") or ""
+        if release:
+            for c in spec.get("containers", []) or []:
+                name = c.get("name") or ""
+                if not name:
+                    continue
+                key = (release, name)
+                index.setdefault(key, {})
+                index[key][node] = index[key].get(node, 0) + 1
+
         status = pod.get("status", {}) or {}
         phase = (status.get("phase") or "").lower()
         if phase in ("succeeded", "failed"):
             continue
 
         cpu_m, mem_mi = pod_effective_requests(pod)
+        if simulation is not None:
+            simulation.observe(pod, node, cpu_m, mem_mi)
         per_node.setdefault(node, {"cpu_m": 0.0, "mem_mi": 0.0})
         per_node[node]["cpu_m"] += cpu_m
         per_node[node]["mem_mi"] += mem_mi
         total_cpu_m += cpu_m
         total_mem_mi += mem_mi
 
+    return index, per_node, total_cpu_m, total_mem_mi
+
+
+def build_pod_placement_index(pods: Iterable[dict]) -> dict[tuple[str, str], dict[str, int]]:
+    """Return (release, container) -> {nodeName: pod_count} for scheduled pods."""
+
+    return summarize_pods(pods)[0]
+
+
+def build_node_request_footprint(pods: Iterable[dict]) -> tuple[dict[str, dict[str, float]], float, float]:
+    """Return per-node request totals and cluster totals (CPU m, Memory Mi)."""
+
+    _index, per_node, total_cpu_m, total_mem_mi = summarize_pods(pods)
     return per_node, total_cpu_m, total_mem_mi
 
 
@@ -729,32 +3501,266 @@ def write_outputs(report: dict, markdown: str, extras: dict[str, str] | None = N
     log(f"Wrote local outputs to {output_dir}")
 
 
+# Larger report payloads stored gzip-compressed in shard ConfigMaps; everything else stays plain data.
+REPORT_FINGERPRINTS_DOCUMENT = "fingerprints.json"
+REPORT_DOCUMENTS = (
+    "latest.json",
+    "latest.md",
+    "apply-plan.json",
+    "apply-plan.md",
+    "recording-rules.yaml",
+    REPORT_FINGERPRINTS_DOCUMENT,
+)
+REPORT_MANIFEST_KEY = "manifest.json"
+REPORT_STORAGE_MODES = ("sharded", "plain")
+# Keys and JSON fields that differ between runs over identical input; written, but not part of the content hash.
+REPORT_VOLATILE_KEYS = ("lastRunAt", "applyLastRunAt")
+REPORT_VOLATILE_FIELDS = frozenset(
+    ("generated_at", "preflight_generated_at", "executed_at", "computed_at", "run_stats", "containers_reused")
+)
+
+
+def without_volatile_fields(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: without_volatile_fields(item) for key, item in value.items() if key not in REPORT_VOLATILE_FIELDS}
+    if isinstance(value, list):
+        return [without_volatile_fields(item) for item in value]
+    return value
+
+
+def report_content_hash(data: dict[str, str]) -> str:
+    """Hash of the report ConfigMap data that two runs over identical input agree on.
+
+    REPORT_VOLATILE_KEYS are left out, JSON documents are hashed without REPORT_VOLATILE_FIELDS, and
+    Markdown documents are left out because they are rendered from the JSON documents beside them.
+    """
+
+    stable = {}
+    for key, value in data.items():
+        if key in REPORT_VOLATILE_KEYS or key.endswith(".md"):
+            continue
+        if key.endswith(".json"):
+            try:
+                value = json.dumps(without_volatile_fields(json.loads(value)), sort_keys=True)
+            except json.JSONDecodeError:
+                pass
+        stable[key] = value
+    return configmap_content_hash(stable)
+
+
+class ReportDocumentError(RuntimeError):
+    pass
+
+
+def report_shard_name(name: str, content_hash: str) -> str:
+    # Content-addressed, so a name never changes content: readers see the shard their manifest hashed or none.
+    return f"{name}-shard-{content_hash[:16]}"
+
+
+def pack_report_shards(
+    documents: dict[str, str], shard_max_bytes: int
+) -> tuple[dict[str, dict], list[dict[str, bytes]]]:
+    """Gzip each document and pack the blobs first-fit into shards of at most shard_max_bytes.
+
+    Returns (manifest files, shards). A blob larger than one shard is split into numbered parts.
+    Compression is deterministic (mtime=0), so unchanged content gives unchanged shards.
+    """
+
+    files: dict[str, dict] = {}
+    shards: list[dict[str, bytes]] = []
+    sizes: list[int] = []
+    for doc_name in sorted(documents):
+        raw = documents[doc_name].encode("utf-8")
+        blob = gzip.compress(raw, mtime=0)
+        pieces = [blob[offset : offset + shard_max_bytes] for offset in range(0, len(blob), shard_max_bytes)]
+        parts = []
+        for number, piece in enumerate(pieces):
+            key = f"{doc_name}.gz" if len(pieces) == 1 else f"{doc_name}.gz.{number}"
+            index = next((i for i, size in enumerate(sizes) if size + len(piece) <= shard_max_bytes), len(shards))
+            if index == len(shards):
+                shards.append({})
+                sizes.append(0)
+            shards[index][key] = piece
+            sizes[index] += len(piece)
+            parts.append([index, key])
+        files[doc_name] = {
+            "sha256": hashlib.sha256(raw).hexdigest(),
+            "bytes": len(raw),
+            "gzip_bytes": len(blob),
+            "parts": parts,
+        }
+    return files, shards
+
+
+def read_report_configmaps(
+    kube: KubeClient,
+    namespace: str,
+    name: str,
+    documents: Iterable[str] | None = None,
+    known_version: str = "",
+    known_hashes: dict[str, str] | None = None,
+    meta: dict[str, Any] | None = None,
+    strict: bool = False,
+) -> tuple[int, dict[str, str], dict[str, Any]]:
+    """Read the report ConfigMap, resolving sharded documents through its manifest.
+
+    Returns (status, data, manifest). Only the shards holding the requested documents (all of them
+    when documents is None) are fetched. A document that cannot be read, such as one whose shard an
+    overlapping run has already deleted, or whose content hash does not match the manifest, is left
+    out; with strict it raises ReportDocumentError instead. manifest is {} for the plain layout,
+    whose data is returned as stored.
+
+    Callers that keep earlier results can pass the resourceVersion they last read, which returns
+    (304, {}, {}) without touching shards when it is unchanged, and the manifest hashes they hold,
+    whose documents are then not fetched. meta receives the ConfigMap metadata.
+    """
+
+    status, payload = kube.request_json("GET", f"/api/v1/namespaces/{namespace}/configmaps/{name}")
+    if status != 200:
+        return status, {}, {}
+    metadata = (payload or {}).get("metadata", {}) or {}
+    if meta is not None:
+        meta.update(metadata)
+    if known_version and str(metadata.get("resourceVersion") or "") == known_version:
+        return 304, {}, {}
+    data = {str(key): str(value) for key, value in ((payload or {}).get("data", {}) or {}).items()}
+    if REPORT_MANIFEST_KEY not in data:
+        return status, data, {}
+    try:
+        manifest = json.loads(data.pop(REPORT_MANIFEST_KEY))
+    except json.JSONDecodeError as exc:
+        log(f"Invalid report manifest in configmap {namespace}/{name}: {exc}")
+        return status, data, {}
+
+    files = manifest.get("files", {}) or {}
+    wanted = [
+        doc_name
+        for doc_name in (files if documents is None else documents)
+        if doc_name in files and (known_hashes or {}).get(doc_name) != files[doc_name]["sha256"]
+    ]
+    shard_names = manifest.get("shards", []) or []
+    shards: dict[int, dict[str, str]] = {}
+    for index in sorted({index for doc_name in wanted for index, _key in files[doc_name]["parts"]}):
+        shard_status, shard_payload = kube.request_json(
+            "GET", f"/api/v1/namespaces/{namespace}/configmaps/{shard_names[index]}"
+        )
+        if shard_status == 200:
+            shards[index] = (shard_payload or {}).get("binaryData", {}) or {}
+        else:
+            log(f"Failed to get report shard {namespace}/{shard_names[index]}: {shard_status}")
+    for doc_name in wanted:
+        entry = files[doc_name]
+        try:
+            blob = b"".join(base64.b64decode(shards[index][key]) for index, key in entry["parts"])
+            raw = gzip.decompress(blob)
+        except (KeyError, ValueError, OSError) as exc:
+            if strict:
+                raise ReportDocumentError(f"Report document {doc_name} is unreadable: {exc}") from exc
+            log(f"Report document {doc_name} is unreadable: {exc}")
+            continue
+        if hashlib.sha256(raw).hexdigest() != entry["sha256"]:
+            if strict:
+                raise ReportDocumentError(f"Report document {doc_name} does not match its manifest hash")
+            log(f"Report document {doc_name} does not match its manifest hash; skipping")
+            continue
+        data[doc_name] = raw.decode("utf-8")
+    return status, data, manifest
+
+
+def write_report_configmaps(
+    kube: KubeClient,
+    namespace: str,
+    name: str,
+    data: dict[str, str],
+    previous_manifest: dict[str, Any] | None = None,
+    known_hash: str = "",
+    remove_keys: Iterable[str] = (),
+    content_hash: str = "",
+) -> None:
+    """Store REPORT_DOCUMENTS gzip-compressed in shard ConfigMaps and the rest plus a manifest in name.
+
+    Shards are named by their content hash and written before the manifest that points at them, and
+    shards the new manifest no longer uses are deleted afterwards. A shard is never rewritten in
+    place, so a reader holding either manifest finds its shards with the content it expects, or finds
+    them gone once a later run has flipped the manifest. Shards the previous manifest already names,
+    and a main ConfigMap matching known_hash, are not rewritten. When content_hash (see
+    report_content_hash) matches known_hash, nothing is written: the stored report differs from data
+    only in volatile fields.
+    """
+
+    if content_hash and content_hash == known_hash and not remove_keys:
+        log(f"Report in {namespace}/{name} unchanged apart from volatile fields; skipping write")
+        return
+    shard_max_bytes = max(64, env_int("REPORT_SHARD_MAX_KB", 768)) * 1024
+    documents = {key: value for key, value in data.items() if key in REPORT_DOCUMENTS}
+    files, shards = pack_report_shards(documents, shard_max_bytes)
+    previous_hashes = dict(
+        zip((previous_manifest or {}).get("shards", []) or [], (previous_manifest or {}).get("shard_sha256", []) or [])
+    )
+    shard_names = []
+    shard_hashes = []
+    for blobs in shards:
+        binary_data = {key: base64.b64encode(blob).decode("ascii") for key, blob in blobs.items()}
+        shard_name = report_shard_name(name, configmap_content_hash({}, binary_data))
+        shard_names.append(shard_name)
+        shard_hash = kube.upsert_configmap(
+            namespace=namespace,
+            name=shard_name,
+            data={},
+            binary_data=binary_data,
+            known_hash=previous_hashes.get(shard_name, ""),
+        )
+        if not shard_hash:
+            log(f"Leaving the report manifest in {namespace}/{name} unchanged after a failed shard write")
+            return
+        shard_hashes.append(shard_hash)
+
+    manifest = {"format": 1, "encoding": "gzip", "shards": shard_names, "shard_sha256": shard_hashes, "files": files}
+    plain = {key: value for key, value in data.items() if key not in REPORT_DOCUMENTS}
+    plain[REPORT_MANIFEST_KEY] = json.dumps(manifest, sort_keys=True, separators=(",", ":"))
+    if not kube.upsert_configmap(
+        namespace=namespace,
+        name=name,
+        data=plain,
+        known_hash=known_hash,
+        remove_keys=remove_keys,
+        content_hash=content_hash,
+    ):
+        return
+    log(
+        f"Stored {len(files)} report documents in {len(shard_names)} shard(s): "
+        f"{sum(entry['bytes'] for entry in files.values())} bytes, "
+        f"{sum(entry['gzip_bytes'] for entry in files.values())} compressed"
+    )
+    delete_stale_report_shards(kube, namespace, previous_manifest, shard_names)
+
+
+def delete_stale_report_shards(
+    kube: KubeClient, namespace: str, previous_manifest: dict[str, Any] | None, keep: list[str]
+) -> None:
+    for shard_name in (previous_manifest or {}).get("shards", []) or []:
+        if shard_name not in keep:
+            kube.delete_configmap(namespace, shard_name)
+
+
 def github_request(method: str, url: str, token: str, payload: dict | None = None) -> tuple[int, dict]:
     data = None
     if payload is not None:
         data = json.dumps(payload).encode("utf-8")
 
-    req = urllib.request.Request(
-        url=url,
-        method=method,
-        data=data,
+    status, raw = HTTP_POOL.request(
+        method,
+        url,
         headers={
             "Accept": "application/vnd.github+json",
             "Authorization": f"Bearer {token}",
             "X-GitHub-Api-Version": "2022-11-28",
             "Content-Type": "application/json",
         },
+        body=data,
+        timeout=60,
     )
-    try:
-        with urllib.request.urlopen(req, timeout=60) as resp:
-            raw = resp.read().decode("utf-8")
-            return resp.getcode(), json.loads(raw) if raw else {}
-    except urllib.error.HTTPError as exc:
-        detail = exc.read().decode("utf-8", errors="replace")
-        try:
-            return exc.code, json.loads(detail)
-        except Exception:
-            return exc.code, {"message": detail}
+    return status, decode_json_response(status, raw)
 
 
 def ensure_branch(repository: str, base_branch: str, branch: str, token: str) -> bool:
@@ -949,7 +3955,565 @@ def estimate_coverage_days(prom: PromClient) -> float:
     return round(max(0.0, seconds) / 86400.0, 2)
 
 
-def build_report() -> tuple[dict, str]:
+RECOMMEND_BATCH_SIZE = 4096
+# Bump when the recommendation logic changes, so fingerprints from older runs stop matching.
+RECOMMENDATION_POLICY_VERSION = 2
+STAGE_END = object()
+
+
+class ReportStages:
+    """Exclusive wall-clock seconds spent in each stage of the report pipeline.
+
+    Stages are chained generators, so pulling an item from one stage runs its upstream stages too.
+    The clock is charged to whichever stage is executing, so nested time is never counted twice.
+    """
+
+    def __init__(self, names: Iterable[str] = ()) -> None:
+        self.seconds: dict[str, float] = dict.fromkeys(names, 0.0)
+        self.active: list[str] = []
+        self.mark = time.monotonic()
+
+    def switch(self, enter: str | None) -> None:
+        now = time.monotonic()
+        if self.active:
+            current = self.active[-1]
+            self.seconds[current] = self.seconds.get(current, 0.0) + (now - self.mark)
+        self.mark = now
+        if enter is None:
+            self.active.pop()
+        else:
+            self.active.append(enter)
+
+    @contextlib.contextmanager
+    def timed(self, name: str) -> Iterator[None]:
+        self.switch(name)
+        try:
+            yield
+        finally:
+            self.switch(None)
+
+    def stage(self, name: str, items: Iterable[Any]) -> Iterator[Any]:
+        iterator = iter(items)
+        while True:
+            with self.timed(name):
+                item = next(iterator, STAGE_END)
+            if item is STAGE_END:
+                return
+            yield item
+
+
+def discover_targets(
+    kube: KubeClient, namespaces: list[str], discovered: list[tuple[str, str, str]] | None = None
+) -> Iterator[dict]:
+    """Discover stage: one target per workload container, in namespace then kind order.
+
+    When discovered is given it receives each workload's (namespace, kind, name) as it is listed.
+    """
+
+    for namespace, kind, workloads in discover_workloads(kube, namespaces):
+        for workload in workloads:
+            meta = workload.get("metadata", {})
+            spec = workload.get("spec", {}).get("template", {}).get("spec", {})
+            replicas = safe_int((workload.get("spec", {}) or {}).get("replicas"), 1)
+            labels = meta.get("labels", {})
+            workload_name = meta.get("name", "unknown")
+            if discovered is not None:
+                discovered.append((namespace, kind, workload_name))
+            release = labels.get("app.kubernetes.io/instance", workload_name)
+            pod_regex = pod_regex_for_workload(workload_name, kind)
+
+            for container in spec.get("containers", []):
+                yield {
+                    "namespace": namespace,
+                    "kind": kind,
+                    "workload": workload_name,
+                    "release": release,
+                    "replicas": replicas,
+                    "container": container.get("name", "main"),
+                    "pod_regex": pod_regex,
+                    "owner": (kind, workload_name),
+                    "resources": container.get("resources", {}),
+                }
+
+
+class UsageFetcher:
+    """Fetch stage: queue each target's usage queries, then attach the results one namespace at a time.
+
+    Queries are queued as targets arrive, so they run while discovery continues. Targets arrive grouped
+    by namespace and usage series resolve to workloads within their namespace, so a namespace's targets
+    are yielded as soon as its queries complete, once the next namespace's first queries are queued.
+    At most one namespace's targets and joined results are held. Yielding in discovery order keeps the
+    report independent of which query finished first.
+    """
+
+    def __init__(
+        self,
+        prom: PromClient,
+        executor: PromQueryExecutor,
+        collection_mode: str,
+        metrics_window: str,
+        metrics_resolution: str,
+        cpu_throttle_window: str,
+        usage_history: UsageHistoryCache | None,
+        governor: ResolutionGovernor | None,
+        use_recorded: bool,
+        range_steps: range = range(0),
+        range_chunk_steps: int = 1,
+        metrics_since: float = 0.0,
+        throttle_since: float = 0.0,
+    ) -> None:
+        self.prom = prom
+        self.executor = executor
+        self.collection_mode = collection_mode
+        self.metrics_window = metrics_window
+        self.metrics_resolution = metrics_resolution
+        self.cpu_throttle_window = cpu_throttle_window
+        self.usage_history = usage_history
+        self.governor = governor
+        self.use_recorded = use_recorded
+        self.range_steps = range_steps
+        self.range_chunk_steps = range_chunk_steps
+        self.metrics_since = metrics_since
+        self.throttle_since = throttle_since
+        self.namespace_futures: dict[str, dict[str, Future]] = {}
+        self.namespace_resolutions: dict[str, dict[str, str]] = {}
+        self.recorded_futures: dict[str, dict[str, Future]] = {}
+        self.recorded_resolutions: dict[str, dict[str, str]] = {}
+        self.containers_from_recording_rules = 0
+
+    def queue_raw(self, target: dict) -> None:
+        namespace = target["namespace"]
+        if self.collection_mode == "range":
+            # Chunked range queries per signal for the whole namespace, queued on first use.
+            if namespace not in self.namespace_futures:
+                self.namespace_futures[namespace] = submit_namespace_range_usage(
+                    self.executor,
+                    self.prom,
+                    namespace,
+                    self.range_steps,
+                    self.range_chunk_steps,
+                    self.metrics_since,
+                    self.throttle_since,
+                    self.usage_history,
+                )
+        elif self.collection_mode == "batched":
+            # One grouped query per signal for the whole namespace, queued on first use.
+            if namespace not in self.namespace_futures:
+                self.namespace_resolutions[namespace] = {}
+                self.namespace_futures[namespace] = submit_namespace_usage(
+                    self.executor,
+                    self.prom,
+                    namespace,
+                    self.metrics_window,
+                    self.metrics_resolution,
+                    self.cpu_throttle_window,
+                    self.usage_history,
+                    self.governor,
+                    self.namespace_resolutions[namespace],
+                )
+            target["resolutions"] = self.namespace_resolutions[namespace]
+        else:
+            target["resolutions"] = {}
+            target["usage_futures"] = submit_container_usage(
+                self.executor,
+                self.prom,
+                namespace,
+                target["pod_regex"],
+                target["container"],
+                self.metrics_window,
+                self.metrics_resolution,
+                self.cpu_throttle_window,
+                self.usage_history,
+                self.governor,
+                target["resolutions"],
+            )
+
+    def queue(self, target: dict) -> None:
+        namespace = target["namespace"]
+        if "reused" in target:
+            # An earlier run's entry stands in for this container; grouped queries wait for one that needs them.
+            return
+        if not self.use_recorded:
+            self.queue_raw(target)
+            return
+        # Recorded per-workload series for the whole namespace; raw queries only as fallback.
+        if namespace not in self.recorded_futures:
+            self.recorded_resolutions[namespace] = {}
+            self.recorded_futures[namespace] = submit_recorded_usage(
+                self.executor,
+                self.prom,
+                namespace,
+                self.metrics_window,
+                self.metrics_resolution,
+                self.cpu_throttle_window,
+                self.governor,
+                self.recorded_resolutions[namespace],
+            )
+        target["resolutions"] = self.recorded_resolutions[namespace]
+
+    def resolve_namespace(self, queued: list[dict]) -> Iterator[dict]:
+        namespace = queued[0]["namespace"]
+        if self.use_recorded:
+            window_seconds = parse_duration_seconds(self.metrics_window) or 0
+            min_recorded_seconds = window_seconds - (parse_duration_seconds(self.metrics_resolution) or 0)
+            recorded_usage = None
+            for target in queued:
+                if "reused" in target:
+                    continue
+                if recorded_usage is None:
+                    recorded_usage = RecordedUsage(
+                        self.executor.resolve(self.recorded_futures.pop(namespace)), min_recorded_seconds
+                    )
+                usage = recorded_usage.for_container(target["owner"], target["container"])
+                if usage is None:
+                    self.queue_raw(target)
+                else:
+                    target["usage"] = usage
+                    self.containers_from_recording_rules += 1
+
+        # Usage series outlive their pods, so they resolve to workloads by pod name against this snapshot.
+        pod_owners = PodOwnerIndex((target["namespace"], *target["owner"]) for target in queued)
+        joined: NamespaceUsage | NamespaceRangeUsage | None = None
+        for target in queued:
+            if "usage" in target or "reused" in target:
+                yield target
+                continue
+            if self.collection_mode == "per-container":
+                target["usage"] = self.executor.resolve(target.pop("usage_futures"))
+            else:
+                if joined is None:
+                    # Dropping the futures releases the namespace's results once they are joined.
+                    results = self.executor.resolve(self.namespace_futures.pop(namespace))
+                    if self.collection_mode == "range":
+                        joined = NamespaceRangeUsage(results, namespace, pod_owners)
+                    else:
+                        joined = NamespaceUsage(results, namespace, pod_owners)
+                target["usage"] = joined.for_container(target["owner"], target["container"])
+            if self.usage_history is not None:
+                target["usage_summary"] = {
+                    field: self.usage_history.summary(field, namespace, target["pod_regex"], target["container"])
+                    for field in USAGE_MAX_FIELDS
+                }
+            elif self.collection_mode == "range":
+                target["usage_summary"] = {
+                    field: joined.summary(field, target["owner"], target["container"]) for field in USAGE_MAX_FIELDS
+                }
+            yield target
+
+    def fetch(self, targets: Iterable[dict]) -> Iterator[dict]:
+        pending: list[dict] = []
+        for target in targets:
+            self.queue(target)
+            if pending and target["namespace"] != pending[0]["namespace"]:
+                # The next namespace's queries are already queued, so they run while this one resolves.
+                yield from self.resolve_namespace(pending)
+                pending = []
+            pending.append(target)
+        if pending:
+            yield from self.resolve_namespace(pending)
+
+        if self.usage_history is not None:
+            evicted = self.usage_history.evict()
+            cache_stats = self.usage_history.stats()
+            log(
+                f"Usage cache: reused={cache_stats['buckets_reused']} fetched={cache_stats['buckets_fetched']} "
+                f"range_queries={cache_stats['range_queries']} failures={cache_stats['range_failures']} "
+                f"evicted_files={evicted}"
+            )
+
+
+def usage_quantile_fields(target: dict) -> dict:
+    """Window quantiles from the merged sketches, when the usage cache or range mode provides them."""
+
+    quantile_fields = {}
+    usage_summary = target.get("usage_summary") or {}
+    if usage_summary.get("cpu_p95_cores"):
+        quantile_fields["cpu_quantiles_m"] = {
+            name: round(value * 1000.0, 1) for name, value in usage_summary["cpu_p95_cores"].items()
+        }
+    if usage_summary.get("mem_p95_bytes"):
+        quantile_fields["mem_quantiles_mi"] = {
+            name: round(value / (1024.0 * 1024.0), 1) for name, value in usage_summary["mem_p95_bytes"].items()
+        }
+    return quantile_fields
+
+
+def recommendation_entry(target: dict, columns: dict[str, list], results: dict[str, list], index: int) -> dict:
+    return {
+        "namespace": target["namespace"],
+        "kind": target["kind"][:-1],
+        "workload": target["workload"],
+        "release": target["release"],
+        "replicas": target["replicas"],
+        "container": target["container"],
+        "restarts_window": round(columns["restarts"][index], 2),
+        "cpu_p95_m": round(columns["cpu_p95_m"][index], 1),
+        "mem_p95_mi": round(columns["mem_p95_mi"][index], 1),
+        "cpu_throttle_ratio": round(columns["cpu_throttle_ratio"][index], 3),
+        "cpu_throttled_periods": round(columns["cpu_throttled_periods"][index], 1),
+        "metrics_resolution": target["resolution"],
+        "current": {
+            "requests": {
+                "cpu": fmt_cpu_m(columns["cur_req_cpu"][index]),
+                "memory": fmt_mem_mi(columns["cur_req_mem"][index]),
+            },
+            "limits": {
+                "cpu": fmt_cpu_m(columns["cur_lim_cpu"][index]),
+                "memory": fmt_mem_mi(columns["cur_lim_mem"][index]),
+            },
+        },
+        "recommended": {
+            "requests": {
+                "cpu": fmt_cpu_m(results["rec_req_cpu"][index]),
+                "memory": fmt_mem_mi(results["rec_req_mem"][index]),
+            },
+            "limits": {
+                "cpu": fmt_cpu_m(results["rec_lim_cpu"][index]),
+                "memory": fmt_mem_mi(results["rec_lim_mem"][index]),
+            },
+        },
+        "delta_percent": {
+            "requests_cpu": round(results["req_cpu_delta"][index], 1),
+            "requests_memory": round(results["req_mem_delta"][index], 1),
+            "limits_cpu": round(results["lim_cpu_delta"][index], 1),
+            "limits_memory": round(results["lim_mem_delta"][index], 1),
+        },
+        "action": results["action"][index],
+        "notes": results["notes"][index],
+        **usage_quantile_fields(target),
+    }
+
+
+class ReportFingerprints:
+    """Per-container fingerprints of the inputs known before usage is fetched, and what they produced.
+
+    A fingerprint covers the container's declared requests and limits, release and replicas, and a
+    digest of the policy settings, metrics window and resolution and the usage source. It is computed
+    at discovery, so a container whose fingerprint matches a record from an earlier run younger than
+    max_age_seconds skips its usage queries and reuses that record's report entry whole; a namespace
+    whose containers are all reused is not queried at all. A reused entry is the earlier run's output,
+    usage figures and quantiles included, so max_age_seconds bounds how stale it can be. records
+    collects this run's fingerprints for the next run.
+    """
+
+    def __init__(
+        self,
+        previous: dict[str, dict],
+        policy_digest: str,
+        max_age_seconds: float,
+        now: float | None = None,
+    ) -> None:
+        self.previous = previous
+        self.policy_digest = policy_digest
+        self.max_age_seconds = max_age_seconds
+        self.now = time.time() if now is None else now
+        self.records: dict[str, dict] = {}
+        self.reused = 0
+
+    @staticmethod
+    def key(target: dict) -> str:
+        return "/".join((target["namespace"], target["kind"], target["workload"], target["container"]))
+
+    def fingerprint(self, target: dict) -> str:
+        payload = [self.policy_digest, target["release"], target["replicas"], target["resources"]]
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def reuse(self, key: str, fingerprint: str) -> dict | None:
+        record = self.previous.get(key)
+        if not isinstance(record, dict) or record.get("sha256") != fingerprint:
+            return None
+        computed_at = record.get("computed_at")
+        if not isinstance(computed_at, (int, float)) or self.now - computed_at > self.max_age_seconds:
+            return None
+        self.records[key] = record
+        self.reused += 1
+        return record
+
+    def match(self, targets: Iterable[dict]) -> Iterator[dict]:
+        """Fingerprint each discovered target and mark the ones an earlier run's record covers."""
+
+        for target in targets:
+            target["fingerprint_key"] = self.key(target)
+            target["fingerprint"] = self.fingerprint(target)
+            reused = self.reuse(target["fingerprint_key"], target["fingerprint"])
+            if reused is not None:
+                target["reused"] = reused
+            yield target
+
+    def store(
+        self, key: str, fingerprint: str, recommended_requests: tuple[float, float] | None, entry: dict | None
+    ) -> None:
+        self.records[key] = {
+            "sha256": fingerprint,
+            "computed_at": int(self.now),
+            "recommended_requests": list(recommended_requests) if recommended_requests is not None else None,
+            "recommendation": entry,
+        }
+
+
+def recommendation_policy_digest(
+    settings: dict[str, float], downscale_exclude: set[str], metrics_resolution: str, sources: dict[str, str]
+) -> str:
+    payload = {
+        "version": RECOMMENDATION_POLICY_VERSION,
+        "settings": settings,
+        "downscale_exclude": sorted(downscale_exclude),
+        "metrics_resolution": metrics_resolution,
+        "sources": sources,
+        "service_tuning_policies": DEFAULT_SERVICE_TUNING_POLICIES,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def recommend_targets(
+    targets: Iterable[dict],
+    settings: dict[str, float],
+    downscale_exclude: set[str],
+    metrics_resolution: str,
+    batch_size: int = RECOMMEND_BATCH_SIZE,
+    fingerprints: ReportFingerprints | None = None,
+) -> Iterator[dict]:
+    """Recommend stage: one row per target with its current and recommended requests.
+
+    Targets with metrics are loaded into parallel columns and recommended a batch at a time. Each row
+    carries the report entry, or None when the container has no metrics or no delta clears the deadband.
+    Targets marked by ReportFingerprints.match carry no usage and reuse the earlier run's entry.
+    """
+
+    def flush(batch: list[dict], columns: dict[str, list]) -> Iterator[dict]:
+        results = recommend_columns(columns, settings, downscale_exclude) if columns["release"] else {}
+        for target in batch:
+            index = target.pop("row")
+            reused = target.pop("reused", None)
+            row = {
+                "target": target,
+                "current_requests": target.pop("current_requests"),
+                "has_metrics": index is not None,
+                "recommended_requests": None,
+                "recommendation": None,
+            }
+            if reused is not None:
+                if reused["recommended_requests"] is not None:
+                    row["has_metrics"] = True
+                    row["recommended_requests"] = tuple(reused["recommended_requests"])
+                row["recommendation"] = reused["recommendation"]
+                yield row
+                continue
+            if index is not None:
+                row["recommended_requests"] = (results["rec_req_cpu"][index], results["rec_req_mem"][index])
+                if results["action"][index] is not None:
+                    row["recommendation"] = recommendation_entry(target, columns, results, index)
+            if fingerprints is not None:
+                fingerprints.store(
+                    target.pop("fingerprint_key"),
+                    target.pop("fingerprint"),
+                    row["recommended_requests"],
+                    row["recommendation"],
+                )
+            yield row
+
+    batch: list[dict] = []
+    columns: dict[str, list] = {name: [] for name in RECOMMENDATION_INPUTS}
+    for target in targets:
+        resources = target["resources"]
+        req = resources.get("requests", {})
+        lim = resources.get("limits", {})
+        cur_req_cpu = parse_cpu_to_m(req.get("cpu"))
+        cur_req_mem = parse_mem_to_mi(req.get("memory"))
+        target["current_requests"] = (cur_req_cpu, cur_req_mem)
+        target["row"] = None
+        batch.append(target)
+
+        usage = target.get("usage") or {}
+        cpu_p95_cores = usage.get("cpu_p95_cores")
+        mem_p95_bytes = usage.get("mem_p95_bytes")
+        if cpu_p95_cores is not None or mem_p95_bytes is not None:
+            target["resolution"] = coarsest_resolution(
+                (value for field, value in (target.get("resolutions") or {}).items() if usage.get(field) is not None),
+                metrics_resolution,
+            )
+            cpu_throttled_periods = usage["throttled_periods"] or 0.0
+            cpu_periods = usage["cfs_periods"] or 0.0
+            row = {
+                "release": target["release"],
+                "degraded_resolution": target["resolution"] != metrics_resolution,
+                "cur_req_cpu": cur_req_cpu,
+                "cur_req_mem": cur_req_mem,
+                "cur_lim_cpu": parse_cpu_to_m(lim.get("cpu")),
+                "cur_lim_mem": parse_mem_to_mi(lim.get("memory")),
+                "cpu_p95_m": (cpu_p95_cores or 0.0) * 1000.0,
+                "mem_p95_mi": (mem_p95_bytes or 0.0) / (1024.0 * 1024.0),
+                "restarts": usage["restarts"] or 0.0,
+                "cpu_throttled_periods": cpu_throttled_periods,
+                "cpu_throttle_ratio": cpu_throttled_periods / cpu_periods if cpu_periods > 0.0 else 0.0,
+            }
+            target["row"] = len(columns["release"])
+            for name in RECOMMENDATION_INPUTS:
+                columns[name].append(row[name])
+
+        if len(batch) >= max(1, batch_size):
+            yield from flush(batch, columns)
+            batch = []
+            columns = {name: [] for name in RECOMMENDATION_INPUTS}
+    yield from flush(batch, columns)
+
+
+def aggregate_recommendations(rows: Iterable[dict]) -> dict:
+    """Aggregate stage: container counts, request totals and the ranked recommendations."""
+
+    totals = {
+        "containers_analyzed": 0,
+        "containers_with_metrics": 0,
+        "containers_skipped_no_metrics": 0,
+        "total_current_requests_cpu_m": 0.0,
+        "total_current_requests_memory_mi": 0.0,
+        "total_recommended_requests_cpu_m": 0.0,
+        "total_recommended_requests_memory_mi": 0.0,
+    }
+    recommendations: list[dict] = []
+    for row in rows:
+        replicas = row["target"]["replicas"]
+        cur_req_cpu, cur_req_mem = row["current_requests"]
+        rec_req_cpu, rec_req_mem = row["recommended_requests"] or row["current_requests"]
+        totals["containers_analyzed"] += 1
+        totals["containers_with_metrics" if row["has_metrics"] else "containers_skipped_no_metrics"] += 1
+        # Budget and headroom checks should reflect real cluster footprint, not per-pod template values.
+        totals["total_current_requests_cpu_m"] += cur_req_cpu * replicas
+        totals["total_current_requests_memory_mi"] += cur_req_mem * replicas
+        totals["total_recommended_requests_cpu_m"] += rec_req_cpu * replicas
+        totals["total_recommended_requests_memory_mi"] += rec_req_mem * replicas
+        if row["recommendation"] is not None:
+            recommendations.append(row["recommendation"])
+
+    recommendations.sort(
+        key=lambda item: (
+            item.get("action") != "upsize",
+            -(item.get("restarts_window", 0.0)),
+            -max(
+                abs(item.get("delta_percent", {}).get("requests_memory", 0.0)),
+                abs(item.get("delta_percent", {}).get("limits_memory", 0.0)),
+                abs(item.get("delta_percent", {}).get("requests_cpu", 0.0)),
+                abs(item.get("delta_percent", {}).get("limits_cpu", 0.0)),
+            ),
+        )
+    )
+    totals["recommendations"] = recommendations
+    return totals
+
+
+def build_report(
+    previous_fingerprints: dict[str, dict] | None = None,
+    fingerprints: dict[str, dict] | None = None,
+    workloads: list[tuple[str, str, str]] | None = None,
+) -> tuple[dict, str]:
+    """Build the report and its markdown.
+
+    When fingerprints is given it receives this run's per-container fingerprints, and containers whose
+    fingerprint matches one in previous_fingerprints reuse that run's result (see ReportFingerprints).
+    When workloads is given it receives every discovered (namespace, kind, workload), for the recording
+    rules.
+    """
+
     mode = os.getenv("MODE", "report").strip().lower() or "report"
     namespaces = env_list("TARGET_NAMESPACES", "default,monitoring")
     downscale_exclude = set(
@@ -973,312 +4537,146 @@ def build_report() -> tuple[dict, str]:
     metrics_window = os.getenv("METRICS_WINDOW", "14d").strip()
     metrics_resolution = os.getenv("METRICS_RESOLUTION", "1h").strip()
     cpu_throttle_window = os.getenv("CPU_THROTTLE_WINDOW", "1d").strip() or metrics_window
+    collection_mode = os.getenv("METRICS_COLLECTION_MODE", "batched").strip().lower() or "batched"
+    if collection_mode not in METRICS_COLLECTION_MODES:
+        log(f"Invalid METRICS_COLLECTION_MODE: {collection_mode!r}; using batched")
+        collection_mode = "batched"
+    usage_history = open_usage_history(metrics_window, metrics_resolution)
+    range_steps = range(0)
+    range_chunk_steps = max(1, env_int("PROM_RANGE_CHUNK_STEPS", 72))
+    metrics_since = throttle_since = 0.0
+    if collection_mode == "range":
+        window_seconds = parse_duration_seconds(metrics_window)
+        step_seconds = parse_duration_seconds(metrics_resolution)
+        throttle_seconds = parse_duration_seconds(cpu_throttle_window)
+        if not window_seconds or not step_seconds or not throttle_seconds:
+            log(
+                "Range collection needs whole-second durations for "
+                f"{metrics_window!r}/{metrics_resolution!r}/{cpu_throttle_window!r}; using batched"
+            )
+            collection_mode = "batched"
+        else:
+            range_now = time.time()
+            range_steps = aligned_steps(range_now, window_seconds, step_seconds)
+            metrics_since = range_now - window_seconds
+            throttle_since = range_now - throttle_seconds
 
     prom = PromClient(
         os.getenv("PROMETHEUS_URL", "http://kube-prometheus-stack-prometheus.monitoring.svc.cluster.local:9090")
     )
     kube = KubeClient()
 
-    coverage_days = estimate_coverage_days(prom)
+    with RUN_STATS.stage("coverage"):
+        coverage_days = estimate_coverage_days(prom)
+        # Recorded series stand in for the raw subqueries of the plain instant-query modes; the usage
+        # cache and range mode already fetch only a slice of raw data per run, so they take precedence.
+        prefer_recorded = env_bool("PREFER_RECORDING_RULES", True)
+        use_recorded = (
+            prefer_recorded
+            and usage_history is None
+            and collection_mode != "range"
+            and recording_rules_cover_window(prom, metrics_window, metrics_resolution)
+        )
+    if collection_mode == "range":
+        usage_source = "range"
+    elif usage_history is not None:
+        usage_source = "usage_cache"
+    else:
+        usage_source = "recording_rules" if use_recorded else "raw"
+    log(f"Usage source: {usage_source} (METRICS_COLLECTION_MODE={collection_mode})")
+    if prefer_recorded and usage_source in ("range", "usage_cache"):
+        log("Recorded series are not read while USAGE_CACHE_DIR is set or in range mode")
 
     alloc_cpu_m = 0.0
     alloc_mem_mi = 0.0
-    for node in kube.list_nodes():
+    with RUN_STATS.stage("discovery"):
+        nodes = kube.list_nodes()
+    for node in nodes:
         alloc = node.get("status", {}).get("allocatable", {})
         alloc_cpu_m += parse_cpu_to_m(alloc.get("cpu"))
         alloc_mem_mi += parse_mem_to_mi(alloc.get("memory"))
 
-    recommendations: list[dict] = []
-    containers_analyzed = 0
-    containers_with_data = 0
-    skipped_no_metrics = 0
-
-    total_current_req_cpu_m = 0.0
-    total_current_req_mem_mi = 0.0
-    total_recommended_req_cpu_m = 0.0
-    total_recommended_req_mem_mi = 0.0
-
-    for namespace in namespaces:
-        for kind in ("deployments", "statefulsets"):
-            workloads = kube.list_workloads(namespace, kind)
-            for workload in workloads:
-                meta = workload.get("metadata", {})
-                spec = workload.get("spec", {}).get("template", {}).get("spec", {})
-                replicas = safe_int((workload.get("spec", {}) or {}).get("replicas"), 1)
-                labels = meta.get("labels", {})
-                workload_name = meta.get("name", "unknown")
-                release = labels.get("app.kubernetes.io/instance", workload_name)
-                pod_regex = pod_regex_for_workload(workload_name, kind)
-
-                for container in spec.get("containers", []):
-                    containers_analyzed += 1
-                    container_name = container.get("name", "main")
-                    resources = container.get("resources", {})
-                    req = resources.get("requests", {})
-                    lim = resources.get("limits", {})
-
-                    cur_req_cpu = parse_cpu_to_m(req.get("cpu"))
-                    cur_req_mem = parse_mem_to_mi(req.get("memory"))
-                    cur_lim_cpu = parse_cpu_to_m(lim.get("cpu"))
-                    cur_lim_mem = parse_mem_to_mi(lim.get("memory"))
-
-                    # Budget and headroom checks should reflect real cluster footprint, not per-pod template values.
-                    total_current_req_cpu_m += cur_req_cpu * replicas
-                    total_current_req_mem_mi += cur_req_mem * replicas
-
-                    cpu_query = (
-                        f'quantile_over_time(0.95, rate(container_cpu_usage_seconds_total{{namespace="{namespace}",'
-                        f'pod=~"{pod_regex}",container="{container_name}",image!=""}}[5m])[{metrics_window}:{metrics_resolution}])'
-                    )
-                    mem_query = (
-                        f'quantile_over_time(0.95, container_memory_working_set_bytes{{namespace="{namespace}",'
-                        f'pod=~"{pod_regex}",container="{container_name}",image!=""}}[{metrics_window}:{metrics_resolution}])'
-                    )
-                    restart_query = (
-                        f'sum(increase(kube_pod_container_status_restarts_total{{namespace="{namespace}",'
-                        f'pod=~"{pod_regex}",container="{container_name}"}}[{metrics_window}]))'
-                    )
-                    throttled_periods_query = (
-                        f'sum(increase(container_cpu_cfs_throttled_periods_total{{namespace="{namespace}",'
-                        f'pod=~"{pod_regex}",container="{container_name}"}}[{cpu_throttle_window}]))'
-                    )
-                    cpu_periods_query = (
-                        f'sum(increase(container_cpu_cfs_periods_total{{namespace="{namespace}",'
-                        f'pod=~"{pod_regex}",container="{container_name}"}}[{cpu_throttle_window}]))'
-                    )
-
-                    cpu_p95_cores = prom.query_scalar(cpu_query)
-                    mem_p95_bytes = prom.query_scalar(mem_query)
-                    restart_lookback = prom.query_scalar(restart_query) or 0.0
-                    cpu_throttled_periods = prom.query_scalar(throttled_periods_query) or 0.0
-                    cpu_periods = prom.query_scalar(cpu_periods_query) or 0.0
-                    cpu_throttle_ratio = cpu_throttled_periods / cpu_periods if cpu_periods > 0.0 else 0.0
-
-                    if cpu_p95_cores is None and mem_p95_bytes is None:
-                        skipped_no_metrics += 1
-                        total_recommended_req_cpu_m += cur_req_cpu * replicas
-                        total_recommended_req_mem_mi += cur_req_mem * replicas
-                        continue
-
-                    containers_with_data += 1
-
-                    cpu_p95_m = (cpu_p95_cores or 0.0) * 1000.0
-                    mem_p95_mi = (mem_p95_bytes or 0.0) / (1024.0 * 1024.0)
-
-                    target_req_cpu = max(min_cpu_m, cpu_p95_m * (1.0 + request_buffer_percent / 100.0))
-                    target_req_mem = max(min_mem_mi, mem_p95_mi * (1.0 + request_buffer_percent / 100.0))
-                    target_lim_cpu = max(target_req_cpu * 2.0, cpu_p95_m * (1.0 + limit_buffer_percent / 100.0))
-                    target_lim_mem = max(target_req_mem * 1.5, mem_p95_mi * (1.0 + limit_buffer_percent / 100.0))
-
-                    notes: list[str] = []
-                    cpu_throttle_guard = (
-                        cur_lim_cpu > 0.0
-                        and cpu_throttle_ratio >= cpu_throttle_ratio_upsize_threshold
-                        and cpu_throttled_periods >= cpu_throttle_min_periods
-                    )
-                    if cpu_throttle_guard:
-                        throttle_step = 1.0 + (max_step_percent / 100.0)
-                        target_lim_cpu = max(target_lim_cpu, cur_lim_cpu * throttle_step)
-                        if cur_req_cpu > 0.0:
-                            target_req_cpu = max(target_req_cpu, min(cur_lim_cpu, cur_req_cpu * throttle_step))
-                        notes.append("cpu_throttle_guard")
-
-                    rec_req_cpu = recommend(cur_req_cpu, target_req_cpu, max_step_percent)
-                    rec_req_mem = recommend(cur_req_mem, target_req_mem, max_step_percent)
-                    rec_lim_cpu = recommend(cur_lim_cpu, target_lim_cpu, max_step_percent)
-                    rec_lim_mem = recommend(cur_lim_mem, target_lim_mem, max_step_percent)
-
-                    if restart_lookback > 0:
-                        if rec_req_mem < cur_req_mem:
-                            rec_req_mem = cur_req_mem
-                        if rec_lim_mem < cur_lim_mem:
-                            rec_lim_mem = cur_lim_mem
-                        notes.append("restart_guard")
-
-                    rec_req_cpu, rec_req_mem, rec_lim_cpu, rec_lim_mem = apply_service_tuning_policy(
-                        release,
-                        notes,
-                        cur_req_cpu,
-                        cur_req_mem,
-                        cur_lim_cpu,
-                        cur_lim_mem,
-                        rec_req_cpu,
-                        rec_req_mem,
-                        rec_lim_cpu,
-                        rec_lim_mem,
-                    )
-
-                    if release in downscale_exclude:
-                        if rec_req_cpu < cur_req_cpu:
-                            rec_req_cpu = cur_req_cpu
-                        if rec_req_mem < cur_req_mem:
-                            rec_req_mem = cur_req_mem
-                        if rec_lim_cpu < cur_lim_cpu:
-                            rec_lim_cpu = cur_lim_cpu
-                        if rec_lim_mem < cur_lim_mem:
-                            rec_lim_mem = cur_lim_mem
-                        notes.append("downscale_excluded")
-
-                    total_recommended_req_cpu_m += rec_req_cpu * replicas
-                    total_recommended_req_mem_mi += rec_req_mem * replicas
-
-                    req_cpu_delta = pct_delta(cur_req_cpu, rec_req_cpu)
-                    req_mem_delta = pct_delta(cur_req_mem, rec_req_mem)
-                    lim_cpu_delta = pct_delta(cur_lim_cpu, rec_lim_cpu)
-                    lim_mem_delta = pct_delta(cur_lim_mem, rec_lim_mem)
-
-                    req_cpu_abs_delta = abs(rec_req_cpu - cur_req_cpu)
-                    req_mem_abs_delta = abs(rec_req_mem - cur_req_mem)
-                    lim_cpu_abs_delta = abs(rec_lim_cpu - cur_lim_cpu)
-                    lim_mem_abs_delta = abs(rec_lim_mem - cur_lim_mem)
-
-                    significant_change = any(
-                        (
-                            is_material_delta(
-                                req_cpu_delta,
-                                req_cpu_abs_delta,
-                                deadband_percent,
-                                deadband_cpu_m,
-                            ),
-                            is_material_delta(
-                                req_mem_delta,
-                                req_mem_abs_delta,
-                                deadband_percent,
-                                deadband_mem_mi,
-                            ),
-                            is_material_delta(
-                                lim_cpu_delta,
-                                lim_cpu_abs_delta,
-                                deadband_percent,
-                                deadband_cpu_m,
-                            ),
-                            is_material_delta(
-                                lim_mem_delta,
-                                lim_mem_abs_delta,
-                                deadband_percent,
-                                deadband_mem_mi,
-                            ),
-                        )
-                    )
-                    if not significant_change:
-                        continue
-
-                    up_signal = (
-                        (rec_req_cpu > cur_req_cpu)
-                        and is_material_delta(
-                            req_cpu_delta,
-                            req_cpu_abs_delta,
-                            deadband_percent,
-                            deadband_cpu_m,
-                        )
-                    ) or (
-                        (rec_req_mem > cur_req_mem)
-                        and is_material_delta(
-                            req_mem_delta,
-                            req_mem_abs_delta,
-                            deadband_percent,
-                            deadband_mem_mi,
-                        )
-                    )
-                    down_signal = (
-                        (rec_req_cpu < cur_req_cpu)
-                        and is_material_delta(
-                            req_cpu_delta,
-                            req_cpu_abs_delta,
-                            deadband_percent,
-                            deadband_cpu_m,
-                        )
-                    ) or (
-                        (rec_req_mem < cur_req_mem)
-                        and is_material_delta(
-                            req_mem_delta,
-                            req_mem_abs_delta,
-                            deadband_percent,
-                            deadband_mem_mi,
-                        )
-                    )
-
-                    limit_up_signal = (
-                        (rec_lim_cpu > cur_lim_cpu)
-                        and is_material_delta(
-                            lim_cpu_delta,
-                            lim_cpu_abs_delta,
-                            deadband_percent,
-                            deadband_cpu_m,
-                        )
-                    ) or (
-                        (rec_lim_mem > cur_lim_mem)
-                        and is_material_delta(
-                            lim_mem_delta,
-                            lim_mem_abs_delta,
-                            deadband_percent,
-                            deadband_mem_mi,
-                        )
-                    )
-
-                    if up_signal or limit_up_signal:
-                        action = "upsize"
-                    elif down_signal:
-                        action = "downsize"
-                    else:
-                        action = "no-change"
-
-                    recommendations.append(
-                        {
-                            "namespace": namespace,
-                            "kind": kind[:-1],
-                            "workload": workload_name,
-                            "release": release,
-                            "replicas": replicas,
-                            "container": container_name,
-                            "restarts_window": round(restart_lookback, 2),
-                            "cpu_p95_m": round(cpu_p95_m, 1),
-                            "mem_p95_mi": round(mem_p95_mi, 1),
-                            "cpu_throttle_ratio": round(cpu_throttle_ratio, 3),
-                            "cpu_throttled_periods": round(cpu_throttled_periods, 1),
-                            "current": {
-                                "requests": {
-                                    "cpu": fmt_cpu_m(cur_req_cpu),
-                                    "memory": fmt_mem_mi(cur_req_mem),
-                                },
-                                "limits": {
-                                    "cpu": fmt_cpu_m(cur_lim_cpu),
-                                    "memory": fmt_mem_mi(cur_lim_mem),
-                                },
-                            },
-                            "recommended": {
-                                "requests": {
-                                    "cpu": fmt_cpu_m(rec_req_cpu),
-                                    "memory": fmt_mem_mi(rec_req_mem),
-                                },
-                                "limits": {
-                                    "cpu": fmt_cpu_m(rec_lim_cpu),
-                                    "memory": fmt_mem_mi(rec_lim_mem),
-                                },
-                            },
-                            "delta_percent": {
-                                "requests_cpu": round(req_cpu_delta, 1),
-                                "requests_memory": round(req_mem_delta, 1),
-                                "limits_cpu": round(lim_cpu_delta, 1),
-                                "limits_memory": round(lim_mem_delta, 1),
-                            },
-                            "action": action,
-                            "notes": notes,
-                        }
-                    )
+    executor = PromQueryExecutor(
+        env_int("PROM_QUERY_CONCURRENCY", 4),
+        rate_per_second=env_float("PROM_QUERY_RATE_PER_SECOND", 0.0),
+        budget_seconds=env_float("PROM_QUERY_BUDGET_SECONDS", 1200.0),
+    )
+    # Range mode's chunks are bounded by PROM_RANGE_CHUNK_STEPS instead; every other usage fetch adapts.
+    governor = (
+        open_resolution_governor(metrics_resolution, executor.concurrency, executor.budget_seconds)
+        if collection_mode != "range"
+        else None
+    )
+    fetcher = UsageFetcher(
+        prom,
+        executor,
+        collection_mode,
+        metrics_window,
+        metrics_resolution,
+        cpu_throttle_window,
+        usage_history,
+        governor,
+        use_recorded,
+        range_steps,
+        range_chunk_steps,
+        metrics_since,
+        throttle_since,
+    )
+    settings = {
+        "max_step_percent": max_step_percent,
+        "request_buffer_percent": request_buffer_percent,
+        "limit_buffer_percent": limit_buffer_percent,
+        "min_cpu_m": min_cpu_m,
+        "min_mem_mi": min_mem_mi,
+        "deadband_percent": deadband_percent,
+        "deadband_cpu_m": deadband_cpu_m,
+        "deadband_mem_mi": deadband_mem_mi,
+        "cpu_throttle_ratio_upsize_threshold": cpu_throttle_ratio_upsize_threshold,
+        "cpu_throttle_min_periods": cpu_throttle_min_periods,
+    }
 
-    recommendations.sort(
-        key=lambda item: (
-            item.get("action") != "upsize",
-            -(item.get("restarts_window", 0.0)),
-            -max(
-                abs(item.get("delta_percent", {}).get("requests_memory", 0.0)),
-                abs(item.get("delta_percent", {}).get("limits_memory", 0.0)),
-                abs(item.get("delta_percent", {}).get("requests_cpu", 0.0)),
-                abs(item.get("delta_percent", {}).get("limits_cpu", 0.0)),
-            ),
+    reuse = None
+    if fingerprints is not None:
+        sources = {
+            "metrics_window": metrics_window,
+            "cpu_throttle_window": cpu_throttle_window,
+            "collection_mode": collection_mode,
+            "usage_source": usage_source,
+        }
+        reuse = ReportFingerprints(
+            previous_fingerprints or {},
+            recommendation_policy_digest(settings, downscale_exclude, metrics_resolution, sources),
+            max(0.0, env_float("REPORT_REUSE_MAX_AGE_HOURS", 6.0)) * 3600.0,
         )
-    )
+
+    # discover -> fetch -> recommend -> aggregate: containers stream through the stages one at a time.
+    stages = ReportStages(("discover", "fetch", "recommend", "aggregate", "render"))
+    try:
+        with RUN_STATS.stage("usage"):
+            targets = stages.stage("discover", discover_targets(kube, namespaces, workloads))
+            if reuse is not None:
+                targets = reuse.match(targets)
+            targets = stages.stage("fetch", fetcher.fetch(targets))
+            rows = stages.stage(
+                "recommend",
+                recommend_targets(
+                    targets,
+                    settings,
+                    downscale_exclude,
+                    metrics_resolution,
+                    max(1, env_int("RECOMMEND_BATCH_SIZE", RECOMMEND_BATCH_SIZE)),
+                    reuse,
+                ),
+            )
+            with stages.timed("aggregate"):
+                totals = aggregate_recommendations(rows)
+    finally:
+        executor.shutdown()
+    recommendations = totals.pop("recommendations")
+    if reuse is not None:
+        fingerprints.clear()
+        fingerprints.update(reuse.records)
+        log(f"Incremental report: reused {reuse.reused} of {len(reuse.records)} container recommendations")
 
     budget = {
         "allocatable": {
@@ -1286,12 +4684,26 @@ def build_report() -> tuple[dict, str]:
             "memory": fmt_mem_mi(alloc_mem_mi),
         },
         "current_requests_percent_of_allocatable": {
-            "cpu": round((total_current_req_cpu_m / alloc_cpu_m) * 100.0, 1) if alloc_cpu_m > 0 else None,
-            "memory": round((total_current_req_mem_mi / alloc_mem_mi) * 100.0, 1) if alloc_mem_mi > 0 else None,
+            "cpu": (
+                round((totals["total_current_requests_cpu_m"] / alloc_cpu_m) * 100.0, 1) if alloc_cpu_m > 0 else None
+            ),
+            "memory": (
+                round((totals["total_current_requests_memory_mi"] / alloc_mem_mi) * 100.0, 1)
+                if alloc_mem_mi > 0
+                else None
+            ),
         },
         "recommended_requests_percent_of_allocatable": {
-            "cpu": round((total_recommended_req_cpu_m / alloc_cpu_m) * 100.0, 1) if alloc_cpu_m > 0 else None,
-            "memory": round((total_recommended_req_mem_mi / alloc_mem_mi) * 100.0, 1) if alloc_mem_mi > 0 else None,
+            "cpu": (
+                round((totals["total_recommended_requests_cpu_m"] / alloc_cpu_m) * 100.0, 1)
+                if alloc_cpu_m > 0
+                else None
+            ),
+            "memory": (
+                round((totals["total_recommended_requests_memory_mi"] / alloc_mem_mi) * 100.0, 1)
+                if alloc_mem_mi > 0
+                else None
+            ),
         },
     }
 
@@ -1300,7 +4712,9 @@ def build_report() -> tuple[dict, str]:
         "generated_at": generated_at,
         "mode": mode,
         "metrics_window": metrics_window,
+        "metrics_resolution": metrics_resolution,
         "metrics_coverage_days_estimate": coverage_days,
+        "usage_source": usage_source,
         "policy": {
             "max_step_percent": round(max_step_percent, 2),
             "request_buffer_percent": round(request_buffer_percent, 2),
@@ -1318,39 +4732,66 @@ def build_report() -> tuple[dict, str]:
             },
         },
         "summary": {
-            "containers_analyzed": containers_analyzed,
-            "containers_with_metrics": containers_with_data,
-            "containers_skipped_no_metrics": skipped_no_metrics,
+            "containers_analyzed": totals["containers_analyzed"],
+            "containers_with_metrics": totals["containers_with_metrics"],
+            "containers_skipped_no_metrics": totals["containers_skipped_no_metrics"],
+            "containers_from_recording_rules": fetcher.containers_from_recording_rules,
+            "containers_reused": reuse.reused if reuse is not None else 0,
+            "containers_degraded_resolution": sum(
+                1 for item in recommendations if "degraded_resolution" in item["notes"]
+            ),
             "recommendation_count": len(recommendations),
             "upsize_count": sum(1 for item in recommendations if item["action"] == "upsize"),
             "downsize_count": sum(1 for item in recommendations if item["action"] == "downsize"),
             "no_change_count": sum(1 for item in recommendations if item["action"] == "no-change"),
-            "total_current_requests_cpu_m": round(total_current_req_cpu_m, 1),
-            "total_current_requests_memory_mi": round(total_current_req_mem_mi, 1),
-            "total_recommended_requests_cpu_m": round(total_recommended_req_cpu_m, 1),
-            "total_recommended_requests_memory_mi": round(total_recommended_req_mem_mi, 1),
+            "total_current_requests_cpu_m": round(totals["total_current_requests_cpu_m"], 1),
+            "total_current_requests_memory_mi": round(totals["total_current_requests_memory_mi"], 1),
+            "total_recommended_requests_cpu_m": round(totals["total_recommended_requests_cpu_m"], 1),
+            "total_recommended_requests_memory_mi": round(totals["total_recommended_requests_memory_mi"], 1),
         },
         "budget": budget,
         "recommendations": recommendations,
     }
+    if governor is not None:
+        report["resolution_governor"] = governor.stats()
+
+    with stages.timed("render"):
+        markdown = render_report_markdown(report)
+    RUN_STATS.record_pipeline(stages.seconds)
+    log("Report stages: " + " ".join(f"{name}={seconds:.2f}s" for name, seconds in stages.seconds.items()))
+    return report, markdown
+
+
+def render_report_markdown(report: dict) -> str:
+    """Render stage: the markdown summary, from the report document alone so it can be re-run from latest.json."""
+
+    policy = report.get("policy", {})
+    summary = report.get("summary", {})
+    budget = report.get("budget", {})
+    recommendations = report.get("recommendations", [])
+    governor = report.get("resolution_governor") or {}
+    coarsened = governor.get("final_resolution", report["metrics_resolution"]) != report["metrics_resolution"]
 
     lines = [
         "# Resource Advisor Report",
         "",
-        f"- Generated at: `{generated_at}`",
-        f"- Mode: `{mode}`",
-        f"- Metrics window: `{metrics_window}`",
-        f"- Metrics coverage estimate: `{coverage_days}` days",
-        f"- Containers analyzed: **{containers_analyzed}**",
-        f"- Containers with metrics: **{containers_with_data}**",
+        f"- Generated at: `{report['generated_at']}`",
+        f"- Mode: `{report['mode']}`",
+        f"- Metrics window: `{report['metrics_window']}`",
+        f"- Metrics resolution: `{report['metrics_resolution']}`"
+        + (f" (coarsened to `{governor['final_resolution']}` under the run-time budget)" if coarsened else ""),
+        f"- Metrics coverage estimate: `{report['metrics_coverage_days_estimate']}` days",
+        f"- Usage source: `{report.get('usage_source', 'unknown')}`",
+        f"- Containers analyzed: **{summary.get('containers_analyzed', 0)}**",
+        f"- Containers with metrics: **{summary.get('containers_with_metrics', 0)}**",
         f"- Recommendations: **{len(recommendations)}**",
         "",
         "## Cluster Budget Snapshot",
         "",
         (
             "- Deadband policy: "
-            f"`{deadband_percent}%` or CPU delta `>= {deadband_cpu_m}m` or "
-            f"Memory delta `>= {deadband_mem_mi}Mi`"
+            f"`{policy.get('deadband_percent')}%` or CPU delta `>= {policy.get('deadband_cpu_m')}m` or "
+            f"Memory delta `>= {policy.get('deadband_mem_mi')}Mi`"
         ),
         f"- Allocatable CPU: `{budget['allocatable']['cpu']}`",
         f"- Allocatable Memory: `{budget['allocatable']['memory']}`",
@@ -1373,7 +4814,7 @@ def build_report() -> tuple[dict, str]:
         "",
     ]
 
-    if coverage_days < 14:
+    if report["metrics_coverage_days_estimate"] < 14:
         lines.append("## Data Maturity Notice")
         lines.append("")
         lines.append(
@@ -1408,17 +4849,248 @@ def build_report() -> tuple[dict, str]:
     else:
         lines.extend(["## Recommendations", "", "No significant tuning deltas were identified in this run."])
 
-    markdown = "\n".join(lines) + "\n"
-    return report, markdown
+    return "\n".join(lines) + "\n"
+
+
+class NodeProjection:
+    """Projected per-node request totals for apply planning, updated in place one candidate at a time.
+
+    apply() adds a candidate's per-pod deltas to the nodes it is placed on and returns an undo log;
+    rollback() restores those nodes exactly. The cluster totals and the nodes over allocatable or over
+    their advisory budget are kept up to date as nodes change, so trying a candidate costs the nodes it
+    touches rather than a pass over the cluster. With a SchedulerSimulation, candidates that name their
+    pods are re-placed by the simulation instead, and the pods' nodes and requests are tracked (and
+    rolled back) alongside the node totals.
+    """
+
+    SLACK = 0.01
+
+    def __init__(
+        self,
+        node_alloc: dict[str, dict[str, float]],
+        node_cpu_budget: dict[str, float],
+        node_mem_budget: dict[str, float],
+        node_current: dict[str, dict[str, float]],
+        simulation: SchedulerSimulation | None = None,
+    ) -> None:
+        self.node_alloc = node_alloc
+        self.node_cpu_budget = node_cpu_budget
+        self.node_mem_budget = node_mem_budget
+        self.simulation = simulation
+        self.pods = dict(simulation.pods) if simulation is not None else {}
+        self.order = {name: index for index, name in enumerate(node_alloc)}
+        self.by_node: dict[str, dict[str, float]] = {}
+        self.total_cpu_m = 0.0
+        self.total_mem_mi = 0.0
+        self.hard_over: dict[str, tuple[float, float]] = {}
+        self.advisory_over: dict[str, tuple[float, float]] = {}
+        for name in node_alloc:
+            current = node_current.get(name) or {}
+            self.by_node[name] = {
+                "cpu_m": float(current.get("cpu_m", 0.0) or 0.0),
+                "mem_mi": float(current.get("mem_mi", 0.0) or 0.0),
+            }
+            self.total_cpu_m += self.by_node[name]["cpu_m"]
+            self.total_mem_mi += self.by_node[name]["mem_mi"]
+            self.refresh(name)
+
+    def refresh(self, name: str) -> None:
+        cpu = self.by_node[name]["cpu_m"]
+        mem = self.by_node[name]["mem_mi"]
+        hard_over_cpu = max(0.0, cpu - self.node_alloc[name]["cpu_m"])
+        hard_over_mem = max(0.0, mem - self.node_alloc[name]["mem_mi"])
+        if hard_over_cpu > self.SLACK or hard_over_mem > self.SLACK:
+            self.hard_over[name] = (hard_over_cpu, hard_over_mem)
+        else:
+            self.hard_over.pop(name, None)
+        advisory_over_cpu = max(0.0, cpu - self.node_cpu_budget.get(name, 0.0))
+        advisory_over_mem = max(0.0, mem - self.node_mem_budget.get(name, 0.0))
+        if advisory_over_cpu > self.SLACK or advisory_over_mem > self.SLACK:
+            self.advisory_over[name] = (advisory_over_cpu, advisory_over_mem)
+        else:
+            self.advisory_over.pop(name, None)
+
+    def apply(
+        self,
+        counts: dict[str, int],
+        delta_cpu_per_pod: float,
+        delta_mem_per_pod: float,
+        pod_ids: tuple[str, ...] = (),
+    ) -> list[tuple]:
+        undo: list[tuple] = [("", self.total_cpu_m, self.total_mem_mi)]
+        if self.simulation is not None and pod_ids:
+            changes, moved = self.simulation.place(self, pod_ids, delta_cpu_per_pod, delta_mem_per_pod)
+            undo.append((None, {pod_id: self.pods[pod_id] for pod_id in moved}))
+            self.pods.update(moved)
+        else:
+            changes = {
+                name: [delta_cpu_per_pod * float(count), delta_mem_per_pod * float(count)]
+                for name, count in counts.items()
+            }
+        for name, (delta_cpu, delta_mem) in changes.items():
+            values = self.by_node[name]
+            undo.append((name, values["cpu_m"], values["mem_mi"]))
+            values["cpu_m"] += delta_cpu
+            values["mem_mi"] += delta_mem
+            self.total_cpu_m += values["cpu_m"] - undo[-1][1]
+            self.total_mem_mi += values["mem_mi"] - undo[-1][2]
+            self.refresh(name)
+        return undo
+
+    def rollback(self, undo: list[tuple]) -> None:
+        for entry in reversed(undo[1:]):
+            if entry[0] is None:
+                self.pods.update(entry[1])
+                continue
+            name, cpu, mem = entry
+            self.by_node[name] = {"cpu_m": cpu, "mem_mi": mem}
+            self.refresh(name)
+        _name, self.total_cpu_m, self.total_mem_mi = undo[0]
+
+    def placement(self, pod_ids: tuple[str, ...]) -> dict[str, int]:
+        counts: dict[str, int] = {}
+        for pod_id in pod_ids:
+            node = self.pods[pod_id][0]
+            counts[node] = counts.get(node, 0) + 1
+        return {name: counts[name] for name in sorted(counts)}
+
+    def fits(self) -> bool:
+        return not self.hard_over
+
+    def overages(self, overs: dict[str, tuple[float, float]]) -> dict[str, dict[str, float]]:
+        return {
+            name: {"over_cpu_m": round(overs[name][0], 1), "over_mem_mi": round(overs[name][1], 1)}
+            for name in sorted(overs, key=self.order.__getitem__)
+        }
+
+    def details(self, cpu_budget_m: float, mem_budget_mi: float) -> dict:
+        return {
+            "total_cpu_m": round(self.total_cpu_m, 1),
+            "total_mem_mi": round(self.total_mem_mi, 1),
+            "advisory_cpu_budget_m": round(cpu_budget_m, 1),
+            "advisory_mem_budget_mi": round(mem_budget_mi, 1),
+            "over_advisory_cpu_m": round(max(0.0, self.total_cpu_m - cpu_budget_m), 1),
+            "over_advisory_mem_mi": round(max(0.0, self.total_mem_mi - mem_budget_mi), 1),
+            "hard_over_by_node": self.overages(self.hard_over),
+            "advisory_over_by_node": self.overages(self.advisory_over),
+        }
+
+
+APPLY_SELECTION_MODES = ("greedy", "solver")
+
+
+def solve_apply_selection(
+    moves: list[tuple[dict[str, int], float, float, tuple[str, ...]]],
+    values: list[tuple[int, float]],
+    projection: NodeProjection,
+    max_changes: int,
+    incumbent: list[int],
+    time_limit_seconds: float,
+) -> tuple[list[int], dict]:
+    """Branch and bound over apply candidates for the best selection within the change cap.
+
+    moves[i] is candidate i's NodeProjection.apply() arguments (placement counts, per-pod deltas, pods) and values[i]
+    its (restart_guard, impact_score). Candidates are taken in the greedy planner's order and each one
+    taken must still fit the node projection, so every selection found is one the greedy pass could
+    apply in sequence. Selections are ranked by restart-guard count first, then total impact. Branches
+    try "take" before "skip" and only strictly better selections replace the incumbent, so ties keep the
+    earlier one. The search starts from incumbent (the greedy selection) and, once time_limit_seconds
+    runs out, returns the best selection found so far.
+    """
+
+    count = len(moves)
+    slots_cap = max(0, max_changes)
+    guard_suffix = [0] * (count + 1)
+    top_suffix: list[list[float]] = [[] for _ in range(count + 1)]
+    for index in range(count - 1, -1, -1):
+        guard_suffix[index] = guard_suffix[index + 1] + values[index][0]
+        top_suffix[index] = sorted(top_suffix[index + 1] + [values[index][1]], reverse=True)[:slots_cap]
+
+    def better(guards: int, impact: float, than: tuple[int, float]) -> bool:
+        return guards > than[0] or (guards == than[0] and impact > than[1] + 1e-9)
+
+    best = list(incumbent)
+    best_score = (sum(values[index][0] for index in best), sum(values[index][1] for index in best))
+    chosen: list[int] = []
+    started = time.monotonic()
+    deadline = started + max(0.0, time_limit_seconds)
+    state = {"explored": 0, "timed_out": False}
+
+    def search(index: int, guards: int, impact: float) -> None:
+        nonlocal best, best_score
+        state["explored"] += 1
+        if state["explored"] % 256 == 0 and time.monotonic() > deadline:
+            state["timed_out"] = True
+        if state["timed_out"]:
+            return
+        if better(guards, impact, best_score):
+            best, best_score = list(chosen), (guards, impact)
+        slots = slots_cap - len(chosen)
+        if index >= count or slots <= 0:
+            return
+        bound_guards = guards + min(slots, guard_suffix[index])
+        bound_impact = impact + sum(top_suffix[index][:slots])
+        if not better(bound_guards, bound_impact, best_score):
+            return
+
+        undo = projection.apply(*moves[index])
+        if projection.fits():
+            chosen.append(index)
+            search(index + 1, guards + values[index][0], impact + values[index][1])
+            chosen.pop()
+        projection.rollback(undo)
+        search(index + 1, guards, impact)
+
+    search(0, 0, 0.0)
+    return best, {
+        "status": "time_limit" if state["timed_out"] else "optimal",
+        "nodes_explored": state["explored"],
+        "seconds": round(time.monotonic() - started, 3),
+    }
 
 
-def build_apply_plan(report: dict) -> tuple[dict, str]:
+# Environment read by build_apply_plan; the exporter's what-if API accepts overrides for these.
+APPLY_PLAN_SETTINGS = (
+    "MAX_REQUESTS_PERCENT_CPU",
+    "MAX_REQUESTS_PERCENT_MEMORY",
+    "MAX_APPLY_CHANGES_PER_RUN",
+    "APPLY_SELECTION_MODE",
+    "APPLY_SOLVER_TIME_LIMIT_SECONDS",
+    "NODE_FIT_PLACEMENT",
+    "NODE_FIT_SCORING_STRATEGY",
+    "MIN_DATA_DAYS_FOR_UPSIZE",
+    "MIN_DATA_DAYS_FOR_DOWNSIZE",
+    "MIN_APPLY_DOWNSIZE_CPU_M_TOTAL",
+    "MIN_APPLY_DOWNSIZE_MEMORY_MI_TOTAL",
+    "MIN_APPLY_UPSIZE_CPU_M_TOTAL",
+    "MIN_APPLY_UPSIZE_MEMORY_MI_TOTAL",
+    "ALLOW_APPLY_LIMIT_DOWNSIZE",
+    "ALLOW_DEGRADED_RESOLUTION_DOWNSIZE",
+    "APPLY_ALLOWLIST",
+    "DOWNSCALE_EXCLUDE",
+)
+
+
+def build_apply_plan(report: dict, kube: KubeClient | None = None) -> tuple[dict, str]:
     recommendations = report.get("recommendations", [])
     coverage_days = float(report.get("metrics_coverage_days_estimate") or 0.0)
 
     cpu_budget_pct = env_float("MAX_REQUESTS_PERCENT_CPU", 60.0)
     mem_budget_pct = env_float("MAX_REQUESTS_PERCENT_MEMORY", 65.0)
     max_changes = env_int("MAX_APPLY_CHANGES_PER_RUN", 5)
+    selection_mode = (getenv("APPLY_SELECTION_MODE") or "greedy").strip().lower() or "greedy"
+    if selection_mode not in APPLY_SELECTION_MODES:
+        log(f"Invalid APPLY_SELECTION_MODE: {selection_mode!r}; using greedy")
+        selection_mode = "greedy"
+    solver_time_limit = max(0.0, env_float("APPLY_SOLVER_TIME_LIMIT_SECONDS", 2.0))
+    placement_mode = (getenv("NODE_FIT_PLACEMENT") or "current").strip().lower() or "current"
+    if placement_mode not in NODE_FIT_PLACEMENT_MODES:
+        log(f"Invalid NODE_FIT_PLACEMENT: {placement_mode!r}; using current")
+        placement_mode = "current"
+    scoring_strategy = (getenv("NODE_FIT_SCORING_STRATEGY") or "LeastAllocated").strip() or "LeastAllocated"
+    if scoring_strategy not in SCHEDULER_SCORING_STRATEGIES:
+        log(f"Invalid NODE_FIT_SCORING_STRATEGY: {scoring_strategy!r}; using LeastAllocated")
+        scoring_strategy = "LeastAllocated"
     min_days_upsize = env_float("MIN_DATA_DAYS_FOR_UPSIZE", 14.0)
     min_days_downsize = env_float("MIN_DATA_DAYS_FOR_DOWNSIZE", 14.0)
     min_downsize_cpu_m_total = max(0.0, env_float("MIN_APPLY_DOWNSIZE_CPU_M_TOTAL", 50.0))
@@ -1426,6 +5098,7 @@ def build_apply_plan(report: dict) -> tuple[dict, str]:
     min_upsize_cpu_m_total = max(0.0, env_float("MIN_APPLY_UPSIZE_CPU_M_TOTAL", 25.0))
     min_upsize_mem_mi_total = max(0.0, env_float("MIN_APPLY_UPSIZE_MEMORY_MI_TOTAL", 128.0))
     allow_limit_downsize = env_bool("ALLOW_APPLY_LIMIT_DOWNSIZE", False)
+    allow_degraded_downsize = env_bool("ALLOW_DEGRADED_RESOLUTION_DOWNSIZE", False)
 
     allowlist_default = ",".join(DEFAULT_APPLY_ALLOWLIST)
     allowlist = set(env_list("APPLY_ALLOWLIST", allowlist_default))
@@ -1434,9 +5107,9 @@ def build_apply_plan(report: dict) -> tuple[dict, str]:
     # Phase 2 (Capacity-Aware v2):
     # Use live pod request footprint for budget and headroom checks (includes replicas + all namespaces),
     # and simulate node-fit using current pod placement.
-    kube = KubeClient()
-    nodes = kube.list_nodes()
-    pods = kube.list_pods()
+    kube = kube or KubeClient()
+    with RUN_STATS.stage("apply_plan"):
+        nodes = kube.list_nodes()
 
     node_alloc: dict[str, dict[str, float]] = {}
     alloc_cpu_m = 0.0
@@ -1452,8 +5125,11 @@ def build_apply_plan(report: dict) -> tuple[dict, str]:
         alloc_cpu_m += cpu_m
         alloc_mem_mi += mem_mi
 
-    node_current, current_cpu_m, current_mem_mi = build_node_request_footprint(pods)
-    placement_index = build_pod_placement_index(pods)
+    simulation = SchedulerSimulation(nodes, scoring_strategy) if placement_mode == "scheduler" else None
+    with RUN_STATS.stage("apply_plan"):
+        placement_index, node_current, current_cpu_m, current_mem_mi = summarize_pods(
+            kube.iter_pods(field_selector=ACTIVE_POD_FIELD_SELECTOR), simulation
+        )
 
     cpu_budget_m = alloc_cpu_m * (cpu_budget_pct / 100.0)
     mem_budget_mi = alloc_mem_mi * (mem_budget_pct / 100.0)
@@ -1473,17 +5149,28 @@ def build_apply_plan(report: dict) -> tuple[dict, str]:
     skipped = []
     next_up: list[dict] = []
 
+    first_node = min(node_alloc, default="")
+
     def placement_counts_for(item: dict) -> dict[str, int]:
         placement = (item.get("placement") or {}) if isinstance(item.get("placement"), dict) else {}
         placement = {k: int(v) for k, v in placement.items() if k in node_alloc and int(v) > 0}
         if placement:
             return placement
         # Fall back to placing on the first allocatable node.
-        if node_alloc:
-            first = sorted(node_alloc.keys())[0]
-            return {first: safe_int(item.get("replicas"), 1)}
+        if first_node:
+            return {first_node: safe_int(item.get("replicas"), 1)}
         return {}
 
+    def move_for(item: dict) -> tuple[dict[str, int], float, float, tuple[str, ...]]:
+        """NodeProjection.apply() arguments for a candidate; its pods are re-placed in scheduler mode."""
+
+        return (
+            placement_counts_for(item),
+            float(item.get("delta", {}).get("requests_cpu_m", 0.0) or 0.0),
+            float(item.get("delta", {}).get("requests_memory_mi", 0.0) or 0.0),
+            simulation.pods_for(item["release"], item["container"]) if simulation is not None else (),
+        )
+
     def queue_next_up(item: dict, reason: str) -> None:
         if len(next_up) >= 10:
             return
@@ -1498,65 +5185,6 @@ def build_apply_plan(report: dict) -> tuple[dict, str]:
             }
         )
 
-    def apply_item_to_projection(
-        proj_by_node: dict[str, dict[str, float]],
-        item: dict,
-    ) -> dict[str, dict[str, float]]:
-        next_by_node = {k: {"cpu_m": v.get("cpu_m", 0.0), "mem_mi": v.get("mem_mi", 0.0)} for k, v in proj_by_node.items()}
-        counts = placement_counts_for(item)
-        delta_cpu_per_pod = float(item.get("delta", {}).get("requests_cpu_m", 0.0) or 0.0)
-        delta_mem_per_pod = float(item.get("delta", {}).get("requests_memory_mi", 0.0) or 0.0)
-        for node, count in counts.items():
-            next_by_node.setdefault(node, {"cpu_m": 0.0, "mem_mi": 0.0})
-            next_by_node[node]["cpu_m"] += delta_cpu_per_pod * float(count)
-            next_by_node[node]["mem_mi"] += delta_mem_per_pod * float(count)
-        return next_by_node
-
-    def totals_from_by_node(by_node: dict[str, dict[str, float]]) -> tuple[float, float]:
-        total_cpu = 0.0
-        total_mem = 0.0
-        for name, vals in by_node.items():
-            total_cpu += float(vals.get("cpu_m", 0.0) or 0.0)
-            total_mem += float(vals.get("mem_mi", 0.0) or 0.0)
-        return total_cpu, total_mem
-
-    def check_fit(by_node: dict[str, dict[str, float]]) -> tuple[bool, dict]:
-        total_cpu, total_mem = totals_from_by_node(by_node)
-        details = {
-            "total_cpu_m": round(total_cpu, 1),
-            "total_mem_mi": round(total_mem, 1),
-            "advisory_cpu_budget_m": round(cpu_budget_m, 1),
-            "advisory_mem_budget_mi": round(mem_budget_mi, 1),
-            "over_advisory_cpu_m": round(max(0.0, total_cpu - cpu_budget_m), 1),
-            "over_advisory_mem_mi": round(max(0.0, total_mem - mem_budget_mi), 1),
-            "hard_over_by_node": {},
-            "advisory_over_by_node": {},
-        }
-
-        ok = True
-
-        for name in node_alloc:
-            cpu = float((by_node.get(name) or {}).get("cpu_m", 0.0) or 0.0)
-            mem = float((by_node.get(name) or {}).get("mem_mi", 0.0) or 0.0)
-            hard_over_cpu = max(0.0, cpu - node_alloc.get(name, {}).get("cpu_m", 0.0))
-            hard_over_mem = max(0.0, mem - node_alloc.get(name, {}).get("mem_mi", 0.0))
-            advisory_over_cpu = max(0.0, cpu - node_cpu_budget.get(name, 0.0))
-            advisory_over_mem = max(0.0, mem - node_mem_budget.get(name, 0.0))
-
-            if hard_over_cpu > 0.01 or hard_over_mem > 0.01:
-                ok = False
-                details["hard_over_by_node"][name] = {
-                    "over_cpu_m": round(hard_over_cpu, 1),
-                    "over_mem_mi": round(hard_over_mem, 1),
-                }
-            if advisory_over_cpu > 0.01 or advisory_over_mem > 0.01:
-                details["advisory_over_by_node"][name] = {
-                    "over_cpu_m": round(advisory_over_cpu, 1),
-                    "over_mem_mi": round(advisory_over_mem, 1),
-                }
-
-        return ok, details
-
     for rec in recommendations:
         release = rec.get("release", "")
         container = rec.get("container", "")
@@ -1749,6 +5377,15 @@ def build_apply_plan(report: dict) -> tuple[dict, str]:
         if "downscale_excluded" in notes and release in downscale_exclude:
             skipped.append({"reason": "downscale_excluded", "release": release, "container": container})
             continue
+        if "degraded_resolution" in notes and not allow_degraded_downsize:
+            # Coarser subquery steps can miss short peaks, so only trust them for growing requests.
+            skipped.append({
+                "reason": "degraded_resolution_blocks_downsize",
+                "metrics_resolution": rec.get("metrics_resolution"),
+                "release": release,
+                "container": container,
+            })
+            continue
         if coverage_days < min_days_downsize:
             skipped.append({
                 "reason": "insufficient_data_for_downsize",
@@ -1805,10 +5442,7 @@ def build_apply_plan(report: dict) -> tuple[dict, str]:
     )
 
     # Start projected state from live pod request footprint (node-aware).
-    projected_by_node = {name: {"cpu_m": 0.0, "mem_mi": 0.0} for name in node_alloc}
-    for name in node_alloc:
-        projected_by_node[name]["cpu_m"] = float((node_current.get(name) or {}).get("cpu_m", 0.0) or 0.0)
-        projected_by_node[name]["mem_mi"] = float((node_current.get(name) or {}).get("mem_mi", 0.0) or 0.0)
+    projection = NodeProjection(node_alloc, node_cpu_budget, node_mem_budget, node_current, simulation)
 
     selected: list[dict] = []
 
@@ -1829,6 +5463,7 @@ def build_apply_plan(report: dict) -> tuple[dict, str]:
         ("upsize_with_node_fit_under_advisory_pressure", deferred_upsizes),
     ]
 
+    skipped_before_selection = len(skipped)
     for selection_reason, candidates in selection_order:
         for item in candidates:
             if len(selected) >= max_changes:
@@ -1836,25 +5471,89 @@ def build_apply_plan(report: dict) -> tuple[dict, str]:
                 queue_next_up(item, selection_reason)
                 continue
 
-            test = apply_item_to_projection(projected_by_node, item)
-            ok, fit = check_fit(test)
-            if not ok:
+            undo = projection.apply(*move_for(item))
+            if not projection.fits():
                 skipped.append(
                     {
                         "reason": "node_capacity_block",
                         "release": item["release"],
                         "container": item["container"],
-                        "fit": fit,
+                        "fit": projection.details(cpu_budget_m, mem_budget_mi),
                     }
                 )
+                projection.rollback(undo)
                 continue
 
-            projected_by_node = test
             item["selection_reason"] = selection_reason
             selected.append(item)
 
-    projected_cpu_m, projected_mem_mi = totals_from_by_node(projected_by_node)
-    final_fit_ok, final_fit = check_fit(projected_by_node)
+    greedy_impact = sum(item["priority"]["impact_score"] for item in selected)
+    selection = {"mode": selection_mode, "greedy_impact_score": round(greedy_impact, 1)}
+    if selection_mode == "solver":
+        # Re-select over the same candidates and order; the solver starts from the greedy pick and can
+        # only replace it with a selection that guards more restarts or carries more impact.
+        ordered = [(reason, item) for reason, candidates in selection_order for item in candidates]
+        moves = [move_for(item) for _, item in ordered]
+        values = [(item["priority"]["restart_guard"], item["priority"]["impact_score"]) for _, item in ordered]
+        greedy_ids = {id(item) for item in selected}
+        greedy_indices = [index for index, (_, item) in enumerate(ordered) if id(item) in greedy_ids]
+        chosen, solver_stats = solve_apply_selection(
+            moves,
+            values,
+            NodeProjection(node_alloc, node_cpu_budget, node_mem_budget, node_current, simulation),
+            max_changes,
+            greedy_indices,
+            solver_time_limit,
+        )
+        selection.update(solver_stats)
+
+        if chosen != greedy_indices:
+            chosen_indices = set(chosen)
+            del skipped[skipped_before_selection:]
+            next_up.clear()
+            selected = []
+            projection = NodeProjection(node_alloc, node_cpu_budget, node_mem_budget, node_current, simulation)
+            for index, (selection_reason, item) in enumerate(ordered):
+                item.pop("selection_reason", None)
+                if index in chosen_indices:
+                    projection.apply(*moves[index])
+                    item["selection_reason"] = selection_reason
+                    selected.append(item)
+            # Candidates left out are checked against the solver's final projection.
+            for index, (selection_reason, item) in enumerate(ordered):
+                if index in chosen_indices:
+                    continue
+                undo = projection.apply(*moves[index])
+                if not projection.fits():
+                    skipped.append(
+                        {
+                            "reason": "node_capacity_block",
+                            "release": item["release"],
+                            "container": item["container"],
+                            "fit": projection.details(cpu_budget_m, mem_budget_mi),
+                        }
+                    )
+                else:
+                    skipped.append(
+                        {"reason": "not_selected_by_solver", "release": item["release"], "container": item["container"]}
+                    )
+                    queue_next_up(item, selection_reason)
+                projection.rollback(undo)
+
+        solver_impact = sum(item["priority"]["impact_score"] for item in selected)
+        selection["impact_score"] = round(solver_impact, 1)
+        selection["extra_impact_score"] = round(solver_impact - greedy_impact, 1)
+    selection["restart_guard_selected"] = sum(item["priority"]["restart_guard"] for item in selected)
+
+    if simulation is not None:
+        for item in selected:
+            pod_ids = simulation.pods_for(item["release"], item["container"])
+            if pod_ids:
+                item["simulated_placement"] = projection.placement(pod_ids)
+
+    projected_by_node = projection.by_node
+    projected_cpu_m, projected_mem_mi = projection.total_cpu_m, projection.total_mem_mi
+    final_fit_ok, final_fit = projection.fits(), projection.details(cpu_budget_m, mem_budget_mi)
     selected_reason_counts = count_by(selected, "selection_reason")
     skipped_reason_counts = count_by(skipped, "reason")
     planning_generated_at = dt.datetime.now(dt.timezone.utc).replace(microsecond=0).isoformat().replace("+00:00", "Z")
@@ -1875,6 +5574,7 @@ def build_apply_plan(report: dict) -> tuple[dict, str]:
             "min_apply_upsize_cpu_m_total": min_upsize_cpu_m_total,
             "min_apply_upsize_memory_mi_total": min_upsize_mem_mi_total,
             "allow_apply_limit_downsize": allow_limit_downsize,
+            "allow_degraded_resolution_downsize": allow_degraded_downsize,
             "downscale_exclude": sorted(downscale_exclude),
             "service_tuning_profiles": {
                 release: policy.get("profile")
@@ -1901,7 +5601,21 @@ def build_apply_plan(report: dict) -> tuple[dict, str]:
             "memory": advisory_mem_pressure,
         },
         "node_fit": {
-            "assumptions": "Node-fit simulation is based on current pod placement (by label app.kubernetes.io/instance) and current replica counts. Hard blocking uses allocatable node capacity; soft request budgets remain advisory posture signals only.",
+            "assumptions": (
+                "Node-fit simulation is based on current pod placement (by label app.kubernetes.io/instance) and current replica counts. Hard blocking uses allocatable node capacity; soft request budgets remain advisory posture signals only."
+                if simulation is None
+                else (
+                    "Node-fit simulation re-places each changed pod like kube-scheduler: nodeSelector, required node "
+                    f"affinity, taints/tolerations and resource fit filter nodes, and {scoring_strategy} scoring picks "
+                    "one. Pods that fit nowhere stay on their current node. Hard blocking uses allocatable node "
+                    "capacity; soft request budgets remain advisory posture signals only."
+                )
+            ),
+            "placement": (
+                {"mode": placement_mode, "scoring_strategy": scoring_strategy}
+                if simulation is not None
+                else {"mode": placement_mode}
+            ),
             "hard_fit_ok": final_fit_ok,
             "projected_overages": final_fit,
             "nodes": [
@@ -1927,6 +5641,7 @@ def build_apply_plan(report: dict) -> tuple[dict, str]:
                 for name in sorted(node_alloc.keys())
             ],
         },
+        "selection": selection,
         "selected_reason_counts": selected_reason_counts,
         "skipped_reason_counts": skipped_reason_counts,
         "selected": selected,
@@ -1973,6 +5688,14 @@ def build_apply_plan(report: dict) -> tuple[dict, str]:
         f"- Advisory memory pressure active: `{plan['advisory_pressure']['memory']}`",
         "",
     ]
+    if selection_mode == "solver":
+        md_lines[-1:-1] = [
+            (
+                f"- Change selection: `solver` ({selection['status']}, {selection['nodes_explored']} nodes); "
+                f"impact `{selection['impact_score']}` vs greedy `{selection['greedy_impact_score']}` "
+                f"(+`{selection['extra_impact_score']}`)"
+            ),
+        ]
 
     if selected:
         md_lines.extend(
@@ -2592,7 +6315,27 @@ def main() -> int:
     configmap_name = os.getenv("CONFIGMAP_NAME", "resource-advisor-latest")
 
     log(f"Starting resource advisor in mode={mode}")
-    report, report_md = build_report()
+    kube = KubeClient()
+    previous_fingerprints: dict[str, dict] = {}
+    if "--full" in sys.argv[1:] or env_bool("REPORT_FULL_RECOMPUTE", False):
+        log("Full run requested; recomputing every container")
+    else:
+        with RUN_STATS.stage("fingerprints"):
+            _status, previous_data, _manifest = read_report_configmaps(
+                kube, configmap_namespace, configmap_name, [REPORT_FINGERPRINTS_DOCUMENT]
+            )
+        try:
+            loaded = json.loads(previous_data.get(REPORT_FINGERPRINTS_DOCUMENT) or "{}")
+        except json.JSONDecodeError as exc:
+            log(f"Ignoring unreadable {REPORT_FINGERPRINTS_DOCUMENT}: {exc}")
+            loaded = {}
+        previous_fingerprints = loaded if isinstance(loaded, dict) else {}
+    fingerprints: dict[str, dict] = {}
+    rule_workloads: list[tuple[str, str, str]] = []
+    report, report_md = build_report(previous_fingerprints, fingerprints, rule_workloads)
+    fingerprints_json = json.dumps(fingerprints, sort_keys=True, separators=(",", ":"))
+    with RUN_STATS.stage("recording_rules"):
+        recording_rules = render_recording_rules(rule_workloads)
     apply_plan = None
     apply_plan_md = ""
     apply_execution = None
@@ -2602,45 +6345,98 @@ def main() -> int:
         apply_execution = open_or_update_apply_pr(report, apply_plan)
         apply_plan["execution"] = apply_execution
         apply_plan_md = append_apply_execution_markdown(apply_plan_md, apply_execution)
+        report["run_stats"] = RUN_STATS.summary()
         write_outputs(
             report,
             report_md,
             extras={
                 "apply-plan.json": json.dumps(apply_plan, indent=2, sort_keys=True) + "\n",
                 "apply-plan.md": apply_plan_md,
+                "recording-rules.yaml": recording_rules,
+                REPORT_FINGERPRINTS_DOCUMENT: fingerprints_json,
             },
         )
     else:
-        write_outputs(report, report_md)
+        report["run_stats"] = RUN_STATS.summary()
+        write_outputs(
+            report,
+            report_md,
+            extras={"recording-rules.yaml": recording_rules, REPORT_FINGERPRINTS_DOCUMENT: fingerprints_json},
+        )
 
-    kube = KubeClient()
-    existing_data = kube.get_configmap_data(configmap_namespace, configmap_name)
+    storage = os.getenv("REPORT_STORAGE", "sharded").strip().lower() or "sharded"
+    if storage not in REPORT_STORAGE_MODES:
+        raise ValueError(f"REPORT_STORAGE must be one of {', '.join(REPORT_STORAGE_MODES)}, got {storage!r}")
+    # Sharded documents are compressed anyway, so they are stored compact rather than indented.
+    json_options: dict[str, Any] = {"indent": 2} if storage == "plain" else {"separators": (",", ":")}
+    written = ["latest.json", "latest.md", "recording-rules.yaml", REPORT_FINGERPRINTS_DOCUMENT]
+    if apply_plan is not None:
+        written += ["apply-plan.json", "apply-plan.md"]
+    # Only documents this run does not rewrite are read back, to carry them over. One that cannot be
+    # read fails the run rather than being dropped from the report.
+    existing_meta: dict[str, Any] = {}
+    _status, existing_data, previous_manifest = read_report_configmaps(
+        kube,
+        configmap_namespace,
+        configmap_name,
+        [doc for doc in REPORT_DOCUMENTS if doc not in written],
+        meta=existing_meta,
+        strict=True,
+    )
+    known_hash = str((existing_meta.get("annotations") or {}).get(CONFIGMAP_CONTENT_HASH_ANNOTATION) or "")
     data = dict(existing_data)
     data.update(
         {
-            "latest.json": json.dumps(report, indent=2, sort_keys=True),
+            "latest.json": json.dumps(report, sort_keys=True, **json_options),
             "latest.md": report_md,
             "lastRunAt": report.get("generated_at", ""),
             "mode": mode,
+            "recording-rules.yaml": recording_rules,
+            REPORT_FINGERPRINTS_DOCUMENT: fingerprints_json,
         }
     )
     if apply_plan is not None:
         data.update(
             {
-                "apply-plan.json": json.dumps(apply_plan, indent=2, sort_keys=True),
+                "apply-plan.json": json.dumps(apply_plan, sort_keys=True, **json_options),
                 "apply-plan.md": apply_plan_md,
                 "applyLastRunAt": str((apply_execution or {}).get("executed_at") or report.get("generated_at") or ""),
             }
         )
-    kube.upsert_configmap(
-        namespace=configmap_namespace,
-        name=configmap_name,
-        data=data,
-    )
+    # A run over unchanged input differs only in timestamps and run stats; those alone do not force a write.
+    content_hash = report_content_hash(data)
+    if storage == "sharded":
+        # Documents still stored plain by an earlier layout are dropped once they move into shards.
+        legacy_keys = [] if previous_manifest else [doc for doc in REPORT_DOCUMENTS if doc in existing_data]
+        write_report_configmaps(
+            kube, configmap_namespace, configmap_name, data, previous_manifest, known_hash, legacy_keys, content_hash
+        )
+    else:
+        if kube.upsert_configmap(
+            namespace=configmap_namespace,
+            name=configmap_name,
+            data=data,
+            known_hash=known_hash,
+            remove_keys=[REPORT_MANIFEST_KEY] if previous_manifest else [],
+            content_hash=content_hash,
+        ):
+            delete_stale_report_shards(kube, configmap_namespace, previous_manifest, [])
 
     if mode == "pr":
         log("Mode=pr is disabled. Reports are published to ConfigMap only.")
 
+    pool_stats = HTTP_POOL.stats()
+    log(
+        "HTTP pool: "
+        f"requests={pool_stats['requests']} opened={pool_stats['connections_opened']} "
+        f"reused={pool_stats['connections_reused']} tls_handshakes={pool_stats['tls_handshakes']}"
+    )
+    run_stats = report["run_stats"]
+    log(
+        f"Run stats: calls={run_stats['calls']} errors={run_stats['errors']} "
+        f"bytes={run_stats['total_bytes']} duration={run_stats['duration_seconds']}s"
+    )
+
     log("Resource advisor run completed")
     return 0
 
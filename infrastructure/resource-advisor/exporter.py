@@ -5,15 +5,18 @@ resource-advisor-exporter
 Expose the latest resource-advisor report (stored in a ConfigMap) as:
 - Prometheus metrics at /metrics
 - Raw report at /latest.json and /latest.md
+- What-if apply planning against the cached report at POST /api/what-if
 
 This keeps the system observable in Grafana without needing to wait for PRs.
 """
 
 from __future__ import annotations
 
+import collections
 import datetime as dt
 import html
 import json
+import math
 import os
 import re
 import threading
@@ -221,6 +224,17 @@ class State:
         self.last_apply_md: str = ""
         self.last_apply_run_at: str = ""
         self.apply_schedule: dict[str, Any] = {}
+        self.configmap_version: str = ""
+        self.document_hashes: dict[str, str] = {}
+        self.document_texts: dict[str, str] = {}
+        self.live_refreshed_at: float = 0.0
+        self.report_unchanged_total: int = 0
+        self.report_parses_total: int = 0
+        self.cluster_snapshot: ClusterSnapshot | None = None
+        self.what_if_generation: int = 0
+        self.what_if_cache: collections.OrderedDict[str, dict[str, Any]] = collections.OrderedDict()
+        self.what_if_requests_total: int = 0
+        self.what_if_cache_hits_total: int = 0
 
     def snapshot(self) -> dict[str, Any]:
         with self.lock:
@@ -240,34 +254,113 @@ class State:
                 "last_apply_md": self.last_apply_md,
                 "last_apply_run_at": self.last_apply_run_at,
                 "apply_schedule": self.apply_schedule,
+                "report_unchanged_total": self.report_unchanged_total,
+                "report_parses_total": self.report_parses_total,
+                "what_if_requests_total": self.what_if_requests_total,
+                "what_if_cache_hits_total": self.what_if_cache_hits_total,
             }
 
 
 STATE = State()
 
 
+class InformerCache:
+    """Watch-backed stand-in for the KubeClient reads the exporter makes on every refresh.
+
+    Pods (only those holding node resources), nodes, deployments, statefulsets and ReplicaSet metadata are
+    listed once and then followed with watches, so a refresh reads memory instead of relisting the cluster.
+    """
+
+    def __init__(self, kube: advisor.KubeClient) -> None:
+        self.kube = kube
+        self.stop = threading.Event()
+        self.informers = {
+            "pods": advisor.Informer(
+                kube,
+                "/api/v1/pods",
+                "pods",
+                {"fieldSelector": advisor.ACTIVE_POD_FIELD_SELECTOR},
+                project=advisor.compact_pod,
+            ),
+            "nodes": advisor.Informer(kube, "/api/v1/nodes", "nodes"),
+            "deployments": advisor.Informer(kube, "/apis/apps/v1/deployments", "deployments"),
+            "statefulsets": advisor.Informer(kube, "/apis/apps/v1/statefulsets", "statefulsets"),
+            "replicasets": advisor.Informer(kube, "/apis/apps/v1/replicasets", "replicasets", metadata_only=True),
+        }
+
+    def start(self) -> None:
+        for informer in self.informers.values():
+            informer.start(self.stop)
+
+    def synced(self) -> bool:
+        return all(informer.synced.is_set() for informer in self.informers.values())
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        return {resource: informer.stats() for resource, informer in self.informers.items()}
+
+    def list_nodes(self) -> list[dict]:
+        return self.informers["nodes"].items()
+
+    def iter_pods(self, namespace: str | None = None, field_selector: str = "", label_selector: str = ""):
+        # The pod informer already holds only ACTIVE_POD_FIELD_SELECTOR pods; other field selectors
+        # are not evaluated client-side.
+        for pod in self.informers["pods"].items(namespace):
+            labels = (pod.get("metadata") or {}).get("labels") or {}
+            if not label_selector or advisor.label_selector_matches(labels, label_selector):
+                yield pod
+
+    def list_pods(self, namespace: str | None = None, field_selector: str = "", label_selector: str = "") -> list[dict]:
+        return list(self.iter_pods(namespace, field_selector, label_selector))
+
+    def list_workloads(self, namespace: str, kind: str) -> list[dict]:
+        return self.informers[kind].items(namespace)
+
+    def list_replicasets(self, namespace: str) -> list[dict]:
+        return self.informers["replicasets"].items(namespace)
+
+
+INFORMERS: InformerCache | None = None
+
+
+class ClusterSnapshot:
+    """The nodes and active pods the last preflight planned against, kept for what-if requests.
+
+    The first read of each passes through to the live source and is kept; later reads replay it, so
+    what-if plans run against exactly the cluster state of the last refresh and make no API calls.
+    """
+
+    def __init__(self, source: advisor.KubeClient | InformerCache) -> None:
+        self.source = source
+        self.nodes: list[dict] | None = None
+        self.pods: list[dict] | None = None
+
+    def ready(self) -> bool:
+        return self.nodes is not None and self.pods is not None
+
+    def list_nodes(self) -> list[dict]:
+        if self.nodes is None:
+            self.nodes = list(self.source.list_nodes())
+        return self.nodes
+
+    def iter_pods(self, namespace: str | None = None, field_selector: str = "", label_selector: str = ""):
+        # build_apply_plan reads every ACTIVE_POD_FIELD_SELECTOR pod; that is the only read kept here.
+        if self.pods is None:
+            self.pods = list(self.source.iter_pods(field_selector=advisor.ACTIVE_POD_FIELD_SELECTOR))
+        return iter(self.pods)
+
+
 def _rec_key(namespace: str, workload: str, container: str) -> str:
     return f"{namespace}/{workload}/{container}"
 
 
-def _collect_live_restart_stats(kube: advisor.KubeClient, report: dict[str, Any] | None) -> dict[str, dict[str, Any]]:
+def _collect_live_restart_stats(
+    kube: advisor.KubeClient | InformerCache, report: dict[str, Any] | None
+) -> dict[str, dict[str, Any]]:
     if not report:
         return {}
 
     recommendations = [rec for rec in (report.get("recommendations") or []) if isinstance(rec, dict)]
-    namespaces = sorted({str(rec.get("namespace") or "") for rec in recommendations if rec.get("namespace")})
-    if not namespaces:
-        return {}
-
-    pods_by_namespace: dict[str, list[dict[str, Any]]] = {}
-    for namespace in namespaces:
-        status, payload = kube.request_json("GET", f"/api/v1/namespaces/{namespace}/pods")
-        if status != 200:
-            pods_by_namespace[namespace] = []
-            continue
-        pods_by_namespace[namespace] = list((payload or {}).get("items") or [])
-
-    stats: dict[str, dict[str, Any]] = {}
+    containers_by_owner: dict[tuple[str, str, str], set[str]] = {}
     for rec in recommendations:
         namespace = str(rec.get("namespace") or "")
         workload = str(rec.get("workload") or "")
@@ -275,86 +368,149 @@ def _collect_live_restart_stats(kube: advisor.KubeClient, report: dict[str, Any]
         kind = str(rec.get("kind") or "deployment").strip().lower()
         if not namespace or not workload or not container:
             continue
+        kind_plural = "statefulsets" if kind == "statefulset" else "deployments"
+        containers_by_owner.setdefault((namespace, kind_plural, workload), set()).add(container)
+    if not containers_by_owner:
+        return {}
 
-        key = _rec_key(namespace, workload, container)
-        if key in stats:
+    pods: list[dict[str, Any]] = []
+    replicasets: list[dict[str, Any]] = []
+    for namespace in sorted({namespace for namespace, _kind, _workload in containers_by_owner}):
+        pods.extend(kube.list_pods(namespace, field_selector=advisor.ACTIVE_POD_FIELD_SELECTOR))
+        replicasets.extend(kube.list_replicasets(namespace))
+    owners = advisor.PodOwnerIndex(containers_by_owner, pods, replicasets)
+
+    stats: dict[str, dict[str, Any]] = {
+        _rec_key(namespace, workload, container): {"current_restarts": 0, "matched_pods": 0, "latest_start_ts": 0.0}
+        for (namespace, _kind, workload), containers in containers_by_owner.items()
+        for container in containers
+    }
+    # One pass over the pods: each resolves to its workload through ownerReferences.
+    for pod in pods:
+        metadata = (pod.get("metadata") or {}) if isinstance(pod, dict) else {}
+        status = (pod.get("status") or {}) if isinstance(pod, dict) else {}
+        namespace = str(metadata.get("namespace") or "")
+        phase = str(status.get("phase") or "")
+        if phase in ("Succeeded", "Failed"):
+            continue
+        owner = owners.owner(namespace, str(metadata.get("name") or ""))
+        containers = containers_by_owner.get((namespace, *owner)) if owner else None
+        if not containers:
             continue
 
-        kind_plural = "statefulsets" if kind == "statefulset" else "deployments"
-        pod_name_re = re.compile(f"^{advisor.pod_regex_for_workload(workload, kind_plural)}$")
-
-        current_restarts = 0
-        matched_pods = 0
-        newest_start_ts = 0.0
-
-        for pod in pods_by_namespace.get(namespace, []):
-            metadata = (pod.get("metadata") or {}) if isinstance(pod, dict) else {}
-            status = (pod.get("status") or {}) if isinstance(pod, dict) else {}
-            pod_name = str(metadata.get("name") or "")
-            phase = str(status.get("phase") or "")
-            if phase in ("Succeeded", "Failed"):
-                continue
-            if not pod_name_re.match(pod_name):
-                continue
+        workload = owner[1]
+        start_ts = _utc_ts(str(status.get("startTime") or metadata.get("creationTimestamp") or ""))
+        for container in containers:
+            entry = stats[_rec_key(namespace, workload, container)]
+            entry["matched_pods"] += 1
+            entry["latest_start_ts"] = max(entry["latest_start_ts"], start_ts or 0.0)
 
-            matched_pods += 1
-            start_ts = _utc_ts(str(status.get("startTime") or metadata.get("creationTimestamp") or ""))
-            if start_ts:
-                newest_start_ts = max(newest_start_ts, start_ts)
-
-            for container_status in status.get("containerStatuses") or []:
-                if not isinstance(container_status, dict):
-                    continue
-                if str(container_status.get("name") or "") != container:
-                    continue
-                current_restarts += int(container_status.get("restartCount") or 0)
-
-        stats[key] = {
-            "current_restarts": current_restarts,
-            "matched_pods": matched_pods,
-            "latest_start_ts": newest_start_ts,
-        }
+        for container_status in status.get("containerStatuses") or []:
+            if not isinstance(container_status, dict):
+                continue
+            container = str(container_status.get("name") or "")
+            if container in containers:
+                entry = stats[_rec_key(namespace, workload, container)]
+                entry["current_restarts"] += int(container_status.get("restartCount") or 0)
 
     return stats
 
 
+EXPORTER_DOCUMENTS = ("latest.json", "latest.md", "apply-plan.json", "apply-plan.md")
+
+
+def _refresh_live_state(
+    kube: advisor.KubeClient, namespace: str, report: dict[str, Any] | None, refreshed_at: float
+) -> None:
+    """Recompute what depends on the live cluster rather than the report: restart stats, preflight, schedule."""
+
+    # Read pods/nodes from the watch caches once they have synced; relist directly until then.
+    cluster: advisor.KubeClient | InformerCache = INFORMERS if INFORMERS is not None and INFORMERS.synced() else kube
+    apply_schedule = _fetch_apply_schedule(kube, namespace)
+    live_restart_stats = _collect_live_restart_stats(cluster, report)
+    apply_plan: dict[str, Any] | None = None
+    snapshot = ClusterSnapshot(cluster)
+    if report:
+        try:
+            apply_plan, _ = advisor.build_apply_plan(report, kube=snapshot)
+        except Exception as exc:
+            advisor.log(f"Exporter failed to build apply plan snapshot: {exc}")
+    apply_plan_built_at = _utc_ts(str((apply_plan or {}).get("preflight_generated_at") or "")) or refreshed_at
+
+    with STATE.lock:
+        STATE.live_restart_stats = live_restart_stats
+        STATE.apply_plan = apply_plan
+        STATE.apply_plan_built_at = apply_plan_built_at
+        STATE.apply_schedule = apply_schedule
+        STATE.live_refreshed_at = refreshed_at
+        # What-if results are memoized per report and snapshot; a refresh replaces both.
+        STATE.cluster_snapshot = snapshot if snapshot.ready() else None
+        STATE.what_if_generation += 1
+        STATE.what_if_cache.clear()
+
+
 def fetch_configmap_once() -> None:
     namespace = os.getenv("CONFIGMAP_NAMESPACE", "monitoring").strip() or "monitoring"
     name = os.getenv("CONFIGMAP_NAME", "resource-advisor-latest").strip() or "resource-advisor-latest"
+    live_refresh_s = max(5.0, advisor.env_float("LIVE_REFRESH_SECONDS", 300.0))
+    advisor.RUN_STATS.reset()
     kube = advisor.KubeClient()
-    apply_schedule = _fetch_apply_schedule(kube, namespace)
-
-    status, payload = kube.request_json("GET", f"/api/v1/namespaces/{namespace}/configmaps/{name}")
+    with STATE.lock:
+        known_version = STATE.configmap_version
+        known_hashes = dict(STATE.document_hashes)
+        previous_texts = dict(STATE.document_texts)
+        report, last_apply_plan = STATE.report, STATE.last_apply_plan
+        live_refreshed_at = STATE.live_refreshed_at
+
+    # Only the shards holding the documents served here are fetched (never recording-rules.yaml), and
+    # nothing past the ConfigMap itself is read or parsed while its resourceVersion is unchanged.
+    meta: dict[str, Any] = {}
+    status, data, manifest = advisor.read_report_configmaps(
+        kube, namespace, name, EXPORTER_DOCUMENTS, known_version=known_version, known_hashes=known_hashes, meta=meta
+    )
     fetched_at = time.time()
+    if status == 304:
+        # The cached version was only recorded after a clean parse, so an unchanged ConfigMap is a good fetch
+        # and clears any error left by an earlier failed cycle.
+        with STATE.lock:
+            STATE.last_fetch_at = fetched_at
+            STATE.last_fetch_ok = True
+            STATE.last_error = ""
+            STATE.report_unchanged_total += 1
+        if fetched_at - live_refreshed_at >= live_refresh_s:
+            _refresh_live_state(kube, namespace, report, fetched_at)
+        return
     if status != 200:
         with STATE.lock:
             STATE.last_fetch_at = fetched_at
             STATE.last_fetch_ok = False
-            STATE.last_error = f"GET configmap {namespace}/{name} failed: {status} {payload}"
-            STATE.apply_schedule = apply_schedule
+            STATE.last_error = f"GET configmap {namespace}/{name} failed: {status}"
         return
 
-    data = (payload or {}).get("data", {}) or {}
-    latest_json = str(data.get("latest.json") or "")
-    latest_md = str(data.get("latest.md") or "")
-    apply_plan_json = str(data.get("apply-plan.json") or "")
-    apply_plan_md = str(data.get("apply-plan.md") or "")
-    apply_last_run_at = str(data.get("applyLastRunAt") or "")
-    mode = str(data.get("mode") or "")
-    last_run_at = str(data.get("lastRunAt") or "")
-
-    report, report_error = _load_json_object(latest_json, label="latest.json")
-    last_apply_plan, apply_error = _load_json_object(apply_plan_json, label="apply-plan.json")
+    files = manifest.get("files", {}) or {}
+    unchanged = {doc for doc in EXPORTER_DOCUMENTS if doc in files and known_hashes.get(doc) == files[doc]["sha256"]}
+    unreadable = [doc for doc in EXPORTER_DOCUMENTS if doc in files and doc not in data and doc not in unchanged]
+    if unreadable:
+        # Shards changed under the manifest we read; keep serving the previous report and retry next cycle.
+        with STATE.lock:
+            STATE.last_fetch_at = fetched_at
+            STATE.last_error = f"report documents unreadable, retrying: {', '.join(unreadable)}"
+        return
+    texts = {
+        doc: previous_texts.get(doc, "") if doc in unchanged else str(data.get(doc) or "") for doc in EXPORTER_DOCUMENTS
+    }
 
-    live_restart_stats = _collect_live_restart_stats(kube, report)
-    apply_plan: dict[str, Any] | None = None
-    if report:
-        try:
-            apply_plan, _ = advisor.build_apply_plan(report)
-        except Exception as exc:
-            advisor.log(f"Exporter failed to build apply plan snapshot: {exc}")
+    # Documents are parsed only when their text changed since the last cycle.
+    parses = 0
+    report_error = apply_error = ""
+    if report is None or texts["latest.json"] != previous_texts.get("latest.json"):
+        report, report_error = _load_json_object(texts["latest.json"], label="latest.json")
+        parses += bool(texts["latest.json"])
+    if texts["apply-plan.json"] != previous_texts.get("apply-plan.json"):
+        last_apply_plan, apply_error = _load_json_object(texts["apply-plan.json"], label="apply-plan.json")
+        parses += bool(texts["apply-plan.json"])
 
-    apply_plan_built_at = _utc_ts(str((apply_plan or {}).get("preflight_generated_at") or "")) or fetched_at
+    apply_last_run_at = str(data.get("applyLastRunAt") or "")
     last_apply_execution = (last_apply_plan or {}).get("execution") if isinstance(last_apply_plan, dict) else {}
     if not apply_last_run_at and isinstance(last_apply_execution, dict):
         apply_last_run_at = str(last_apply_execution.get("executed_at") or "")
@@ -365,17 +521,21 @@ def fetch_configmap_once() -> None:
         STATE.last_fetch_ok = len(parse_errors) == 0
         STATE.last_error = "; ".join(parse_errors)
         STATE.report = report
-        STATE.latest_json = latest_json
-        STATE.latest_md = latest_md
-        STATE.mode = mode
-        STATE.last_run_at = last_run_at
-        STATE.live_restart_stats = live_restart_stats
-        STATE.apply_plan = apply_plan
-        STATE.apply_plan_built_at = apply_plan_built_at
+        STATE.latest_json = texts["latest.json"]
+        STATE.latest_md = texts["latest.md"]
+        STATE.mode = str(data.get("mode") or "")
+        STATE.last_run_at = str(data.get("lastRunAt") or "")
         STATE.last_apply_plan = last_apply_plan
-        STATE.last_apply_md = apply_plan_md
+        STATE.last_apply_md = texts["apply-plan.md"]
         STATE.last_apply_run_at = apply_last_run_at
-        STATE.apply_schedule = apply_schedule
+        STATE.document_texts = texts
+        STATE.report_parses_total += parses
+        # After a parse error the version is left unrecorded, so the next cycle reads the ConfigMap again.
+        STATE.configmap_version = "" if parse_errors else str(meta.get("resourceVersion") or "")
+        STATE.document_hashes = {doc: files[doc]["sha256"] for doc in EXPORTER_DOCUMENTS if doc in files}
+
+    # The preflight is derived from the report, so a new report refreshes it straight away.
+    _refresh_live_state(kube, namespace, report, fetched_at)
 
 
 def refresher_loop() -> None:
@@ -394,6 +554,178 @@ def refresher_loop() -> None:
         time.sleep(refresh_s)
 
 
+WHAT_IF_MAX_BODY_BYTES = 64 * 1024
+# The server handles one request at a time, so a what-if solver run is held to this budget.
+WHAT_IF_SOLVER_TIME_LIMIT_SECONDS = 0.25
+WHAT_IF_PLAN_FIELDS = (
+    "constraints",
+    "current_requests",
+    "projected_requests_after_selected",
+    "budgets",
+    "advisory_pressure",
+    "selection",
+    "node_fit",
+    "selected_reason_counts",
+    "skipped_reason_counts",
+    "selected",
+    "next_up",
+    "skipped",
+)
+
+
+class WhatIfError(ValueError):
+    pass
+
+
+def _what_if_overrides(raw: object) -> dict[str, str]:
+    if raw is None:
+        return {}
+    if not isinstance(raw, dict):
+        raise WhatIfError("overrides must be an object of planner settings")
+    unknown = sorted(str(key) for key in raw if key not in advisor.APPLY_PLAN_SETTINGS)
+    if unknown:
+        allowed = ", ".join(advisor.APPLY_PLAN_SETTINGS)
+        raise WhatIfError(f"unknown overrides: {', '.join(unknown)}; allowed: {allowed}")
+    overrides: dict[str, str] = {}
+    for key, value in raw.items():
+        if isinstance(value, list):
+            overrides[key] = ",".join(str(item) for item in value)
+        elif isinstance(value, bool):
+            overrides[key] = "true" if value else "false"
+        elif isinstance(value, (str, int, float)):
+            overrides[key] = str(value)
+        else:
+            raise WhatIfError(f"override {key} must be a string, number, boolean or list")
+    return overrides
+
+
+WHAT_IF_QUANTITY_PARSERS = {"cpu": advisor.parse_cpu_to_m, "memory": advisor.parse_mem_to_mi}
+
+
+def _what_if_quantity(release: str, kind: str, resource: str, value: object) -> str:
+    """Return an edited quantity as a string once it parses to a positive amount of its resource."""
+
+    parse = WHAT_IF_QUANTITY_PARSERS.get(resource)
+    if parse is None:
+        raise WhatIfError(f"edit for {release} {kind}: unknown resource {resource!r}; use cpu or memory")
+    text = str(value).strip() if isinstance(value, (str, int, float)) and not isinstance(value, bool) else ""
+    try:
+        amount = parse(text) if text else 0.0
+    except (TypeError, ValueError):
+        amount = float("nan")
+    if not math.isfinite(amount) or amount <= 0.0:
+        raise WhatIfError(f"edit for {release} {kind}.{resource}: {value!r} is not a positive quantity")
+    return text
+
+
+def _what_if_report(report: dict[str, Any], raw: object) -> dict[str, Any]:
+    """Return report with per-release recommendation edits applied.
+
+    raw maps "release" (every container) or "release/container" to {"requests": {...}, "limits": {...}};
+    given quantities replace the recommended ones and the action is re-derived from the result.
+    """
+
+    if raw is None:
+        return report
+    if not isinstance(raw, dict):
+        raise WhatIfError("recommendations must be an object keyed by release or release/container")
+    recommendations = [rec for rec in report.get("recommendations") or [] if isinstance(rec, dict)]
+    known = {str(rec.get("release") or "") for rec in recommendations}
+    known |= {f"{rec.get('release') or ''}/{rec.get('container') or ''}" for rec in recommendations}
+    unknown = sorted(str(key) for key in raw if key not in known)
+    if unknown:
+        raise WhatIfError(f"no recommendations for: {', '.join(unknown)}")
+
+    edited = []
+    for rec in recommendations:
+        edit = raw.get(f"{rec.get('release') or ''}/{rec.get('container') or ''}", raw.get(rec.get("release") or ""))
+        if edit is None:
+            edited.append(rec)
+            continue
+        kinds = ("requests", "limits")
+        if not isinstance(edit, dict) or any(not isinstance(edit.get(kind) or {}, dict) for kind in kinds):
+            raise WhatIfError(f'edit for {rec.get("release")} must be {{"requests": {{...}}, "limits": {{...}}}}')
+        recommended = rec.get("recommended", {}) or {}
+        release = str(rec.get("release") or "")
+        new = {
+            kind: {
+                **(recommended.get(kind, {}) or {}),
+                **{k: _what_if_quantity(release, kind, k, v) for k, v in (edit.get(kind) or {}).items()},
+            }
+            for kind in kinds
+        }
+        current = rec.get("current", {}) or {}
+        deltas = [
+            parse(str(new[kind].get(resource) or "0")) - parse(str((current.get(kind, {}) or {}).get(resource) or "0"))
+            for kind in ("requests", "limits")
+            for resource, parse in (("cpu", advisor.parse_cpu_to_m), ("memory", advisor.parse_mem_to_mi))
+        ]
+        action = "upsize" if any(d > 0 for d in deltas) else "downsize" if any(d < 0 for d in deltas) else "no-change"
+        edited.append({**rec, "recommended": {**recommended, **new}, "action": action})
+    return {**report, "recommendations": edited}
+
+
+def run_what_if(body: bytes) -> tuple[int, dict[str, Any]]:
+    """Plan against the cached report and cluster snapshot with the request's overrides and edits.
+
+    Results are memoized per canonical request until the next live refresh replaces the snapshot.
+    """
+
+    try:
+        request = json.loads(body.decode("utf-8") or "{}")
+    except (UnicodeDecodeError, json.JSONDecodeError) as exc:
+        return 400, {"error": f"invalid JSON: {exc}"}
+    if not isinstance(request, dict):
+        return 400, {"error": "request body must be a JSON object"}
+    unknown = sorted(str(key) for key in request if key not in ("overrides", "recommendations"))
+    if unknown:
+        return 400, {"error": f"unknown fields: {', '.join(unknown)}"}
+    key = json.dumps(request, sort_keys=True, separators=(",", ":"))
+
+    with STATE.lock:
+        STATE.what_if_requests_total += 1
+        report, snapshot, generation = STATE.report, STATE.cluster_snapshot, STATE.what_if_generation
+        cached = STATE.what_if_cache.get(key)
+        if cached is not None:
+            STATE.what_if_cache.move_to_end(key)
+            STATE.what_if_cache_hits_total += 1
+            return 200, {**cached, "cached": True}
+    if not report or snapshot is None:
+        return 503, {"error": "no report or cluster snapshot cached yet; retry after the next refresh"}
+
+    try:
+        overrides = _what_if_overrides(request.get("overrides"))
+        what_if_report = _what_if_report(report, request.get("recommendations"))
+    except WhatIfError as exc:
+        return 400, {"error": str(exc)}
+    with advisor.env_overrides(overrides):
+        solver_limit = advisor.env_float("APPLY_SOLVER_TIME_LIMIT_SECONDS", WHAT_IF_SOLVER_TIME_LIMIT_SECONDS)
+    overrides["APPLY_SOLVER_TIME_LIMIT_SECONDS"] = str(min(solver_limit, WHAT_IF_SOLVER_TIME_LIMIT_SECONDS))
+
+    started = time.perf_counter()
+    try:
+        with advisor.env_overrides(overrides):
+            plan, _ = advisor.build_apply_plan(what_if_report, kube=snapshot)
+    except Exception as exc:
+        advisor.log(f"Exporter what-if plan failed: {exc}")
+        return 500, {"error": f"what-if plan failed: {exc}"}
+    result = {
+        "overrides": overrides,
+        "report_generated_at": report.get("generated_at"),
+        "preflight_generated_at": plan.get("preflight_generated_at"),
+        **{field: plan.get(field) for field in WHAT_IF_PLAN_FIELDS},
+        "elapsed_ms": round((time.perf_counter() - started) * 1000.0, 1),
+    }
+
+    cache_size = max(1, advisor.env_int("WHAT_IF_CACHE_SIZE", 64))
+    with STATE.lock:
+        if STATE.what_if_generation == generation:
+            STATE.what_if_cache[key] = result
+            while len(STATE.what_if_cache) > cache_size:
+                STATE.what_if_cache.popitem(last=False)
+    return 200, {**result, "cached": False}
+
+
 def _prom_line(name: str, labels: dict[str, str] | None, value: float) -> str:
     if labels:
         parts = []
@@ -416,6 +748,33 @@ def build_metrics() -> str:
     metrics.append("# TYPE resource_advisor_exporter_up gauge\n")
     metrics.append(_prom_line("resource_advisor_exporter_up", None, 1.0))
 
+    pool_stats = advisor.HTTP_POOL.stats()
+    for counter, help_text in (
+        ("requests", "HTTP requests sent through the shared keep-alive pool."),
+        ("connections_opened", "New HTTP connections opened by the shared pool."),
+        ("connections_reused", "Requests served on an idle pooled connection."),
+        ("tls_handshakes", "TLS handshakes performed by the shared pool."),
+    ):
+        name = f"resource_advisor_exporter_http_{counter}_total"
+        metrics.append(f"# HELP {name} {help_text}\n")
+        metrics.append(f"# TYPE {name} counter\n")
+        metrics.append(_prom_line(name, None, float(pool_stats.get(counter, 0))))
+
+    if INFORMERS is not None:
+        informer_stats = INFORMERS.stats()
+        for key, suffix, kind, help_text in (
+            ("objects", "objects", "gauge", "Objects held in the exporter's watch cache."),
+            ("relists", "relists_total", "counter", "Full lists performed by the exporter's watch cache."),
+            ("events", "events_total", "counter", "Watch events applied to the exporter's watch cache."),
+            ("bookmarks", "bookmarks_total", "counter", "Watch bookmarks received by the exporter's watch cache."),
+            ("errors", "errors_total", "counter", "Failed watches in the exporter's watch cache."),
+        ):
+            name = f"resource_advisor_exporter_informer_{suffix}"
+            metrics.append(f"# HELP {name} {help_text}\n")
+            metrics.append(f"# TYPE {name} {kind}\n")
+            for resource, stats in sorted(informer_stats.items()):
+                metrics.append(_prom_line(name, {"resource": resource}, float(stats.get(key) or 0)))
+
     metrics.append("# HELP resource_advisor_report_fetch_success Whether the last ConfigMap fetch succeeded.\n")
     metrics.append("# TYPE resource_advisor_report_fetch_success gauge\n")
     metrics.append(_prom_line("resource_advisor_report_fetch_success", None, 1.0 if snap["last_fetch_ok"] else 0.0))
@@ -424,6 +783,32 @@ def build_metrics() -> str:
     metrics.append("# TYPE resource_advisor_report_last_fetch_timestamp_seconds gauge\n")
     metrics.append(_prom_line("resource_advisor_report_last_fetch_timestamp_seconds", None, float(snap["last_fetch_at"] or 0.0)))
 
+    for name, key, help_text in (
+        (
+            "resource_advisor_exporter_report_unchanged_total",
+            "report_unchanged_total",
+            "Refreshes that found the report ConfigMap resourceVersion unchanged and parsed nothing.",
+        ),
+        (
+            "resource_advisor_exporter_report_parses_total",
+            "report_parses_total",
+            "Report documents decoded from JSON by the exporter.",
+        ),
+        (
+            "resource_advisor_exporter_what_if_requests_total",
+            "what_if_requests_total",
+            "Requests to the what-if planning API.",
+        ),
+        (
+            "resource_advisor_exporter_what_if_cache_hits_total",
+            "what_if_cache_hits_total",
+            "What-if requests answered from the memoized results for the current snapshot.",
+        ),
+    ):
+        metrics.append(f"# HELP {name} {help_text}\n")
+        metrics.append(f"# TYPE {name} counter\n")
+        metrics.append(_prom_line(name, None, float(snap[key] or 0)))
+
     last_run_ts = _utc_ts(str(report.get("generated_at") or snap["last_run_at"] or ""))
     if last_run_ts is not None:
         metrics.append("# HELP resource_advisor_last_run_timestamp_seconds Unix timestamp when the report was generated.\n")
@@ -436,6 +821,44 @@ def build_metrics() -> str:
         metrics.append("# TYPE resource_advisor_metrics_coverage_days gauge\n")
         metrics.append(_prom_line("resource_advisor_metrics_coverage_days", None, float(cov)))
 
+    run_stats = report.get("run_stats")
+    if isinstance(run_stats, dict):
+        for key, suffix, help_text in (
+            ("duration_seconds", "duration_seconds", "Wall-clock duration of the last advisor run."),
+            ("calls", "calls", "Prometheus and Kubernetes calls made by the last advisor run."),
+            ("errors", "errors", "Failed Prometheus and Kubernetes calls in the last advisor run."),
+            ("total_bytes", "response_bytes", "Decoded response bytes read by the last advisor run."),
+        ):
+            name = f"resource_advisor_run_{suffix}"
+            metrics.append(f"# HELP {name} {help_text}\n")
+            metrics.append(f"# TYPE {name} gauge\n")
+            metrics.append(_prom_line(name, None, float(run_stats.get(key) or 0.0)))
+
+        families = run_stats.get("families") or {}
+        metrics.append("# HELP resource_advisor_run_query_latency_seconds Per-family call latency in the last advisor run.\n")
+        metrics.append("# TYPE resource_advisor_run_query_latency_seconds gauge\n")
+        for family, row in sorted(families.items()):
+            for quantile, key in (("0.5", "p50_seconds"), ("0.95", "p95_seconds"), ("1", "max_seconds")):
+                labels = {"family": str(family), "quantile": quantile}
+                metrics.append(_prom_line("resource_advisor_run_query_latency_seconds", labels, float(row.get(key) or 0.0)))
+        for key, suffix, help_text in (
+            ("calls", "query_calls", "Calls per family in the last advisor run."),
+            ("errors", "query_errors", "Failed calls per family in the last advisor run."),
+            ("bytes", "query_response_bytes", "Decoded response bytes per family in the last advisor run."),
+            ("series", "query_series", "Series or items returned per family in the last advisor run."),
+            ("total_seconds", "query_seconds", "Summed call latency per family in the last advisor run."),
+        ):
+            name = f"resource_advisor_run_{suffix}"
+            metrics.append(f"# HELP {name} {help_text}\n")
+            metrics.append(f"# TYPE {name} gauge\n")
+            for family, row in sorted(families.items()):
+                metrics.append(_prom_line(name, {"family": str(family)}, float(row.get(key) or 0.0)))
+
+        metrics.append("# HELP resource_advisor_run_stage_seconds Summed call latency per advisor stage in the last run.\n")
+        metrics.append("# TYPE resource_advisor_run_stage_seconds gauge\n")
+        for stage, row in sorted((run_stats.get("stages") or {}).items()):
+            metrics.append(_prom_line("resource_advisor_run_stage_seconds", {"stage": str(stage)}, float(row.get("seconds") or 0.0)))
+
     recs = report.get("recommendations") or []
     try:
         recs_len = float(len(recs))
@@ -1388,6 +1811,22 @@ class Handler(BaseHTTPRequestHandler):
         code, content_type, body = self._resolve_response()
         self._send(code, content_type, body, include_body=False)
 
+    def do_POST(self) -> None:
+        path = (self.path or "").split("?", 1)[0]
+        if path != "/api/what-if":
+            self._send(404, "text/plain; charset=utf-8", b"not found\n")
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or "0")
+        except ValueError:
+            length = -1
+        if length < 0 or length > WHAT_IF_MAX_BODY_BYTES:
+            code, payload = 413, {"error": f"body must be at most {WHAT_IF_MAX_BODY_BYTES} bytes"}
+        else:
+            code, payload = run_what_if(self.rfile.read(length))
+        body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        self._send(code, "application/json; charset=utf-8", body)
+
     def log_message(self, fmt: str, *args: Any) -> None:  # noqa: ANN401
         # Keep logs quiet; Kubernetes will still have readiness/liveness probes.
         advisor.log(f"exporter: {self.address_string()} {fmt % args}")
@@ -1397,6 +1836,11 @@ def main() -> int:
     listen = os.getenv("LISTEN_ADDR", "0.0.0.0").strip() or "0.0.0.0"
     port = int(os.getenv("PORT", "8081") or "8081")
 
+    global INFORMERS
+    if advisor.env_bool("EXPORTER_INFORMERS", True):
+        INFORMERS = InformerCache(advisor.KubeClient())
+        INFORMERS.start()
+
     # Prime cache once before serving.
     try:
         fetch_configmap_once()
@@ -0,0 +1,95 @@
+"""Throughput of the recommendation engine over a synthetic fleet of containers.
+
+    python3 tests/bench_recommendations.py [containers] [repeats]
+
+Times recommend_columns with NumPy (when installed) and with the pure-Python fallback, and checks
+that both produce the same recommendations.
+"""
+
+import json
+import random
+import sys
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+import advisor
+
+SETTINGS = {
+    "max_step_percent": 25.0,
+    "request_buffer_percent": 30.0,
+    "limit_buffer_percent": 60.0,
+    "min_cpu_m": 25.0,
+    "min_mem_mi": 64.0,
+    "deadband_percent": 10.0,
+    "deadband_cpu_m": 25.0,
+    "deadband_mem_mi": 64.0,
+    "cpu_throttle_ratio_upsize_threshold": 0.20,
+    "cpu_throttle_min_periods": 100.0,
+}
+RELEASES = ("sonarr", "radarr", "jellyfin", "immich", "grafana", "homepage", "vaultwarden", "")
+
+
+def synthetic_columns(count: int, seed: int = 0) -> dict[str, list]:
+    """Containers spread across the guard paths: unset requests, throttling, restarts, floors, exclusions."""
+
+    rng = random.Random(seed)
+    columns: dict[str, list] = {name: [] for name in advisor.RECOMMENDATION_INPUTS}
+    for _ in range(count):
+        cur_req_cpu = rng.choice((0.0, 10.0, 50.0, 100.0, 250.0, 1000.0, rng.uniform(1.0, 2000.0)))
+        cur_req_mem = rng.choice((0.0, 64.0, 128.0, 512.0, 2048.0, rng.uniform(1.0, 4096.0)))
+        cpu_periods = rng.choice((0.0, 50.0, 1000.0, rng.uniform(0.0, 20000.0)))
+        cpu_throttled_periods = rng.uniform(0.0, cpu_periods)
+        row = {
+            "release": rng.choice(RELEASES),
+            "degraded_resolution": rng.random() < 0.1,
+            "cur_req_cpu": cur_req_cpu,
+            "cur_req_mem": cur_req_mem,
+            "cur_lim_cpu": rng.choice((0.0, cur_req_cpu, cur_req_cpu * 2.0, rng.uniform(0.0, 4000.0))),
+            "cur_lim_mem": rng.choice((0.0, cur_req_mem, cur_req_mem * 1.5, rng.uniform(0.0, 8192.0))),
+            "cpu_p95_m": rng.choice((0.0, cur_req_cpu / 1.3, rng.uniform(0.0, 2500.0), float("nan"))),
+            "mem_p95_mi": rng.choice((0.0, cur_req_mem / 1.3, rng.uniform(0.0, 5000.0))),
+            "restarts": rng.choice((0.0, 0.0, 0.0, 1.0, rng.uniform(0.0, 10.0))),
+            "cpu_throttled_periods": cpu_throttled_periods,
+            "cpu_throttle_ratio": cpu_throttled_periods / cpu_periods if cpu_periods > 0.0 else 0.0,
+        }
+        for name in advisor.RECOMMENDATION_INPUTS:
+            columns[name].append(row[name])
+    return columns
+
+
+def best_of(repeats: int, columns: dict[str, list]) -> tuple[float, dict[str, list]]:
+    best = float("inf")
+    results: dict[str, list] = {}
+    for _ in range(repeats):
+        started = time.perf_counter()
+        results = advisor.recommend_columns(columns, SETTINGS, set(advisor.DEFAULT_DOWNSCALE_EXCLUDE))
+        best = min(best, time.perf_counter() - started)
+    return best, results
+
+
+def main() -> int:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    columns = synthetic_columns(count)
+
+    timings = {}
+    with patch.object(advisor, "numpy", None):
+        timings["python"], expected = best_of(repeats, columns)
+    if advisor.numpy is not None:
+        timings["numpy"], results = best_of(repeats, columns)
+        if json.dumps(results) != json.dumps(expected):
+            print("numpy and pure-Python recommendations differ", file=sys.stderr)
+            return 1
+
+    for engine, seconds in timings.items():
+        print(f"{engine:>6}: {count} containers in {seconds * 1000.0:8.1f} ms ({count / seconds:12,.0f} containers/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
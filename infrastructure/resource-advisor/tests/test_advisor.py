@@ -1,6 +1,15 @@
+import gzip
+import json
 import os
+import re
+import socket
 import sys
+import tempfile
+import threading
+import time
 import unittest
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 from unittest.mock import patch
 
@@ -9,19 +18,209 @@ if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
 import advisor
+from bench_recommendations import SETTINGS, synthetic_columns
 
 
 class FakeKubeClient:
-    def __init__(self, nodes, pods):
+    def __init__(self, nodes, pods, workloads=None):
         self._nodes = nodes
         self._pods = pods
+        self._workloads = workloads or {}
 
     def list_nodes(self):
         return self._nodes
 
-    def list_pods(self, namespace=None):
+    def list_pods(self, namespace=None, field_selector="", label_selector=""):
         return self._pods
 
+    def iter_pods(self, namespace=None, field_selector="", label_selector=""):
+        return iter(self._pods)
+
+    def list_workloads(self, namespace, kind):
+        return self._workloads.get((namespace, kind), [])
+
+
+class ConfigMapKubeClient(advisor.KubeClient):
+    """Serves ConfigMap GET/DELETE/PATCH from memory, recording each call as (method, name).
+
+    Server-side apply replaces only the keys the advisor's field manager applied before, like the
+    API server; keys written by an older update-based writer survive it.
+    """
+
+    def __init__(self, configmaps=None):
+        super().__init__()
+        self.configmaps = configmaps or {}
+        self.applied_keys = {}
+        self.calls = []
+        self.fail_next = []
+
+    def request_json(self, method, path, body=None, content_type="application/json"):
+        parsed = urllib.parse.urlsplit(path)
+        name = parsed.path.rsplit("/", 1)[-1]
+        self.calls.append((method, name))
+        if self.fail_next:
+            return self.fail_next.pop(0), {"kind": "Status"}
+        if method == "GET":
+            if name not in self.configmaps:
+                return 404, {"kind": "Status", "code": 404}
+            return 200, json.loads(json.dumps(self.configmaps[name]))
+        if method == "DELETE":
+            return (200, {}) if self.configmaps.pop(name, None) is not None else (404, {})
+        if method == "PATCH" and content_type == "application/apply-patch+yaml":
+            query = dict(urllib.parse.parse_qsl(parsed.query))
+            assert query == {"fieldManager": "resource-advisor", "force": "true"}, query
+            created = name not in self.configmaps
+            current = self.configmaps.setdefault(name, {"metadata": {"name": name}, "data": {}, "binaryData": {}})
+            owned = self.applied_keys.get(name, set())
+            for field in ("data", "binaryData"):
+                kept = {key: value for key, value in current.get(field, {}).items() if key not in owned}
+                current[field] = {**kept, **(body.get(field) or {})}
+            current["metadata"]["annotations"] = body["metadata"]["annotations"]
+            self.applied_keys[name] = set(body.get("data") or {}) | set(body.get("binaryData") or {})
+            return (201 if created else 200), current
+        if method == "PATCH" and content_type == "application/merge-patch+json":
+            current = self.configmaps[name]
+            for key, value in body["data"].items():
+                if value is None:
+                    current["data"].pop(key, None)
+            return 200, current
+        raise AssertionError(f"unexpected {method} {path}")
+
+
+class FakePromClient:
+    """Answers the advisor's usage queries from (field, pod, container, value) samples."""
+
+    FIELD_METRICS = (
+        ("cpu_p95_cores", "container_cpu_usage_seconds_total"),
+        ("mem_p95_bytes", "container_memory_working_set_bytes"),
+        ("restarts", "kube_pod_container_status_restarts_total"),
+        ("throttled_periods", "container_cpu_cfs_throttled_periods_total"),
+        ("cfs_periods", "container_cpu_cfs_periods_total"),
+    )
+
+    def __init__(self, samples, coverage_days=14.5, recorded=None, recorded_days=0.0, series_days=None):
+        self.samples = samples
+        self.coverage_days = coverage_days
+        self.recorded = recorded or []
+        self.recorded_days = recorded_days
+        # Per-(kind, workload, container) recorded history; unlisted series default to recorded_days.
+        self.series_days = series_days or {}
+        self.queries = []
+        self.ranges = []
+
+    def _recorded_vector(self, query):
+        if "timestamp(count(" in query:
+            return [({}, self.recorded_days * 86400.0)] if self.recorded_days else []
+        if "timestamp(resource_advisor:" in query:
+            series = sorted({(kind, workload, container) for _field, kind, workload, container, _v in self.recorded})
+            return [
+                (
+                    {"namespace": "default", "kind": kind, "workload": workload, "container": container},
+                    self.series_days.get((kind, workload, container), self.recorded_days) * 86400.0,
+                )
+                for kind, workload, container in series
+            ]
+        field = next(field for field, series in advisor.RECORDED_SERIES.items() if series + "{" in query)
+        return [
+            ({"namespace": "default", "kind": kind, "workload": workload, "container": container}, value)
+            for sample_field, kind, workload, container, value in self.recorded
+            if sample_field == field
+        ]
+
+    def _field(self, query):
+        for field, metric in self.FIELD_METRICS:
+            if metric + "{" in query:
+                return field
+        return None
+
+    def query_vector(self, query):
+        self.queries.append(query)
+        if "resource_advisor:" in query:
+            return self._recorded_vector(query)
+        field = self._field(query)
+        if field is None:
+            return [({}, self.coverage_days * 86400.0)]
+        pod_match = re.search(r'pod=~"([^"]+)"', query)
+        container_match = re.search(r'container="([^"]+)"', query)
+        out = []
+        for sample_field, pod, container, value in self.samples:
+            if sample_field != field:
+                continue
+            if pod_match and not re.fullmatch(pod_match.group(1), pod):
+                continue
+            if container_match and container != container_match.group(1):
+                continue
+            out.append(({"namespace": "default", "pod": pod, "container": container}, value))
+        if pod_match and out and field not in advisor.USAGE_MAX_FIELDS:
+            return [({}, sum(value for _labels, value in out))]
+        return out
+
+    def query_scalar(self, query):
+        samples = self.query_vector(query)
+        if not samples:
+            return None
+        return max(value for _labels, value in samples)
+
+    def query_range(self, query, start, end, step):
+        # Gauges are flat per pod, so the locally computed p95 equals the instant-query sample; counters
+        # report their whole increase in the latest step, so any window sum equals the instant increase.
+        self.ranges.append((start, end))
+        latest = time.time() - step
+        series = []
+        for labels, value in self.query_vector(query):
+            points = []
+            for timestamp in range(start, end + step, step):
+                if "increase(" in query:
+                    points.append((float(timestamp), value if timestamp > latest else 0.0))
+                else:
+                    points.append((float(timestamp), value))
+            series.append((labels, points))
+        return series
+
+
+class RangePromClient:
+    """Serves a deterministic per-pod series and records every range query it answers."""
+
+    def __init__(self):
+        self.ranges = []
+
+    @staticmethod
+    def value(pod, timestamp):
+        return float((timestamp // 3600) % 17 + (3 if pod.endswith("b") else 0))
+
+    def query_range(self, query, start, end, step):
+        self.ranges.append((start, end))
+        return [
+            (
+                {"namespace": "default", "pod": pod, "container": "main"},
+                [(float(timestamp), self.value(pod, timestamp)) for timestamp in range(start, end + step, step)],
+            )
+            for pod in ("svc-a", "svc-b")
+        ]
+
+
+def make_workload(name: str, containers: dict[str, tuple[str, str]], replicas: int = 1) -> dict:
+    return {
+        "metadata": {"name": name, "labels": {"app.kubernetes.io/instance": name}},
+        "spec": {
+            "replicas": replicas,
+            "template": {
+                "spec": {
+                    "containers": [
+                        {
+                            "name": container,
+                            "resources": {
+                                "requests": {"cpu": cpu, "memory": memory},
+                                "limits": {"cpu": cpu, "memory": memory},
+                            },
+                        }
+                        for container, (cpu, memory) in containers.items()
+                    ]
+                }
+            },
+        },
+    }
+
 
 def make_node(name: str, cpu: str = "4000m", memory: str = "8192Mi") -> dict:
     return {
@@ -30,6 +229,17 @@ def make_node(name: str, cpu: str = "4000m", memory: str = "8192Mi") -> dict:
     }
 
 
+def make_pod(name: str, release: str, node: str, cpu: str = "200m", memory: str = "256Mi") -> dict:
+    return {
+        "metadata": {"name": name, "namespace": "default", "labels": {"app.kubernetes.io/instance": release}},
+        "spec": {
+            "nodeName": node,
+            "containers": [{"name": "main", "resources": {"requests": {"cpu": cpu, "memory": memory}}}],
+        },
+        "status": {"phase": "Running"},
+    }
+
+
 def make_report(recommendations: list[dict], coverage_days: float = 14.5) -> dict:
     return {
         "generated_at": "2026-03-13T18:30:19Z",
@@ -189,6 +399,106 @@ class BuildApplyPlanTests(unittest.TestCase):
         self.assertEqual(plan["skipped_reason_counts"].get("node_capacity_block"), 1)
         self.assertTrue(plan["node_fit"]["hard_fit_ok"])
 
+    def test_build_apply_plan_solver_beats_greedy_blocked_by_large_upsize(self):
+        large, *small = advisor.DEFAULT_APPLY_ALLOWLIST[:4]
+        report = make_report(
+            [
+                make_recommendation(
+                    large,
+                    current_cpu="100m",
+                    recommended_cpu="100m",
+                    current_memory="64Mi",
+                    recommended_memory="1024Mi",
+                )
+            ]
+            + [
+                make_recommendation(
+                    release,
+                    current_cpu="100m",
+                    recommended_cpu="100m",
+                    current_memory="64Mi",
+                    recommended_memory="764Mi",
+                )
+                for release in small
+            ]
+        )
+        env = {
+            "MAX_APPLY_CHANGES_PER_RUN": "5",
+            "MAX_REQUESTS_PERCENT_CPU": "100",
+            "MAX_REQUESTS_PERCENT_MEMORY": "100",
+        }
+        plans = {}
+        for mode in advisor.APPLY_SELECTION_MODES:
+            fake_kube = FakeKubeClient([make_node("node-a", cpu="1000m", memory="2200Mi")], [])
+            with patch.dict(os.environ, {**env, "APPLY_SELECTION_MODE": mode}, clear=True):
+                plans[mode] = advisor.build_apply_plan(report, fake_kube)
+
+        greedy, _markdown = plans["greedy"]
+        self.assertEqual([item["release"] for item in greedy["selected"]], [large, small[0]])
+        self.assertEqual(greedy["skipped_reason_counts"].get("node_capacity_block"), 2)
+
+        plan, markdown = plans["solver"]
+        self.assertEqual([item["release"] for item in plan["selected"]], small)
+        self.assertEqual(plan["skipped_reason_counts"].get("node_capacity_block"), 1)
+        self.assertTrue(plan["node_fit"]["hard_fit_ok"])
+        self.assertEqual(plan["selection"]["status"], "optimal")
+        self.assertEqual(plan["selection"]["greedy_impact_score"], greedy["selection"]["greedy_impact_score"])
+        self.assertGreater(plan["selection"]["extra_impact_score"], 0.0)
+        self.assertIn("Change selection: `solver`", markdown)
+
+    def test_solve_apply_selection_keeps_restart_guard_tier(self):
+        nodes = {"node-a": {"cpu_m": 1000.0, "mem_mi": 1000.0}}
+        projection = advisor.NodeProjection(nodes, {"node-a": 1000.0}, {"node-a": 1000.0}, {})
+        moves = [({"node-a": 1}, 0.0, 600.0), ({"node-a": 1}, 0.0, 500.0), ({"node-a": 1}, 0.0, 400.0)]
+        values = [(0, 900.0), (1, 100.0), (0, 50.0)]
+
+        chosen, stats = advisor.solve_apply_selection(moves, values, projection, 2, [], 1.0)
+
+        self.assertEqual(chosen, [1, 2])
+        self.assertEqual(stats["status"], "optimal")
+        self.assertEqual(projection.total_mem_mi, 0.0)
+
+    def test_build_apply_plan_scheduler_placement_reschedules_changed_pods(self):
+        moved, pinned = advisor.DEFAULT_APPLY_ALLOWLIST[:2]
+        report = make_report(
+            [
+                make_recommendation(
+                    release,
+                    current_cpu="100m",
+                    recommended_cpu="100m",
+                    current_memory="512Mi",
+                    recommended_memory="1536Mi",
+                )
+                for release in (moved, pinned)
+            ]
+        )
+        nodes = [make_node("node-a", memory="1024Mi"), make_node("node-b", memory="4096Mi"), make_node("node-c")]
+        nodes[1]["metadata"]["labels"] = {"disk": "ssd"}
+        nodes[2]["spec"] = {"taints": [{"key": "dedicated", "value": "gpu", "effect": "NoSchedule"}]}
+        pods = [
+            make_pod(f"{release}-0", release, "node-a", cpu="100m", memory="512Mi") for release in (moved, pinned)
+        ]
+        pods[1]["spec"]["nodeSelector"] = {"disk": "ssd"}
+        pods[1]["spec"]["nodeName"] = "node-b"
+        env = {
+            "MAX_APPLY_CHANGES_PER_RUN": "5",
+            "MAX_REQUESTS_PERCENT_CPU": "100",
+            "MAX_REQUESTS_PERCENT_MEMORY": "100",
+        }
+
+        with patch.dict(os.environ, env, clear=True):
+            current, _markdown = advisor.build_apply_plan(report, FakeKubeClient(nodes, pods))
+        self.assertEqual([item["release"] for item in current["selected"]], [pinned])
+        self.assertEqual(current["skipped_reason_counts"].get("node_capacity_block"), 1)
+
+        with patch.dict(os.environ, {**env, "NODE_FIT_PLACEMENT": "scheduler"}, clear=True):
+            plan, _markdown = advisor.build_apply_plan(report, FakeKubeClient(nodes, pods))
+        selected = {item["release"]: item["simulated_placement"] for item in plan["selected"]}
+        self.assertEqual(selected, {moved: {"node-b": 1}, pinned: {"node-b": 1}})
+        self.assertEqual(plan["node_fit"]["placement"], {"mode": "scheduler", "scoring_strategy": "LeastAllocated"})
+        by_node = {node["name"]: node["projected_requests"]["memory_mi"] for node in plan["node_fit"]["nodes"]}
+        self.assertEqual(by_node, {"node-a": 0.0, "node-b": 3072.0, "node-c": 0.0})
+
     def test_build_apply_plan_maps_bookorbit_to_helmrelease(self):
         report = make_report(
             [
@@ -346,6 +656,39 @@ class BuildApplyPlanTests(unittest.TestCase):
         self.assertEqual(plan["selected"], [])
         self.assertEqual(plan["skipped_reason_counts"].get("downsize_below_apply_floor"), 1)
 
+    def test_build_apply_plan_blocks_downsize_at_degraded_resolution(self):
+        recommendation = make_recommendation(
+            "bookorbit",
+            current_cpu="400m",
+            recommended_cpu="300m",
+            current_memory="2048Mi",
+            recommended_memory="1536Mi",
+            action="downsize",
+            notes=["degraded_resolution"],
+        )
+        recommendation["metrics_resolution"] = "6h"
+        fake_kube = FakeKubeClient([make_node("node-a")], [])
+
+        plans = []
+        for allow in ("false", "true"):
+            with patch.dict(
+                os.environ,
+                {
+                    "MAX_APPLY_CHANGES_PER_RUN": "5",
+                    "MAX_REQUESTS_PERCENT_CPU": "100",
+                    "MAX_REQUESTS_PERCENT_MEMORY": "100",
+                    "ALLOW_DEGRADED_RESOLUTION_DOWNSIZE": allow,
+                },
+                clear=True,
+            ):
+                with patch.object(advisor, "KubeClient", return_value=fake_kube):
+                    plans.append(advisor.build_apply_plan(make_report([recommendation]))[0])
+
+        self.assertEqual(plans[0]["selected"], [])
+        self.assertEqual(plans[0]["skipped"][0]["reason"], "degraded_resolution_blocks_downsize")
+        self.assertEqual(plans[0]["skipped"][0]["metrics_resolution"], "6h")
+        self.assertEqual([item["release"] for item in plans[1]["selected"]], ["bookorbit"])
+
     def test_build_apply_plan_pins_limit_downsize_by_default(self):
         report = make_report(
             [
@@ -442,6 +785,1370 @@ class BuildApplyPlanTests(unittest.TestCase):
         self.assertIn("mixed_request_downsize_guard", selected["notes"])
 
 
+class NodeProjectionTests(unittest.TestCase):
+    def test_apply_tracks_overages_and_rollback_restores_exactly(self):
+        alloc = {name: {"cpu_m": 1000.0, "mem_mi": 2048.0} for name in ("node-a", "node-b", "node-c")}
+        projection = advisor.NodeProjection(
+            alloc,
+            {name: 600.0 for name in alloc},
+            {name: 1024.0 for name in alloc},
+            {"node-a": {"cpu_m": 900.0, "mem_mi": 512.0}, "node-b": {"cpu_m": 100.1, "mem_mi": 100.3}},
+        )
+        self.assertEqual(list(projection.advisory_over), ["node-a"])
+        before = json.dumps(projection.by_node)
+
+        undo = projection.apply({"node-b": 2, "node-a": 1}, 150.7, 33.3)
+        self.assertFalse(projection.fits())
+        fit = projection.details(1800.0, 3072.0)
+        self.assertEqual(fit["hard_over_by_node"], {"node-a": {"over_cpu_m": 50.7, "over_mem_mi": 0.0}})
+        self.assertEqual(list(fit["advisory_over_by_node"]), ["node-a"])
+        self.assertEqual(fit["total_cpu_m"], 1452.2)
+
+        projection.rollback(undo)
+        self.assertTrue(projection.fits())
+        self.assertEqual(json.dumps(projection.by_node), before)
+        self.assertEqual((projection.total_cpu_m, projection.total_mem_mi), (900.0 + 100.1, 512.0 + 100.3))
+
+        projection.apply({"node-b": 3}, 200.0, 0.0)
+        self.assertEqual(list(projection.details(1800.0, 3072.0)["advisory_over_by_node"]), ["node-a", "node-b"])
+        projection.apply({"node-a": 1}, -400.0, 0.0)
+        self.assertEqual(list(projection.advisory_over), ["node-b"])
+
+
+class SchedulerSimulationTests(unittest.TestCase):
+    def test_filters_by_affinity_and_tolerations_and_scores_by_strategy(self):
+        nodes = [make_node("node-a"), make_node("node-b"), make_node("node-c")]
+        nodes[0]["metadata"]["labels"] = {"zone": "1"}
+        nodes[1]["metadata"]["labels"] = {"zone": "2"}
+        nodes[2]["metadata"]["labels"] = {"zone": "2"}
+        nodes[2]["spec"] = {"taints": [{"key": "dedicated", "value": "db", "effect": "NoExecute"}]}
+        pods = [make_pod("app-0", "app", "node-a", cpu="500m", memory="1024Mi"), make_pod("busy-0", "busy", "node-b")]
+        pods[0]["spec"]["affinity"] = {
+            "nodeAffinity": {
+                "requiredDuringSchedulingIgnoredDuringExecution": {
+                    "nodeSelectorTerms": [{"matchExpressions": [{"key": "zone", "operator": "Gt", "values": ["1"]}]}]
+                }
+            }
+        }
+        pods[0]["spec"]["tolerations"] = [{"key": "dedicated", "operator": "Exists"}]
+        pods = [advisor.compact_pod(pod) for pod in pods]
+        alloc = {name: {"cpu_m": 4000.0, "mem_mi": 8192.0} for name in ("node-a", "node-b", "node-c")}
+
+        for strategy, expected in (("LeastAllocated", "node-c"), ("MostAllocated", "node-b")):
+            simulation = advisor.SchedulerSimulation(nodes, strategy)
+            _index, per_node, _cpu, _mem = advisor.summarize_pods(pods, simulation)
+            projection = advisor.NodeProjection(alloc, {}, {}, per_node, simulation)
+            before = json.dumps(projection.by_node)
+            pod_ids = simulation.pods_for("app", "main")
+
+            undo = projection.apply({}, 100.0, 0.0, pod_ids)
+            self.assertEqual(projection.placement(pod_ids), {expected: 1})
+            self.assertEqual(projection.by_node["node-a"], {"cpu_m": 0.0, "mem_mi": 0.0})
+            self.assertEqual(projection.by_node[expected]["cpu_m"], 600.0 + (200.0 if expected == "node-b" else 0.0))
+
+            projection.rollback(undo)
+            self.assertEqual(projection.placement(pod_ids), {"node-a": 1})
+            self.assertEqual(json.dumps(projection.by_node), before)
+
+
+class BuildReportTests(unittest.TestCase):
+    def run_report(self, collection_mode, samples, workloads, extra_env=None, fake_prom=None):
+        fake_kube = FakeKubeClient([make_node("node-a")], [], workloads)
+        fake_prom = fake_prom or FakePromClient(samples)
+        with patch.dict(
+            os.environ,
+            {"TARGET_NAMESPACES": "default", "METRICS_COLLECTION_MODE": collection_mode, **(extra_env or {})},
+            clear=True,
+        ):
+            with patch.object(advisor, "KubeClient", return_value=fake_kube):
+                with patch.object(advisor, "PromClient", return_value=fake_prom):
+                    report, _markdown = advisor.build_report()
+        report.pop("generated_at")
+        return report, fake_prom
+
+    def test_batched_collection_matches_per_container_queries(self):
+        mib = 1024.0 * 1024.0
+        workloads = {
+            ("default", "deployments"): [
+                make_workload("immich", {"main": ("500m", "1024Mi")}),
+                make_workload("sonarr", {"main": ("100m", "256Mi"), "exporter": ("50m", "64Mi")}, replicas=2),
+            ],
+            ("default", "statefulsets"): [make_workload("immich-postgres", {"main": ("250m", "512Mi")})],
+        }
+        samples = [
+            ("cpu_p95_cores", "immich-7d9c-abcde", "main", 0.9),
+            ("mem_p95_bytes", "immich-7d9c-abcde", "main", 1500 * mib),
+            ("cpu_p95_cores", "immich-postgres-0", "main", 0.05),
+            ("mem_p95_bytes", "immich-postgres-0", "main", 200 * mib),
+            ("restarts", "immich-postgres-0", "main", 2.0),
+            ("cpu_p95_cores", "sonarr-5f6b-aaaaa", "main", 0.02),
+            ("cpu_p95_cores", "sonarr-5f6b-bbbbb", "main", 0.03),
+            ("mem_p95_bytes", "sonarr-5f6b-aaaaa", "main", 100 * mib),
+            ("throttled_periods", "sonarr-5f6b-aaaaa", "main", 300.0),
+            ("throttled_periods", "sonarr-5f6b-bbbbb", "main", 100.0),
+            ("cfs_periods", "sonarr-5f6b-aaaaa", "main", 600.0),
+            ("cfs_periods", "sonarr-5f6b-bbbbb", "main", 400.0),
+        ]
+
+        per_container, per_container_prom = self.run_report("per-container", samples, workloads)
+        batched, batched_prom = self.run_report("batched", samples, workloads)
+        per_container_queries = per_container_prom.queries
+        batched_queries = batched_prom.queries
+
+        self.assertEqual(batched, per_container)
+        self.assertGreater(len(per_container["recommendations"]), 0)
+        # Coverage and recording-rule probes plus five grouped queries for the single namespace.
+        self.assertEqual(len(batched_queries), 7)
+        self.assertEqual(len(per_container_queries), 2 + 5 * 4)
+        self.assertTrue(all("by (namespace, pod, container)" in query for query in batched_queries[2:]))
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            for collection_mode in ("batched", "per-container"):
+                cached, _queries = self.run_report(
+                    collection_mode, samples, workloads, {"USAGE_CACHE_DIR": cache_dir}
+                )
+                immich = next(item for item in cached["recommendations"] if item["workload"] == "immich")
+                self.assertEqual(immich["cpu_quantiles_m"], {name: 900.0 for name in advisor.USAGE_SUMMARY_STATS})
+                for item in cached["recommendations"]:
+                    item.pop("cpu_quantiles_m", None)
+                    item.pop("mem_quantiles_mi", None)
+                self.assertEqual(cached.pop("usage_source"), "usage_cache")
+                self.assertEqual(cached, {key: value for key, value in per_container.items() if key != "usage_source"})
+
+    def test_range_collection_matches_per_container_queries_in_chunks(self):
+        mib = 1024.0 * 1024.0
+        workloads = {
+            ("default", "deployments"): [
+                make_workload("sonarr", {"main": ("100m", "256Mi"), "exporter": ("50m", "64Mi")}, replicas=2),
+            ],
+            ("default", "statefulsets"): [make_workload("immich-postgres", {"main": ("250m", "512Mi")})],
+        }
+        samples = [
+            ("cpu_p95_cores", "immich-postgres-0", "main", 0.05),
+            ("mem_p95_bytes", "immich-postgres-0", "main", 200 * mib),
+            ("restarts", "immich-postgres-0", "main", 2.0),
+            ("cpu_p95_cores", "sonarr-5f6b-aaaaa", "main", 0.02),
+            ("cpu_p95_cores", "sonarr-5f6b-bbbbb", "main", 0.03),
+            ("mem_p95_bytes", "sonarr-5f6b-aaaaa", "main", 100 * mib),
+            ("throttled_periods", "sonarr-5f6b-aaaaa", "main", 300.0),
+            ("cfs_periods", "sonarr-5f6b-aaaaa", "main", 600.0),
+        ]
+
+        per_container, _prom = self.run_report("per-container", samples, workloads)
+        ranged, range_prom = self.run_report("range", samples, workloads, {"PROM_RANGE_CHUNK_STEPS": "100"})
+
+        # 14d at 1h is 336 steps: four chunks per field, five fields, no instant usage queries.
+        self.assertEqual(len(range_prom.ranges), 4 * 5)
+        self.assertTrue(all(end - start <= 99 * 3600 for start, end in range_prom.ranges))
+        self.assertEqual(len(range_prom.queries), 1 + 4 * 5)
+        self.assertFalse(any("resource_advisor:" in query for query in range_prom.queries))
+        sonarr = next(item for item in ranged["recommendations"] if item["container"] == "main")
+        self.assertEqual(sonarr["cpu_quantiles_m"], {name: 30.0 for name in advisor.USAGE_SUMMARY_STATS})
+        for item in ranged["recommendations"]:
+            item.pop("cpu_quantiles_m", None)
+            item.pop("mem_quantiles_mi", None)
+        self.assertEqual(ranged.pop("usage_source"), "range")
+        self.assertEqual(per_container.pop("usage_source"), "raw")
+        self.assertEqual(ranged, per_container)
+
+    def test_recorded_series_replace_raw_queries_with_per_container_fallback(self):
+        mib = 1024.0 * 1024.0
+        workloads = {
+            ("default", "deployments"): [
+                make_workload("sonarr", {"main": ("100m", "256Mi"), "exporter": ("50m", "64Mi")}, replicas=2),
+            ],
+            ("default", "statefulsets"): [make_workload("immich-postgres", {"main": ("250m", "512Mi")})],
+        }
+        samples = [
+            ("cpu_p95_cores", "immich-postgres-0", "main", 0.4),
+            ("mem_p95_bytes", "immich-postgres-0", "main", 900 * mib),
+            ("cpu_p95_cores", "sonarr-5f6b-aaaaa", "main", 0.02),
+            ("mem_p95_bytes", "sonarr-5f6b-aaaaa", "main", 100 * mib),
+            ("throttled_periods", "sonarr-5f6b-aaaaa", "main", 300.0),
+            ("cfs_periods", "sonarr-5f6b-aaaaa", "main", 600.0),
+        ]
+        # immich-postgres is newer than the generated rules, so it has no recorded series yet.
+        recorded = [
+            ("cpu_p95_cores", "deployments", "sonarr", "main", 0.02),
+            ("mem_p95_bytes", "deployments", "sonarr", "main", 100 * mib),
+            ("throttled_periods", "deployments", "sonarr", "main", 300.0),
+            ("cfs_periods", "deployments", "sonarr", "main", 600.0),
+            # A StatefulSet sharing a Deployment's name records separately and must not be read for it.
+            ("cpu_p95_cores", "statefulsets", "sonarr", "main", 3.0),
+            ("mem_p95_bytes", "statefulsets", "sonarr", "main", 3000 * mib),
+        ]
+
+        raw, _prom = self.run_report("batched", samples, workloads)
+        for collection_mode in ("batched", "per-container"):
+            fake_prom = FakePromClient(samples, recorded=recorded, recorded_days=20.0)
+            preferred, fake_prom = self.run_report(collection_mode, samples, workloads, fake_prom=fake_prom)
+
+            raw_queries = [query for query in fake_prom.queries[2:] if "resource_advisor:" not in query]
+            self.assertEqual(len([query for query in fake_prom.queries if "resource_advisor:" in query]), 1 + 6)
+            if collection_mode == "batched":
+                self.assertEqual(len(raw_queries), 5)
+            else:
+                # Only immich-postgres and the unrecorded sonarr exporter container fall back.
+                self.assertEqual(len(raw_queries), 2 * 5)
+                sonarr_main = 'pod=~"sonarr-[a-z0-9]+-[a-z0-9]{5}",container="main"'
+                self.assertFalse(any(sonarr_main in query for query in raw_queries))
+            self.assertEqual(preferred["usage_source"], "recording_rules")
+            self.assertEqual(preferred["summary"].pop("containers_from_recording_rules"), 1)
+            self.assertEqual(preferred["recommendations"], raw["recommendations"])
+            raw_summary = dict(raw["summary"])
+            raw_summary.pop("containers_from_recording_rules")
+            self.assertEqual(preferred["summary"], raw_summary)
+
+        fake_prom = FakePromClient(samples, recorded=recorded, recorded_days=3.0)
+        young, fake_prom = self.run_report("batched", samples, workloads, fake_prom=fake_prom)
+        self.assertEqual(young["usage_source"], "raw")
+        self.assertEqual(young["summary"]["containers_from_recording_rules"], 0)
+        self.assertEqual(len([query for query in fake_prom.queries if "resource_advisor:" in query]), 1)
+
+        # Other series cover the window, but sonarr's rule was only added a day ago: its p95 would cover one day.
+        fake_prom = FakePromClient(
+            samples, recorded=recorded, recorded_days=20.0, series_days={("deployments", "sonarr", "main"): 1.0}
+        )
+        partial, fake_prom = self.run_report("per-container", samples, workloads, fake_prom=fake_prom)
+        self.assertEqual(partial["summary"].pop("containers_from_recording_rules"), 0)
+        self.assertTrue(any('pod=~"sonarr-[a-z0-9]+-[a-z0-9]{5}",container="main"' in q for q in fake_prom.queries))
+        self.assertEqual(partial["recommendations"], raw["recommendations"])
+
+    def test_recording_rules_manifest_uses_advisor_pod_regex(self):
+        manifest = advisor.render_recording_rules(
+            [("default", "deployments", "sonarr"), ("default", "statefulsets", "immich-postgres")]
+        )
+
+        self.assertIn("kind: PrometheusRule", manifest)
+        self.assertIn("    release: kube-prometheus-stack", manifest)
+        exprs = [json.loads(line.split("expr: ", 1)[1]) for line in manifest.splitlines() if "expr: " in line]
+        self.assertEqual(len(exprs), 2 * 5 + 1)
+        self.assertTrue(any('pod=~"sonarr-[a-z0-9]+-[a-z0-9]{5}"' in expr for expr in exprs))
+        self.assertTrue(any('pod=~"immich-postgres-[0-9]+"' in expr for expr in exprs))
+        self.assertEqual(manifest.count('            workload: "sonarr"'), 5)
+        self.assertEqual(manifest.count('            kind: "statefulsets"'), 5)
+        self.assertIn("on (namespace, kind, workload, container)", exprs[-1])
+        self.assertIn(advisor.RECORDED_THROTTLE_RATIO, manifest)
+
+    def test_range_reducer_folds_chunks_into_sketches_and_sums(self):
+        def chunk(start, values):
+            timestamps = advisor.array.array("d", [float(start + index) for index in range(len(values))])
+            return {("svc-5f6b-aaaaa", "main"): (timestamps, advisor.array.array("d", values))}
+
+        values = [float(value) for value in range(1, 201)]
+        usage = advisor.RangeFieldReducer("mem_p95_bytes", 0.0)
+        counter = advisor.RangeFieldReducer("restarts", 150.0)
+        for offset in range(0, 200, 64):
+            usage.fold(chunk(offset, values[offset : offset + 64]))
+            counter.fold(chunk(offset, values[offset : offset + 64]))
+
+        summary = usage.sketches[("svc-5f6b-aaaaa", "main")].summary()
+        for name, exact in (("p95", 190.05), ("max", 200.0)):
+            self.assertLessEqual(abs(summary[name] - exact) / exact, advisor.QuantileSketch.RELATIVE_ACCURACY)
+        self.assertEqual(summary["mean"], 100.5)
+        # Only increases stamped after `since` count towards the windowed sum.
+        self.assertEqual(counter.sums[("svc-5f6b-aaaaa", "main")], sum(values[151:]))
+
+        counter.fold(None)
+        owners = advisor.PodOwnerIndex([("default", "deployments", "svc")])
+        ranged = advisor.NamespaceRangeUsage({"mem_p95_bytes@0": usage, "restarts@0": counter}, "default", owners)
+        self.assertEqual(
+            ranged.for_container(("deployments", "svc"), "main"),
+            {"mem_p95_bytes": summary["p95"], "restarts": None},
+        )
+
+    def test_parallel_queries_keep_report_deterministic(self):
+        workloads = {
+            ("default", "deployments"): [
+                make_workload(f"svc-{index}", {"main": ("100m", "128Mi")}) for index in range(6)
+            ],
+        }
+        samples = [
+            ("cpu_p95_cores", f"svc-{index}-abc-12345", "main", 0.2 + index / 100.0) for index in range(6)
+        ]
+
+        class SlowPromClient(FakePromClient):
+            def query_vector(self, query):
+                # Later queries finish first so completion order differs from submission order.
+                time.sleep(0.002 * (6 - len(self.queries) % 6))
+                return super().query_vector(query)
+
+        fake_kube = FakeKubeClient([make_node("node-a")], [], workloads)
+        reports = []
+        for concurrency in ("1", "8"):
+            with patch.dict(
+                os.environ,
+                {
+                    "TARGET_NAMESPACES": "default",
+                    "METRICS_COLLECTION_MODE": "per-container",
+                    "PROM_QUERY_CONCURRENCY": concurrency,
+                },
+                clear=True,
+            ):
+                with patch.object(advisor, "KubeClient", return_value=fake_kube):
+                    with patch.object(advisor, "PromClient", return_value=SlowPromClient(samples)):
+                        report, _markdown = advisor.build_report()
+            report.pop("generated_at")
+            reports.append(report)
+
+        self.assertEqual(reports[0], reports[1])
+        self.assertEqual(len(reports[0]["recommendations"]), 6)
+
+    def test_run_time_budget_coarsens_resolution_for_remaining_queries(self):
+        workloads = {
+            ("default", "deployments"): [
+                make_workload(f"svc-{index}", {"main": ("100m", "128Mi")}) for index in range(3)
+            ],
+        }
+        samples = [
+            (field, f"svc-{index}-abc-12345", "main", value)
+            for index in range(3)
+            for field, value in (("cpu_p95_cores", 0.2), ("mem_p95_bytes", 100 * 1024.0 * 1024.0))
+        ]
+
+        class SlowHourlyPromClient(FakePromClient):
+            def query_vector(self, query):
+                if ":1h])" in query:
+                    time.sleep(0.05)
+                return super().query_vector(query)
+
+        report, fake_prom = self.run_report(
+            "per-container",
+            samples,
+            workloads,
+            extra_env={"PROM_QUERY_CONCURRENCY": "1", "RUN_TIME_BUDGET_SECONDS": "0.01"},
+            fake_prom=SlowHourlyPromClient(samples),
+        )
+
+        resolutions = {item["workload"]: item["metrics_resolution"] for item in report["recommendations"]}
+        self.assertEqual(resolutions, {"svc-0": "2h", "svc-1": "6h", "svc-2": "6h"})
+        self.assertTrue(all("degraded_resolution" in item["notes"] for item in report["recommendations"]))
+        self.assertEqual(report["summary"]["containers_degraded_resolution"], 3)
+        self.assertEqual(report["resolution_governor"]["final_resolution"], "6h")
+        self.assertEqual([step["resolution"] for step in report["resolution_governor"]["steps"]], ["2h", "6h"])
+        hourly = [query for query in fake_prom.queries if "quantile_over_time" in query and ":1h])" in query]
+        self.assertEqual(len(hourly), 1)
+
+        undegraded, _prom = self.run_report("per-container", samples, workloads)
+        self.assertNotIn("resolution_governor", undegraded)
+        self.assertEqual({item["metrics_resolution"] for item in undegraded["recommendations"]}, {"1h"})
+
+    def test_run_time_budget_coarsens_cold_usage_cache_fetches_without_storing_them(self):
+        workloads = {
+            ("default", "deployments"): [
+                make_workload(f"svc-{index}", {"main": ("100m", "128Mi")}) for index in range(3)
+            ],
+        }
+        samples = [
+            (field, f"svc-{index}-abc-12345", "main", value)
+            for index in range(3)
+            for field, value in (("cpu_p95_cores", 0.2), ("mem_p95_bytes", 100 * 1024.0 * 1024.0))
+        ]
+
+        class SlowHourlyRangePromClient(FakePromClient):
+            def __init__(self, samples):
+                super().__init__(samples)
+                self.steps = []
+
+            def query_range(self, query, start, end, step):
+                self.steps.append(step)
+                if step == 3600:
+                    time.sleep(0.05)
+                return super().query_range(query, start, end, step)
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            env = {"PROM_QUERY_CONCURRENCY": "1", "USAGE_CACHE_DIR": cache_dir}
+            report, fake_prom = self.run_report(
+                "per-container",
+                samples,
+                workloads,
+                extra_env={**env, "RUN_TIME_BUDGET_SECONDS": "0.01"},
+                fake_prom=SlowHourlyRangePromClient(samples),
+            )
+            self.assertEqual(report["resolution_governor"]["final_resolution"], "6h")
+            self.assertEqual(fake_prom.steps[0], 3600)
+            self.assertIn(6 * 3600, fake_prom.steps)
+            self.assertEqual(report["summary"]["containers_degraded_resolution"], 3)
+            # Only the one fetch made at the cache's own step was stored.
+            self.assertEqual(len(list(Path(cache_dir).glob("*.json"))), 1)
+
+            undegraded, fake_prom = self.run_report(
+                "per-container", samples, workloads, extra_env=env, fake_prom=SlowHourlyRangePromClient(samples)
+            )
+            self.assertEqual(len(list(Path(cache_dir).glob("*.json"))), 6)
+        self.assertEqual({item["metrics_resolution"] for item in undegraded["recommendations"]}, {"1h"})
+        # The five cold files are fetched whole at the cache's step; the stored one at most refetches its open tail.
+        self.assertEqual(set(fake_prom.steps), {3600})
+        self.assertIn(len(fake_prom.steps), (5, 6))
+
+    def test_markdown_renders_from_report_document_alone(self):
+        workloads = {
+            ("default", "deployments"): [
+                make_workload(f"svc-{index}", {"main": ("100m", "128Mi"), "sidecar": ("50m", "64Mi")})
+                for index in range(5)
+            ],
+        }
+        samples = [
+            (field, f"svc-{index}-abc-12345", "main", value)
+            for index in range(4)
+            for field, value in (("cpu_p95_cores", 0.05 * index), ("mem_p95_bytes", 300 * 1024.0 * 1024.0))
+        ]
+        fake_kube = FakeKubeClient([make_node("node-a")], [], workloads)
+        outputs = []
+        for batch_size in ("4096", "1"):
+            env = {"TARGET_NAMESPACES": "default", "RECOMMEND_BATCH_SIZE": batch_size}
+            discovered = []
+            with patch.dict(os.environ, env, clear=True):
+                with patch.object(advisor, "KubeClient", return_value=fake_kube):
+                    with patch.object(advisor, "PromClient", return_value=FakePromClient(samples)):
+                        report, markdown = advisor.build_report(None, None, discovered)
+            # The recording rules are rendered from the workloads the report already discovered.
+            self.assertEqual(discovered, [("default", "deployments", f"svc-{index}") for index in range(5)])
+            self.assertEqual(advisor.render_report_markdown(json.loads(json.dumps(report))), markdown)
+            report.pop("generated_at")
+            outputs.append((report, markdown.split("\n", 3)[3]))
+
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(outputs[0][0]["summary"]["containers_analyzed"], 10)
+        self.assertEqual(outputs[0][0]["summary"]["containers_skipped_no_metrics"], 6)
+        stages = set(advisor.RUN_STATS.summary()["pipeline_seconds"])
+        self.assertEqual(stages, {"discover", "fetch", "recommend", "aggregate", "render"})
+
+    def test_fetch_yields_each_namespace_before_discovering_past_the_next(self):
+        workloads = {
+            (namespace, "deployments"): [
+                make_workload(f"svc-{index}", {"main": ("100m", "128Mi")}) for index in range(3)
+            ]
+            for namespace in ("apps", "media", "tools")
+        }
+        samples = [("cpu_p95_cores", "svc-0-abc-12345", "main", 0.1)]
+        fake_kube = FakeKubeClient([make_node("node-a")], [], workloads)
+        pulled = []
+
+        def discover():
+            for target in advisor.discover_targets(fake_kube, ["apps", "media", "tools"]):
+                pulled.append(target["namespace"])
+                yield target
+
+        executor = advisor.PromQueryExecutor(2)
+        try:
+            fetcher = advisor.UsageFetcher(
+                FakePromClient(samples), executor, "batched", "14d", "1h", "1d", None, None, False
+            )
+            seen = []
+            for target in fetcher.fetch(discover()):
+                if target["namespace"] != (seen or [None])[-1]:
+                    # Discovery has reached at most the first target of the next namespace.
+                    self.assertLessEqual(len(pulled), pulled.index(target["namespace"]) + 4)
+                seen.append(target["namespace"])
+        finally:
+            executor.shutdown()
+
+        self.assertEqual(seen, ["apps"] * 3 + ["media"] * 3 + ["tools"] * 3)
+        self.assertFalse(fetcher.namespace_futures)
+
+    def test_unchanged_containers_reuse_previous_fingerprinted_results_without_querying(self):
+        mib = 1024.0 * 1024.0
+        workloads = {
+            ("default", "deployments"): [
+                make_workload(f"svc-{index}", {"main": ("100m", "128Mi")}, replicas=2) for index in range(4)
+            ],
+        }
+        samples = [
+            (field, f"svc-{index}-abc-12345", "main", value)
+            for index in range(4)
+            for field, value in (("cpu_p95_cores", 0.1 * (index + 1)), ("mem_p95_bytes", 40 * mib))
+        ]
+
+        def run(previous, env=None):
+            fingerprints = {}
+            fake_kube = FakeKubeClient([make_node("node-a")], [], workloads)
+            fake_prom = FakePromClient(samples)
+            with patch.dict(os.environ, {"TARGET_NAMESPACES": "default", **(env or {})}, clear=True):
+                with patch.object(advisor, "KubeClient", return_value=fake_kube):
+                    with patch.object(advisor, "PromClient", return_value=fake_prom):
+                        report, _markdown = advisor.build_report(previous, fingerprints)
+            report.pop("generated_at")
+            return report, json.loads(json.dumps(fingerprints)), fake_prom.queries
+
+        full, fingerprints, full_queries = run(None)
+        self.assertEqual(len(fingerprints), 4)
+        self.assertEqual(full["summary"]["containers_reused"], 0)
+
+        # Coverage and recording-rule probes only: the namespace's usage queries are skipped.
+        incremental, carried, queries = run(fingerprints)
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(queries, full_queries[:2])
+        self.assertEqual(incremental["summary"].pop("containers_reused"), 4)
+        full["summary"].pop("containers_reused")
+        self.assertEqual(incremental, full)
+        self.assertEqual(carried, fingerprints)
+
+        # Fingerprints only see inputs known before fetching, so moved usage waits for the record to age out.
+        original = list(samples)
+        samples[:] = [(field, pod, container, value * 2.0) for field, pod, container, value in original]
+        self.assertEqual(run(fingerprints)[0]["recommendations"], full["recommendations"])
+        samples[:] = original
+
+        workloads[("default", "deployments")][1] = make_workload("svc-1", {"main": ("300m", "128Mi")}, replicas=2)
+        changed, _fingerprints, queries = run(fingerprints)
+        self.assertEqual(changed["summary"]["containers_reused"], 3)
+        self.assertEqual(len(queries), len(full_queries))
+        svc_1 = next(item for item in changed["recommendations"] if item["workload"] == "svc-1")
+        self.assertEqual(svc_1["current"]["requests"]["cpu"], "300m")
+        workloads[("default", "deployments")][1] = make_workload("svc-1", {"main": ("100m", "128Mi")}, replicas=2)
+
+        stale = {key: {**record, "computed_at": record["computed_at"] - 7 * 3600} for key, record in carried.items()}
+        self.assertEqual(run(stale)[0]["summary"]["containers_reused"], 0)
+        self.assertEqual(run(stale, {"REPORT_REUSE_MAX_AGE_HOURS": "8"})[0]["summary"]["containers_reused"], 4)
+        self.assertEqual(run(fingerprints, {"DEADBAND_PERCENT": "5"})[0]["summary"]["containers_reused"], 0)
+        self.assertEqual(run(fingerprints, {"METRICS_WINDOW": "7d"})[0]["summary"]["containers_reused"], 0)
+
+    def test_report_stages_charge_nested_time_to_the_running_stage(self):
+        stages = advisor.ReportStages(("inner", "outer", "sink"))
+
+        def slow(items, delay):
+            for item in items:
+                time.sleep(delay)
+                yield item
+
+        inner = stages.stage("inner", slow(range(3), 0.02))
+        outer = stages.stage("outer", slow(inner, 0.01))
+        with stages.timed("sink"):
+            self.assertEqual(list(outer), [0, 1, 2])
+
+        self.assertEqual(list(stages.seconds), ["inner", "outer", "sink"])
+        self.assertGreaterEqual(stages.seconds["inner"], 0.06)
+        self.assertGreaterEqual(stages.seconds["outer"], 0.03)
+        self.assertLess(stages.seconds["outer"], 0.06)
+        self.assertLess(stages.seconds["sink"], 0.02)
+
+    def test_resolution_ladder_keeps_only_coarser_fallbacks(self):
+        self.assertEqual(advisor.resolution_ladder("1h", ["6h", "30m", "2h", "120m"]), ["1h", "2h", "6h"])
+        self.assertEqual(advisor.resolution_ladder("6h", ["2h", "6h"]), ["6h"])
+
+    def test_workload_discovery_lists_concurrently_in_stable_order(self):
+        lock = threading.Lock()
+        active = []
+        peak = []
+
+        class SlowKube:
+            def list_workloads(self, namespace, kind):
+                with lock:
+                    active.append(1)
+                    peak.append(len(active))
+                time.sleep(0.05)
+                with lock:
+                    active.pop()
+                return [make_workload(f"{namespace}-{kind}", {"main": ("100m", "128Mi")})]
+
+        namespaces = [f"ns-{index}" for index in range(4)]
+        started = time.monotonic()
+        with patch.dict(os.environ, {"KUBE_DISCOVERY_CONCURRENCY": "8"}):
+            found = []
+            targets = list(advisor.discover_targets(SlowKube(), namespaces, found))
+        elapsed = time.monotonic() - started
+
+        expected = [(ns, kind, f"{ns}-{kind}") for ns in namespaces for kind in ("deployments", "statefulsets")]
+        self.assertEqual(found, expected)
+        self.assertEqual([(t["namespace"], t["kind"], t["workload"]) for t in targets], expected)
+        self.assertGreater(max(peak), 1)
+        self.assertLess(elapsed, 8 * 0.05)
+
+    def test_query_budget_exhaustion_fails_the_run(self):
+        executor = advisor.PromQueryExecutor(2, budget_seconds=0.05)
+        try:
+            futures = {"slow": executor.submit(time.sleep, 0.5)}
+            with self.assertRaises(advisor.QueryBudgetExceeded):
+                executor.resolve(futures)
+            with self.assertRaises(advisor.QueryBudgetExceeded):
+                executor.resolve({"late": executor.submit(lambda: 1)})
+        finally:
+            executor.shutdown()
+
+    def test_query_rate_limit_spaces_query_starts(self):
+        executor = advisor.PromQueryExecutor(4, rate_per_second=50.0)
+        try:
+            futures = {str(index): executor.submit(time.monotonic) for index in range(5)}
+            starts = sorted(executor.resolve(futures).values())
+        finally:
+            executor.shutdown()
+
+        self.assertGreaterEqual(starts[-1] - starts[0], 4 / 50.0 - 0.01)
+
+
+class RecommendColumnsTests(unittest.TestCase):
+    def columns(self, *rows: dict) -> dict[str, list]:
+        defaults = {
+            "release": "grafana",
+            "degraded_resolution": False,
+            "cur_req_cpu": 100.0,
+            "cur_req_mem": 256.0,
+            "cur_lim_cpu": 200.0,
+            "cur_lim_mem": 384.0,
+            "cpu_p95_m": 77.0,
+            "mem_p95_mi": 197.0,
+            "restarts": 0.0,
+            "cpu_throttled_periods": 0.0,
+            "cpu_throttle_ratio": 0.0,
+        }
+        return {name: [{**defaults, **row}[name] for row in rows] for name in advisor.RECOMMENDATION_INPUTS}
+
+    def test_guards_deadband_and_actions(self):
+        columns = self.columns(
+            {},
+            {"cpu_p95_m": 10.0, "mem_p95_mi": 20.0, "restarts": 2.0},
+            {"cpu_throttled_periods": 500.0, "cpu_throttle_ratio": 0.5, "degraded_resolution": True},
+            {"release": "sonarr", "cur_req_mem": 1024.0, "cpu_p95_m": 10.0, "mem_p95_mi": 20.0},
+            {"release": "immich", "cpu_p95_m": 10.0, "mem_p95_mi": 20.0},
+        )
+
+        with patch.object(advisor, "numpy", None):
+            results = advisor.recommend_columns(columns, SETTINGS, {"immich"})
+
+        self.assertEqual(results["action"], [None, "downsize", "upsize", "downsize", None])
+        self.assertEqual(results["rec_req_mem"][1], 256.0)
+        self.assertEqual(results["rec_req_cpu"][1], 75.0)
+        self.assertEqual(results["rec_lim_cpu"][2], 250.0)
+        self.assertEqual(results["rec_req_cpu"][3], 100.0)
+        self.assertEqual(results["rec_req_mem"][3], 768.0)
+        self.assertEqual(results["rec_lim_mem"][3], 384.0)
+        self.assertEqual(
+            results["notes"],
+            [
+                [],
+                ["restart_guard"],
+                ["degraded_resolution", "cpu_throttle_guard"],
+                ["profile_burst_request_floor", "request_floor_guard", "profile_limit_downsize_guard"],
+                ["downscale_excluded"],
+            ],
+        )
+
+    @unittest.skipIf(advisor.numpy is None, "numpy is not installed")
+    def test_numpy_engine_matches_pure_python(self):
+        columns = synthetic_columns(5000, seed=7)
+        exclude = set(advisor.DEFAULT_DOWNSCALE_EXCLUDE)
+
+        with patch.object(advisor, "numpy", None):
+            expected = advisor.recommend_columns(columns, SETTINGS, exclude)
+        results = advisor.recommend_columns(columns, SETTINGS, exclude)
+
+        self.assertEqual(json.dumps(results), json.dumps(expected))
+        self.assertEqual(set(expected["action"]), {None, "no-change", "downsize", "upsize"})
+
+
+class UsageHistoryCacheTests(unittest.TestCase):
+    WINDOW = 14 * 86400
+    STEP = 3600
+    EXPRESSION = 'max by (namespace, pod, container) (container_memory_working_set_bytes{namespace="default"})'
+
+    def usage(self, cache_dir, prom, now):
+        cache = advisor.UsageHistoryCache(Path(cache_dir), self.WINDOW, self.STEP, 1024 * 1024, now=now)
+        return cache, cache.usage_vector(prom, "default", "", "", "mem_p95_bytes", self.EXPRESSION)
+
+    def test_next_run_fetches_only_new_buckets_and_matches_full_window_quantile(self):
+        prom = RangePromClient()
+        day_one = 1_773_400_000.0
+        day_two = day_one + 86400.0
+        with tempfile.TemporaryDirectory() as cache_dir:
+            self.usage(cache_dir, prom, day_one)
+            cache, samples = self.usage(cache_dir, prom, day_two)
+            stored = json.loads(next(Path(cache_dir).glob("*.json")).read_text())
+
+        self.assertEqual(len(prom.ranges), 2)
+        start, end = prom.ranges[1]
+        self.assertEqual(end, cache.last_bucket)
+        # Only the day since the first run, plus the unsettled bucket it could not cache.
+        self.assertEqual((end - start) // self.STEP + 1, 25)
+        self.assertEqual(cache.stats()["buckets_reused"], 14 * 24 - 25)
+        # Settled days are kept as sketches; raw buckets remain only for the open day.
+        self.assertEqual(len(stored["days"]), 14)
+        open_day = cache.day_of(cache.last_bucket)
+        self.assertTrue(all(cache.day_of(int(bucket)) == open_day for bucket in stored["buckets"]))
+
+        for labels, value in samples:
+            # The oldest day is kept whole, so the window is rounded out to UTC days.
+            values = sorted(
+                prom.value(labels["pod"], bucket)
+                for bucket in range(cache.day_of(cache.first_bucket), cache.last_bucket + self.STEP, self.STEP)
+            )
+            rank = 0.95 * (len(values) - 1)
+            low = values[int(rank)]
+            high = values[min(len(values) - 1, int(rank) + 1)]
+            expected = low + (high - low) * (rank - int(rank))
+            self.assertLessEqual(abs(value - expected), expected * advisor.QuantileSketch.RELATIVE_ACCURACY)
+        self.assertEqual([labels["pod"] for labels, _value in samples], ["svc-a", "svc-b"])
+        summary = cache.summary("mem_p95_bytes", "default", "svc-.+", "main")
+        self.assertEqual(set(summary), set(advisor.USAGE_SUMMARY_STATS))
+
+    def test_fetches_only_gaps_and_treats_a_failed_fetch_as_missing(self):
+        prom = RangePromClient()
+        day_one = 1_773_400_000.0
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache, _samples = self.usage(cache_dir, prom, day_one)
+            path = next(Path(cache_dir).glob("*.json"))
+            stored = json.loads(path.read_text())
+            gap = sorted(int(bucket) for bucket in stored["buckets"])[2]
+            del stored["buckets"][str(gap)]
+            path.write_text(json.dumps(stored))
+
+            later = day_one + 3 * 3600.0
+            cache, samples = self.usage(cache_dir, prom, later)
+            # The dropped bucket and the new tail are separate runs; cached buckets between them are not refetched.
+            self.assertEqual(len(prom.ranges), 3)
+            self.assertEqual(prom.ranges[1], (gap, gap))
+            tail_start, tail_end = prom.ranges[2]
+            self.assertEqual(tail_end, cache.last_bucket)
+            self.assertEqual(cache.stats()["buckets_fetched"], 1 + (tail_end - tail_start) // self.STEP + 1)
+            self.assertEqual(min(int(bucket) for bucket in stored["buckets"] if int(bucket) > gap), gap + self.STEP)
+            self.assertGreater(tail_start, gap + self.STEP)
+            self.assertIsNotNone(samples)
+
+            prom.query_range = lambda query, start, end, step: None
+            cache, samples = self.usage(cache_dir, prom, later + 3600.0)
+        self.assertIsNone(samples)
+        self.assertEqual(cache.stats()["range_failures"], 1)
+        self.assertIsNone(cache.summary("mem_p95_bytes", "default", "svc-.+", "main"))
+
+    def test_sketch_merges_within_relative_accuracy_and_stays_small(self):
+        whole = advisor.QuantileSketch()
+        merged = advisor.QuantileSketch()
+        values = [0.0] * 50 + [0.001 * (1.002**index) for index in range(2000)]
+        for day in range(14):
+            daily = advisor.QuantileSketch()
+            for value in values[day::14]:
+                daily.add(value)
+                whole.add(value)
+            merged.merge(advisor.QuantileSketch.from_dict(json.loads(json.dumps(daily.to_dict()))))
+
+        ordered = sorted(values)
+        for q in (0.5, 0.9, 0.95, 0.99):
+            rank = q * (len(ordered) - 1)
+            exact = ordered[int(rank)] + (ordered[int(rank) + 1] - ordered[int(rank)]) * (rank - int(rank))
+            self.assertLessEqual(abs(merged.quantile(q) - exact), exact * advisor.QuantileSketch.RELATIVE_ACCURACY)
+        self.assertEqual(merged.quantile(1.0), max(values))
+        self.assertEqual(merged.quantile(0.0), 0.0)
+        self.assertAlmostEqual(merged.summary()["mean"], sum(values) / len(values))
+        merged_state, whole_state = merged.to_dict(), whole.to_dict()
+        self.assertAlmostEqual(merged_state.pop("sum"), whole_state.pop("sum"))
+        self.assertEqual(merged_state, whole_state)
+        self.assertLess(len(json.dumps(merged.to_dict())), 8 * 1024)
+
+    def test_evicts_files_outside_window_and_beyond_size_budget(self):
+        now = 1_773_400_000.0
+        with tempfile.TemporaryDirectory() as cache_dir:
+            directory = Path(cache_dir)
+            ages = {"stale.json": self.WINDOW + 60, "old.json": 7200, "new.json": 60, "partial.json.1.tmp": 60}
+            for name, age in ages.items():
+                path = directory / name
+                path.write_text("x" * 600)
+                os.utime(path, (now - age, now - age))
+
+            cache = advisor.UsageHistoryCache(directory, self.WINDOW, self.STEP, 1000, now=now)
+            removed = cache.evict()
+
+            self.assertEqual(removed, 3)
+            self.assertEqual(sorted(path.name for path in directory.iterdir()), ["new.json"])
+
+
+class ReportStorageTests(unittest.TestCase):
+    def test_sharded_documents_round_trip_and_read_only_needed_shards(self):
+        kube = ConfigMapKubeClient()
+        # Hex of random bytes only halves under gzip, so this document needs two 64 KiB parts.
+        big = os.urandom(100 * 1024).hex()
+        data = {"latest.json": big, "latest.md": "# report\n" * 50, "recording-rules.yaml": "groups: []\n"}
+        data["mode"] = "report"
+        with patch.dict(os.environ, {"REPORT_SHARD_MAX_KB": "64"}):
+            advisor.write_report_configmaps(kube, "monitoring", "advisor", data)
+
+        manifest = json.loads(kube.configmaps["advisor"]["data"]["manifest.json"])
+        self.assertEqual(kube.configmaps["advisor"]["data"]["mode"], "report")
+        self.assertNotIn("latest.json", kube.configmaps["advisor"]["data"])
+        self.assertEqual(len(manifest["files"]["latest.json"]["parts"]), 2)
+        shard_names = [advisor.report_shard_name("advisor", sha) for sha in manifest["shard_sha256"]]
+        self.assertEqual(manifest["shards"], shard_names)
+        for shard in manifest["shards"]:
+            blobs = kube.configmaps[shard]["binaryData"]
+            self.assertLessEqual(sum(len(advisor.base64.b64decode(blob)) for blob in blobs.values()), 64 * 1024)
+
+        status, read_back, _manifest = advisor.read_report_configmaps(kube, "monitoring", "advisor")
+        self.assertEqual(status, 200)
+        self.assertEqual(read_back, data)
+
+        kube.calls = []
+        _status, only_md, _manifest = advisor.read_report_configmaps(kube, "monitoring", "advisor", ["latest.md"])
+        self.assertEqual(only_md, {"latest.md": data["latest.md"], "mode": "report"})
+        md_shards = {manifest["shards"][index] for index, _key in manifest["files"]["latest.md"]["parts"]}
+        self.assertEqual(kube.calls, [("GET", "advisor")] + [("GET", shard) for shard in sorted(md_shards)])
+
+    def test_rewrite_flips_to_new_shards_and_skips_unreadable_documents(self):
+        kube = ConfigMapKubeClient()
+        with patch.dict(os.environ, {"REPORT_SHARD_MAX_KB": "64"}):
+            big = {"latest.json": os.urandom(100 * 1024).hex(), "apply-plan.md": "# plan\n"}
+            advisor.write_report_configmaps(kube, "monitoring", "advisor", big)
+            _status, _data, previous = advisor.read_report_configmaps(kube, "monitoring", "advisor", [])
+            kube.calls = []
+            advisor.write_report_configmaps(
+                kube, "monitoring", "advisor", {"latest.json": "{}", "apply-plan.md": "# plan\n"}, previous
+            )
+        writes = list(kube.calls)
+
+        # New shards go in under new names before the manifest flips; the old ones are deleted after.
+        _status, _data, manifest = advisor.read_report_configmaps(kube, "monitoring", "advisor", [])
+        self.assertEqual(len(manifest["shards"]), 1)
+        self.assertNotIn(manifest["shards"][0], previous["shards"])
+        self.assertEqual(sorted(kube.configmaps), sorted(["advisor", *manifest["shards"]]))
+        self.assertEqual(
+            writes,
+            [("PATCH", manifest["shards"][0]), ("PATCH", "advisor")]
+            + [("DELETE", shard) for shard in previous["shards"]],
+        )
+
+        # A shard an overlapping run already deleted leaves its documents out, or fails a strict read.
+        shard_name = manifest["shards"][0]
+        shard = kube.configmaps.pop(shard_name)
+        _status, data, _manifest = advisor.read_report_configmaps(kube, "monitoring", "advisor")
+        self.assertNotIn("apply-plan.md", data)
+        with self.assertRaises(advisor.ReportDocumentError):
+            advisor.read_report_configmaps(kube, "monitoring", "advisor", ["apply-plan.md"], strict=True)
+
+        # A shard whose content no longer matches the manifest fails its hash check instead of being served.
+        kube.configmaps[shard_name] = shard
+        shard["binaryData"]["latest.json.gz"] = advisor.base64.b64encode(gzip.compress(b'{"stale": true}')).decode()
+        _status, data, _manifest = advisor.read_report_configmaps(kube, "monitoring", "advisor")
+        self.assertNotIn("latest.json", data)
+        self.assertEqual(data["apply-plan.md"], "# plan\n")
+
+    def test_unchanged_content_skips_writes_and_conflicts_retry(self):
+        kube = ConfigMapKubeClient()
+        data = {"latest.json": "{}", "latest.md": "# report\n", "mode": "report"}
+        kube.fail_next = [409]
+        with patch.object(advisor.time, "sleep") as sleep:
+            advisor.write_report_configmaps(kube, "monitoring", "advisor", data)
+        shard_name = json.loads(kube.configmaps["advisor"]["data"]["manifest.json"])["shards"][0]
+        self.assertEqual(kube.calls[:2], [("PATCH", shard_name), ("PATCH", shard_name)])
+        sleep.assert_called_once()
+
+        kube.calls = []
+        meta = {}
+        _status, _data, previous = advisor.read_report_configmaps(kube, "monitoring", "advisor", [], meta=meta)
+        known_hash = meta["annotations"][advisor.CONFIGMAP_CONTENT_HASH_ANNOTATION]
+        advisor.write_report_configmaps(kube, "monitoring", "advisor", data, previous, known_hash)
+        self.assertEqual(kube.calls, [("GET", "advisor")])
+
+        data["latest.md"] = "# changed\n"
+        advisor.write_report_configmaps(kube, "monitoring", "advisor", data, previous, known_hash)
+        new_shard_name = json.loads(kube.configmaps["advisor"]["data"]["manifest.json"])["shards"][0]
+        self.assertEqual(
+            kube.calls[1:], [("PATCH", new_shard_name), ("PATCH", "advisor"), ("DELETE", shard_name)]
+        )
+
+    def test_main_skips_unchanged_reports_and_fails_on_unreadable_carry_over(self):
+        mib = 1024.0 * 1024.0
+        workloads = {("default", "deployments"): [make_workload("sonarr", {"main": ("100m", "256Mi")})]}
+        samples = [
+            ("cpu_p95_cores", "sonarr-5f6b-aaaaa", "main", 0.02),
+            ("mem_p95_bytes", "sonarr-5f6b-aaaaa", "main", 100 * mib),
+        ]
+        kube = ConfigMapKubeClient()
+        cluster = FakeKubeClient([make_node("node-a")], [], workloads)
+        for method in ("list_nodes", "list_pods", "iter_pods", "list_workloads"):
+            setattr(kube, method, getattr(cluster, method))
+
+        def run():
+            kube.calls = []
+            with tempfile.TemporaryDirectory() as output_dir:
+                env = {"TARGET_NAMESPACES": "default", "MODE": "report", "OUTPUT_DIR": output_dir}
+                with patch.dict(os.environ, env, clear=True):
+                    with patch.object(advisor, "KubeClient", return_value=kube):
+                        with patch.object(advisor, "PromClient", return_value=FakePromClient(samples)):
+                            self.assertEqual(advisor.main(), 0)
+            return [call for call in kube.calls if call[0] != "GET"]
+
+        self.assertIn(("PATCH", "resource-advisor-latest"), run())
+        stored = json.loads(json.dumps(kube.configmaps))
+        self.assertEqual(run(), [])
+        self.assertEqual(kube.configmaps, stored)
+
+        # A change outside the volatile fields is written.
+        workloads[("default", "deployments")][0] = make_workload("sonarr", {"main": ("200m", "256Mi")})
+        self.assertIn(("PATCH", "resource-advisor-latest"), run())
+
+        # An apply plan left by an apply-pr run is carried over, but not past a shard that has gone missing.
+        _status, data, manifest = advisor.read_report_configmaps(kube, "monitoring", "resource-advisor-latest")
+        data.update({"apply-plan.json": "{}", "apply-plan.md": "# plan\n"})
+        advisor.write_report_configmaps(kube, "monitoring", "resource-advisor-latest", data, manifest)
+        workloads[("default", "deployments")][0] = make_workload("sonarr", {"main": ("300m", "256Mi")})
+        run()
+        _status, data, manifest = advisor.read_report_configmaps(kube, "monitoring", "resource-advisor-latest")
+        self.assertEqual(data["apply-plan.md"], "# plan\n")
+        kube.configmaps.pop(manifest["shards"][manifest["files"]["apply-plan.md"]["parts"][0][0]])
+        workloads[("default", "deployments")][0] = make_workload("sonarr", {"main": ("400m", "256Mi")})
+        with self.assertRaises(advisor.ReportDocumentError):
+            run()
+        self.assertFalse(any(method != "GET" for method, _name in kube.calls))
+
+    def test_moving_to_shards_removes_plain_documents_left_by_update_writes(self):
+        legacy = {"latest.json": "{}", "latest.md": "# report\n", "mode": "report"}
+        kube = ConfigMapKubeClient({"advisor": {"metadata": {"name": "advisor"}, "data": dict(legacy)}})
+        advisor.write_report_configmaps(kube, "monitoring", "advisor", legacy, remove_keys=["latest.json", "latest.md"])
+
+        self.assertEqual(sorted(kube.configmaps["advisor"]["data"]), ["manifest.json", "mode"])
+        _status, data, _manifest = advisor.read_report_configmaps(kube, "monitoring", "advisor")
+        self.assertEqual(data, legacy)
+
+    def test_plain_layout_reads_as_stored(self):
+        kube = ConfigMapKubeClient({"advisor": {"data": {"latest.json": "{}", "mode": "init"}}})
+        status, data, manifest = advisor.read_report_configmaps(kube, "monitoring", "advisor")
+        self.assertEqual((status, data, manifest), (200, {"latest.json": "{}", "mode": "init"}, {}))
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path.startswith("/api/v1/query"):
+            self.send_chunked_vector()
+            return
+        body = json.dumps({"path": self.path}).encode("utf-8")
+        if "gzip" in (self.headers.get("Accept-Encoding") or ""):
+            body = gzip.compress(body)
+            self.send_response(200)
+            self.send_header("Content-Encoding", "gzip")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self.do_GET()
+
+    def send_chunked_vector(self):
+        result = [{"metric": {"pod": f"pod-{i}"}, "value": [1773400000, str(i / 10)]} for i in range(500)]
+        payload = {"status": "success", "data": {"resultType": "vector", "result": result}}
+        body = gzip.compress(json.dumps(payload).encode())
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for start in range(0, len(body), 997):
+            chunk = body[start : start + 997]
+            self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+class StreamingJsonTests(unittest.TestCase):
+    def test_yields_array_elements_across_awkward_chunk_boundaries(self):
+        document = {
+            "apiVersion": "v1",
+            "kind": "PodList",
+            "metadata": {"resourceVersion": "42"},
+            "items": [{"name": "caf\u00e9", "cpu": 0.125}, 17, 3.5e-3, [], {}, None, "x"],
+        }
+        raw = json.dumps(document, ensure_ascii=False).encode("utf-8")
+        for size in (1, 2, 3, 7, len(raw)):
+            chunks = [raw[i : i + size] for i in range(0, len(raw), size)]
+            envelope = {}
+            items = list(advisor.iter_json_array(chunks, ("items",), envelope))
+            self.assertEqual(items, document["items"])
+            self.assertEqual(envelope, {"apiVersion": "v1", "kind": "PodList", "metadata": {"resourceVersion": "42"}})
+
+    def test_reads_nested_path_and_envelope_after_the_array(self):
+        raw = b'{"data": {"result": [1, 2], "resultType": "vector"}, "status": "success"}'
+        envelope = {}
+        self.assertEqual(list(advisor.iter_json_array([raw[:20], raw[20:]], ("data", "result"), envelope)), [1, 2])
+        self.assertEqual(envelope, {"resultType": "vector", "status": "success"})
+
+    def test_missing_array_yields_nothing_and_truncation_raises(self):
+        self.assertEqual(list(advisor.iter_json_array([b'{"kind": "Status"}'], ("items",))), [])
+        with self.assertRaises(ValueError):
+            list(advisor.iter_json_array([b'{"items": [1, 2'], ("items",)))
+
+
+class PagedPodsHandler(BaseHTTPRequestHandler):
+    """Serves /api/v1/pods in limit-sized pages; the "stale" token answers 410 with a resume token.
+
+    Requests and Accept headers are recorded on the server, which the test sets up.
+    """
+
+    protocol_version = "HTTP/1.1"
+    pods = tuple({"metadata": {"name": f"pod-{index}"}} for index in range(7))
+
+    def do_GET(self):
+        parsed = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(parsed.query))
+        self.server.requests.append(query)
+        self.server.accepts.append(self.headers.get("Accept"))
+        token = query.get("continue", "0")
+        if token == "stale":
+            self.send_json(410, {"kind": "Status", "code": 410, "metadata": {"continue": "4"}})
+            return
+        start, limit = int(token), int(query.get("limit", len(self.pods)))
+        end = start + limit
+        metadata = {"resourceVersion": "9"}
+        if end < len(self.pods):
+            metadata["continue"] = "stale" if start == 2 else str(end)
+        self.send_json(200, {"kind": "PodList", "metadata": metadata, "items": list(self.pods[start:end])})
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+class KubeListPaginationTests(unittest.TestCase):
+    def setUp(self):
+        self.pool = advisor.PooledTransport()
+        pool_patch = patch.object(advisor, "HTTP_POOL", self.pool)
+        pool_patch.start()
+        self.addCleanup(pool_patch.stop)
+        self.addCleanup(self.pool.close_idle)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), PagedPodsHandler)
+        self.server.requests = []
+        self.server.accepts = []
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.kube = advisor.KubeClient()
+        self.kube.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_follows_continue_tokens_with_selectors(self):
+        with patch.dict(os.environ, {"KUBE_LIST_PAGE_SIZE": "2"}):
+            pods = self.kube.list_pods(field_selector=advisor.ACTIVE_POD_FIELD_SELECTOR, label_selector="app=x")
+
+        # Pages: 0-1, 2-3 (hands out an expired token), resume at 4 via the 410 Status, then 4-5 and 6.
+        self.assertEqual([pod["metadata"]["name"] for pod in pods], [f"pod-{index}" for index in range(7)])
+        tokens = [request.get("continue") for request in self.server.requests]
+        self.assertEqual(tokens, [None, "2", "stale", "4", "6"])
+        for request in self.server.requests:
+            self.assertEqual(request["limit"], "2")
+            self.assertEqual(request["fieldSelector"], advisor.ACTIVE_POD_FIELD_SELECTOR)
+            self.assertEqual(request["labelSelector"], "app=x")
+
+    def test_unpaginated_when_page_size_is_zero(self):
+        with patch.dict(os.environ, {"KUBE_LIST_PAGE_SIZE": "0"}):
+            self.assertEqual(len(self.kube.list_pods()), 7)
+        self.assertEqual(self.server.requests, [{}])
+
+
+    def test_metadata_lists_request_partial_object_metadata(self):
+        items = list(self.kube.iter_metadata("/api/v1/pods", "pods"))
+
+        self.assertEqual([item["metadata"]["name"] for item in items], [f"pod-{index}" for index in range(7)])
+        self.assertEqual(set(items[0]), {"metadata"})
+        self.assertEqual(self.server.accepts, [advisor.PARTIAL_OBJECT_METADATA_ACCEPT])
+
+
+class CompactPodTests(unittest.TestCase):
+    def test_compact_pod_keeps_footprint_and_restart_fields_only(self):
+        pod = {
+            "metadata": {
+                "name": "web-abc",
+                "namespace": "default",
+                "labels": {"app.kubernetes.io/instance": "web"},
+                "ownerReferences": [{"kind": "ReplicaSet", "name": "web-5d9", "controller": True, "uid": "u"}],
+                "managedFields": [{"manager": "kubelet", "fieldsV1": {"f:status": {}}}],
+                "annotations": {"big": "x" * 1000},
+            },
+            "spec": {
+                "nodeName": "node-a",
+                "containers": [
+                    {
+                        "name": "main",
+                        "image": "web:1",
+                        "env": [{"name": "A", "value": "b"}],
+                        "resources": {"requests": {"cpu": "250m", "memory": "256Mi"}, "limits": {"cpu": "1"}},
+                    }
+                ],
+                "initContainers": [{"name": "init", "resources": {"requests": {"cpu": "500m"}}}],
+                "volumes": [{"name": "data", "emptyDir": {}}],
+            },
+            "status": {
+                "phase": "Running",
+                "startTime": "2026-03-01T00:00:00Z",
+                "conditions": [{"type": "Ready"}],
+                "containerStatuses": [{"name": "main", "restartCount": 3, "image": "web:1", "state": {}}],
+            },
+        }
+
+        compact = advisor.compact_pod(pod)
+
+        self.assertNotIn("managedFields", compact["metadata"])
+        self.assertNotIn("volumes", compact["spec"])
+        requests = {"cpu": "250m", "memory": "256Mi"}
+        self.assertEqual(compact["spec"]["containers"], [{"name": "main", "resources": {"requests": requests}}])
+        self.assertEqual(compact["status"]["containerStatuses"], [{"name": "main", "restartCount": 3}])
+        self.assertEqual(
+            compact["metadata"]["ownerReferences"], [{"kind": "ReplicaSet", "name": "web-5d9", "controller": True}]
+        )
+        self.assertEqual(advisor.summarize_pods([compact]), advisor.summarize_pods([pod]))
+        self.assertLess(len(json.dumps(compact)), len(json.dumps(pod)) / 2)
+
+
+class PodOwnerIndexTests(unittest.TestCase):
+    def test_resolves_names_without_prefix_collisions(self):
+        owners = advisor.PodOwnerIndex(
+            [
+                ("default", "deployments", "immich"),
+                ("default", "deployments", "immich-server"),
+                ("default", "statefulsets", "immich-postgres"),
+            ]
+        )
+
+        self.assertEqual(owners.owner("default", "immich-7d9c8b-abcde"), ("deployments", "immich"))
+        self.assertEqual(owners.owner("default", "immich-server-5f6b7c-qwert"), ("deployments", "immich-server"))
+        self.assertEqual(owners.owner("default", "immich-postgres-0"), ("statefulsets", "immich-postgres"))
+        self.assertIsNone(owners.owner("default", "immich-old-0"))
+        self.assertIsNone(owners.owner("media", "immich-7d9c8b-abcde"))
+        for kind, workload, pod in (
+            ("deployments", "immich", "immich-postgres-0"),
+            ("deployments", "immich", "immich-server-5f6b7c-qwert"),
+            ("statefulsets", "immich", "immich-postgres-0"),
+        ):
+            self.assertIsNone(re.fullmatch(advisor.pod_regex_for_workload(workload, kind), pod))
+
+
+class WatchHandler(BaseHTTPRequestHandler):
+    """Lists two pods at resourceVersion 10, then serves one newline-delimited watch per queued script.
+
+    The scripts and the recorded requests live on the server, which the test sets up.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        parsed = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(parsed.query))
+        self.server.requests.append(query)
+        if query.get("watch") != "1":
+            pods = [
+                {"metadata": {"namespace": "default", "name": name, "labels": {"app": name}}} for name in ("a", "b")
+            ]
+            body = json.dumps({"kind": "PodList", "metadata": {"resourceVersion": "10"}, "items": pods}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        body = b"".join(json.dumps(event).encode() + b"\n" for event in self.server.watches.pop(0))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+class InformerTests(unittest.TestCase):
+    def setUp(self):
+        self.pool = advisor.PooledTransport()
+        pool_patch = patch.object(advisor, "HTTP_POOL", self.pool)
+        pool_patch.start()
+        self.addCleanup(pool_patch.stop)
+        self.addCleanup(self.pool.close_idle)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), WatchHandler)
+        self.server.requests = []
+        self.server.watches = []
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.kube = advisor.KubeClient()
+        self.kube.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_applies_watch_events_and_relists_on_gone(self):
+        self.server.watches[:] = [
+            [
+                {"type": "ADDED", "object": {"metadata": {"namespace": "media", "name": "c", "resourceVersion": "11"}}},
+                {
+                    "type": "MODIFIED",
+                    "object": {"metadata": {"namespace": "default", "name": "a", "labels": {"app": "z"}}},
+                },
+                {
+                    "type": "DELETED",
+                    "object": {"metadata": {"namespace": "default", "name": "b", "resourceVersion": "12"}},
+                },
+                {"type": "BOOKMARK", "object": {"metadata": {"resourceVersion": "15"}}},
+            ],
+            [{"type": "ERROR", "object": {"kind": "Status", "code": 410, "message": "too old resource version"}}],
+        ]
+        informer = advisor.Informer(self.kube, "/api/v1/pods", "pods", {"fieldSelector": "spec.nodeName!="})
+
+        self.assertTrue(informer.relist())
+        self.assertTrue(informer.synced.is_set())
+        self.assertEqual(informer.resource_version, "10")
+        informer.watch_once()
+
+        self.assertEqual(sorted(obj["metadata"]["name"] for obj in informer.items()), ["a", "c"])
+        self.assertEqual([obj["metadata"]["name"] for obj in informer.items("media")], ["c"])
+        self.assertEqual(informer.items("default")[0]["metadata"]["labels"], {"app": "z"})
+        stats = informer.stats()
+        self.assertEqual((stats["events"], stats["bookmarks"], stats["objects"]), (3, 1, 2))
+        self.assertEqual(stats["resource_version"], "15")
+
+        with self.assertRaises(advisor.WatchExpired):
+            informer.watch_once()
+        watch_requests = [request for request in self.server.requests if request.get("watch") == "1"]
+        self.assertEqual([request["resourceVersion"] for request in watch_requests], ["10", "15"])
+        for request in watch_requests:
+            self.assertEqual(request["allowWatchBookmarks"], "true")
+            self.assertEqual(request["fieldSelector"], "spec.nodeName!=")
+
+    def test_label_selector_matches_equality_terms(self):
+        labels = {"app": "web", "tier": "front"}
+        self.assertTrue(advisor.label_selector_matches(labels, "app=web,tier==front"))
+        self.assertTrue(advisor.label_selector_matches(labels, "app,!canary,tier!=back"))
+        self.assertFalse(advisor.label_selector_matches(labels, "app=api"))
+        self.assertFalse(advisor.label_selector_matches(labels, "!tier"))
+
+    def test_iter_json_lines_spans_chunk_boundaries(self):
+        chunks = [b'{"type": "ADD', b'ED", "n": 1}\n{"type":', b' "DELETED"}\n', b"\n"]
+        self.assertEqual(
+            list(advisor.iter_json_lines(chunks)), [{"type": "ADDED", "n": 1}, {"type": "DELETED"}]
+        )
+
+
+class PooledTransportTests(unittest.TestCase):
+    def setUp(self):
+        self.pool = advisor.PooledTransport()
+        pool_patch = patch.object(advisor, "HTTP_POOL", self.pool)
+        pool_patch.start()
+        self.addCleanup(pool_patch.stop)
+        self.addCleanup(self.pool.close_idle)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_reuses_keep_alive_connection_and_decodes_gzip(self):
+        pool = advisor.PooledTransport(max_per_host=2)
+        self.addCleanup(pool.close_idle)
+        for index in range(5):
+            status, raw = pool.request("GET", f"{self.base}/q?i={index}")
+            self.assertEqual(status, 200)
+            self.assertEqual(json.loads(raw), {"path": f"/q?i={index}"})
+
+        stats = pool.stats()
+        self.assertEqual(stats["requests"], 5)
+        self.assertEqual(stats["connections_opened"], 1)
+        self.assertEqual(stats["connections_reused"], 4)
+        self.assertEqual(stats["tls_handshakes"], 0)
+
+    def test_retries_once_when_idle_connection_was_closed(self):
+        pool = advisor.PooledTransport(max_per_host=1)
+        self.addCleanup(pool.close_idle)
+        pool.request("GET", f"{self.base}/first")
+        for conns in pool.idle.values():
+            for conn in conns:
+                conn.sock.shutdown(socket.SHUT_RDWR)
+
+        status, raw = pool.request("GET", f"{self.base}/second")
+
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(raw), {"path": "/second"})
+        self.assertEqual(pool.stats()["connections_opened"], 2)
+
+    def test_does_not_resend_non_idempotent_request_the_server_may_have_received(self):
+        pool = advisor.PooledTransport(max_per_host=1)
+        self.addCleanup(pool.close_idle)
+        for method, expected_sends in (("POST", 1), ("PATCH", 1), ("GET", 2)):
+            pool.request("GET", f"{self.base}/warm")
+            closed = advisor.http.client.RemoteDisconnected("closed")
+            with patch.object(pool, "send", side_effect=closed) as send:
+                with self.assertRaises(advisor.http.client.RemoteDisconnected):
+                    pool.request(method, f"{self.base}/apply", body=b"{}")
+            self.assertEqual(send.call_count, expected_sends, method)
+
+        # A write that failed outright never reached the server, so it is safe to resend.
+        pool.request("GET", f"{self.base}/warm")
+        send = pool.send
+        attempts = []
+
+        def broken_pipe_once(*args):
+            attempts.append(args[1])
+            if len(attempts) == 1:
+                args[0].close()
+                raise BrokenPipeError()
+            return send(*args)
+
+        with patch.object(pool, "send", side_effect=broken_pipe_once):
+            status, raw = pool.request("POST", f"{self.base}/after-broken-pipe", body=b"{}")
+        self.assertEqual((status, attempts), (200, ["POST", "POST"]))
+        self.assertEqual(json.loads(raw), {"path": "/after-broken-pipe"})
+
+    def test_prometheus_vector_streams_chunked_gzip_response(self):
+        prom = advisor.PromClient(self.base)
+        samples = prom.query_vector("up")
+
+        self.assertEqual(len(samples), 500)
+        self.assertEqual(samples[7], ({"pod": "pod-7"}, 0.7))
+        self.assertEqual(len(prom.query_vector("up")), 500)
+
+    def test_run_stats_record_calls_by_family_and_stage(self):
+        stats = advisor.RunStats()
+        prom = advisor.PromClient(self.base)
+        with patch.object(advisor, "RUN_STATS", stats):
+            with stats.stage("usage"):
+                executor = advisor.PromQueryExecutor(2)
+                query = 'rate(container_cpu_usage_seconds_total{a="b"}[5m])'
+                futures = {"cpu": executor.submit(prom.query_vector, query)}
+                executor.resolve(futures)
+                executor.shutdown()
+            prom.query_vector("up{}")
+
+        summary = stats.summary()
+        family = summary["families"]["prometheus query container_cpu_usage_seconds_total"]
+        self.assertEqual(summary["calls"], 2)
+        self.assertEqual(family["calls"], 1)
+        self.assertEqual(family["series"], 500)
+        self.assertGreater(family["bytes"], 10_000)
+        self.assertEqual(family["errors"], 0)
+        self.assertEqual(summary["stages"]["usage"]["calls"], 1)
+        self.assertEqual(summary["stages"]["other"]["calls"], 1)
+        self.assertEqual(len(summary["slowest"]), 2)
+        self.assertEqual(summary["total_bytes"], sum(row["bytes"] for row in summary["families"].values()))
+
+        stats.reset()
+        self.assertEqual(stats.summary()["calls"], 0)
+
+    def test_call_families_group_by_resource(self):
+        cases = {
+            ("GET", "/api/v1/namespaces/default/pods?limit=5"): "kubernetes GET pods",
+            ("PUT", "/api/v1/namespaces/monitoring/configmaps/latest"): "kubernetes PUT configmaps",
+            ("GET", "/apis/apps/v1/namespaces/default/deployments"): "kubernetes GET deployments",
+            ("GET", "/api/v1/nodes"): "kubernetes GET nodes",
+        }
+        for (method, path), family in cases.items():
+            self.assertEqual(advisor.kube_call_family(method, path), family)
+        self.assertEqual(advisor.prom_query_family("query", "vector(1)"), "prometheus query other")
+
+
 class PatchAppTemplateResourcesTests(unittest.TestCase):
     def test_patch_existing_resources_preserves_comments(self):
         content = """values:
@@ -1,3 +1,4 @@
+import json
 import sys
 import unittest
 from pathlib import Path
@@ -45,6 +46,26 @@ class ExporterTests(unittest.TestCase):
                         "deadband_cpu_m": 25,
                         "deadband_mem_mi": 64,
                     },
+                    "run_stats": {
+                        "duration_seconds": 42.5,
+                        "calls": 12,
+                        "errors": 0,
+                        "total_bytes": 40960,
+                        "families": {
+                            "kubernetes GET pods": {
+                                "calls": 2,
+                                "errors": 0,
+                                "bytes": 30000,
+                                "series": 80,
+                                "p50_seconds": 0.2,
+                                "p95_seconds": 0.4,
+                                "max_seconds": 0.4,
+                                "total_seconds": 0.6,
+                            }
+                        },
+                        "stages": {"apply_plan": {"calls": 2, "bytes": 30000, "seconds": 0.6}},
+                        "slowest": [],
+                    },
                     "budget": {
                         "allocatable": {"cpu": "9900m", "memory": "38646Mi"},
                         "current_requests_percent_of_allocatable": {"cpu": 47.0, "memory": 37.4},
@@ -159,6 +180,10 @@ class ExporterTests(unittest.TestCase):
         self.assertIn("resource_advisor_apply_last_run_timestamp_seconds", metrics)
         self.assertIn("resource_advisor_apply_next_run_timestamp_seconds", metrics)
         self.assertIn("resource_advisor_apply_last_run_status", metrics)
+        self.assertIn("# TYPE resource_advisor_exporter_http_connections_reused_total counter", metrics)
+        self.assertIn("resource_advisor_run_duration_seconds 42.5", metrics)
+        self.assertIn('resource_advisor_run_query_latency_seconds{family="kubernetes GET pods",quantile="0.95"} 0.4', metrics)
+        self.assertIn('resource_advisor_run_stage_seconds{stage="apply_plan"} 0.6', metrics)
         self.assertEqual(payload["lastApply"]["status"], "created")
         self.assertEqual(payload["lastApply"]["prCount"], 2)
         self.assertEqual(len(payload["lastApply"]["execution"]["pull_requests"]), 2)
@@ -168,6 +193,281 @@ class ExporterTests(unittest.TestCase):
         self.assertIn("https://example.invalid/pr/2", html)
         self.assertIn("/apply-plan.json", html)
 
+    def test_informer_cache_serves_reads_and_exports_counters(self):
+        cache = exporter.InformerCache(exporter.advisor.KubeClient())
+        cache.informers["pods"].store = {
+            "default": {
+                "web": {"metadata": {"namespace": "default", "name": "web", "labels": {"app": "web"}}},
+                "db": {"metadata": {"namespace": "default", "name": "db", "labels": {"app": "db"}}},
+            }
+        }
+        cache.informers["pods"].counters["events"] = 4
+        for informer in cache.informers.values():
+            informer.synced.set()
+
+        self.assertTrue(cache.synced())
+        pods = cache.list_pods("default", label_selector="app=db")
+        self.assertEqual([pod["metadata"]["name"] for pod in pods], ["db"])
+        self.assertEqual(cache.list_workloads("default", "deployments"), [])
+        with patch.object(exporter, "STATE", exporter.State()), patch.object(exporter, "INFORMERS", cache):
+            metrics = exporter.build_metrics()
+
+        self.assertIn('resource_advisor_exporter_informer_objects{resource="pods"} 2', metrics)
+        self.assertIn('resource_advisor_exporter_informer_events_total{resource="pods"} 4', metrics)
+
+    def test_live_restart_stats_attribute_pods_by_owner_reference(self):
+        def pod(name, owner_kind, owner_name, restarts):
+            return {
+                "metadata": {
+                    "namespace": "default",
+                    "name": name,
+                    "ownerReferences": [{"kind": owner_kind, "name": owner_name, "controller": True}],
+                },
+                "status": {
+                    "phase": "Running",
+                    "startTime": "2026-03-14T06:30:00Z",
+                    "containerStatuses": [{"name": "main", "restartCount": restarts}],
+                },
+            }
+
+        class Kube:
+            def list_pods(self, namespace, field_selector=""):
+                return [
+                    pod("immich-7d9c8b-abcde", "ReplicaSet", "immich-7d9c8b", 1),
+                    pod("immich-postgres-0", "StatefulSet", "immich-postgres", 4),
+                    # The ReplicaSet list says this one belongs to a Deployment whose name its own does not share.
+                    pod("renamed-5f6b7c-qwert", "ReplicaSet", "renamed-5f6b7c", 2),
+                ]
+
+            def list_replicasets(self, namespace):
+                owner = {"kind": "Deployment", "name": "immich", "controller": True}
+                return [{"metadata": {"namespace": "default", "name": "renamed-5f6b7c", "ownerReferences": [owner]}}]
+
+        report = {
+            "recommendations": [
+                {"namespace": "default", "workload": "immich", "container": "main", "kind": "deployment"},
+                {"namespace": "default", "workload": "immich-postgres", "container": "main", "kind": "statefulset"},
+            ]
+        }
+
+        stats = exporter._collect_live_restart_stats(Kube(), report)
+
+        immich = stats[exporter._rec_key("default", "immich", "main")]
+        self.assertEqual((immich["matched_pods"], immich["current_restarts"]), (2, 3))
+        postgres = stats[exporter._rec_key("default", "immich-postgres", "main")]
+        self.assertEqual((postgres["matched_pods"], postgres["current_restarts"]), (1, 4))
+
+    def test_refresh_skips_parsing_and_planning_while_configmap_is_unchanged(self):
+        class Kube:
+            def __init__(self):
+                self.configmaps = {}
+                self.version = 0
+                self.gets = []
+
+            def request_json(self, method, path, body=None):
+                name = path.rsplit("/", 1)[-1]
+                self.gets.append(name)
+                if name not in self.configmaps:
+                    return 404, {}
+                return 200, self.configmaps[name]
+
+            def upsert_configmap(
+                self, namespace, name, data, binary_data=None, known_hash="", remove_keys=(), content_hash=""
+            ):
+                content_hash = content_hash or exporter.advisor.configmap_content_hash(data, binary_data)
+                if content_hash != known_hash:
+                    self.version += 1
+                    metadata = {"name": name, "resourceVersion": str(self.version)}
+                    self.configmaps[name] = {"metadata": metadata, "data": data, "binaryData": binary_data or {}}
+                return content_hash
+
+            def delete_configmap(self, namespace, name):
+                self.configmaps.pop(name, None)
+
+            def list_pods(self, namespace, field_selector=""):
+                return []
+
+            def list_replicasets(self, namespace):
+                return []
+
+        kube = Kube()
+        report = {"generated_at": "2026-03-13T18:30:19Z", "recommendations": []}
+        documents = {"latest.json": json.dumps(report), "latest.md": "# one\n", "recording-rules.yaml": "groups: []\n"}
+        exporter.advisor.write_report_configmaps(kube, "monitoring", "advisor", documents)
+        plans = []
+
+        def build_apply_plan(report, kube=None):
+            plans.append(report)
+            return {"selected": []}, ""
+
+        env = {"CONFIGMAP_NAME": "advisor", "LIVE_REFRESH_SECONDS": "300"}
+        with (
+            patch.object(exporter, "STATE", exporter.State()),
+            patch.object(exporter, "INFORMERS", None),
+            patch.dict(exporter.os.environ, env),
+            patch.object(exporter.advisor, "KubeClient", return_value=kube),
+            patch.object(exporter.advisor, "build_apply_plan", side_effect=build_apply_plan),
+        ):
+            exporter.fetch_configmap_once()
+            first_report = exporter.STATE.report
+            self.assertEqual(first_report, report)
+            self.assertEqual((exporter.STATE.report_parses_total, len(plans)), (1, 1))
+
+            kube.gets = []
+            exporter.fetch_configmap_once()
+            self.assertEqual(kube.gets, ["advisor"])
+            self.assertEqual((exporter.STATE.report_unchanged_total, len(plans)), (1, 1))
+
+            # Only latest.md changes: latest.json keeps its hash, so it is neither refetched nor parsed.
+            _status, _data, previous = exporter.advisor.read_report_configmaps(kube, "monitoring", "advisor", [])
+            documents["latest.md"] = "# two\n"
+            exporter.advisor.write_report_configmaps(kube, "monitoring", "advisor", documents, previous)
+            exporter.fetch_configmap_once()
+            self.assertEqual(exporter.STATE.latest_md, "# two\n")
+            self.assertIs(exporter.STATE.report, first_report)
+            self.assertEqual((exporter.STATE.report_parses_total, len(plans)), (1, 2))
+
+    def test_what_if_plans_against_cached_snapshot_and_memoizes(self):
+        class Cluster:
+            def __init__(self):
+                self.reads = 0
+
+            def request_json(self, method, path, body=None):
+                return 404, {}
+
+            def list_nodes(self):
+                self.reads += 1
+                return [{"metadata": {"name": "node-a"}, "status": {"allocatable": {"cpu": "4", "memory": "4Gi"}}}]
+
+            def iter_pods(self, namespace=None, field_selector="", label_selector=""):
+                self.reads += 1
+                return iter([])
+
+            def list_pods(self, namespace=None, field_selector=""):
+                return []
+
+            def list_replicasets(self, namespace):
+                return []
+
+        releases = exporter.advisor.DEFAULT_APPLY_ALLOWLIST[:2]
+        report = {
+            "generated_at": "2026-03-13T18:30:19Z",
+            "metrics_coverage_days_estimate": 20.0,
+            "recommendations": [
+                {
+                    "namespace": "default",
+                    "workload": release,
+                    "release": release,
+                    "container": "main",
+                    "action": "upsize",
+                    "replicas": 1,
+                    "current": {
+                        "requests": {"cpu": "100m", "memory": "256Mi"},
+                        "limits": {"cpu": "100m", "memory": "256Mi"},
+                    },
+                    "recommended": {
+                        "requests": {"cpu": "150m", "memory": "512Mi"},
+                        "limits": {"cpu": "150m", "memory": "512Mi"},
+                    },
+                }
+                for release in releases
+            ],
+        }
+        cluster = Cluster()
+        env = {"MAX_REQUESTS_PERCENT_CPU": "100", "MAX_REQUESTS_PERCENT_MEMORY": "100"}
+
+        def what_if(request):
+            return exporter.run_what_if(json.dumps(request).encode("utf-8"))
+
+        with (
+            patch.object(exporter, "STATE", exporter.State()),
+            patch.object(exporter, "INFORMERS", None),
+            patch.dict(exporter.os.environ, env, clear=True),
+        ):
+            self.assertEqual(what_if({})[0], 503)
+            with exporter.STATE.lock:
+                exporter.STATE.report = report
+            exporter._refresh_live_state(cluster, "monitoring", report, 0.0)
+            self.assertEqual(cluster.reads, 2)
+
+            code, baseline = what_if({})
+            self.assertEqual((code, len(baseline["selected"]), baseline["cached"]), (200, 2, False))
+
+            request = {"overrides": {"MAX_APPLY_CHANGES_PER_RUN": 1}}
+            code, capped = what_if(request)
+            self.assertEqual([item["release"] for item in capped["selected"]], [releases[0]])
+            self.assertEqual(capped["constraints"]["max_apply_changes_per_run"], 1)
+            self.assertTrue(what_if(request)[1]["cached"])
+
+            code, edited = what_if({"recommendations": {f"{releases[1]}/main": {"requests": {"memory": "8Gi"}}}})
+            self.assertEqual([item["release"] for item in edited["selected"]], [releases[0]])
+            self.assertEqual(edited["skipped_reason_counts"], {"node_capacity_block": 1})
+            self.assertFalse(edited["node_fit"]["projected_overages"]["hard_over_by_node"])
+
+            self.assertEqual(what_if({"overrides": {"GITHUB_TOKEN": "x"}})[0], 400)
+            self.assertEqual(what_if({"recommendations": {"missing": {}}})[0], 400)
+            for quantities in ({"cpu": "abc"}, {"cpu": "-5"}, {"memory": "0"}, {"memory": "100m"}, {"gpu": "1"}):
+                code, error = what_if({"recommendations": {releases[0]: {"requests": quantities}}})
+                self.assertEqual(code, 400, quantities)
+                self.assertIn(releases[0], error["error"])
+            self.assertEqual(cluster.reads, 2)
+            self.assertEqual((exporter.STATE.what_if_requests_total, exporter.STATE.what_if_cache_hits_total), (12, 1))
+            self.assertIn("resource_advisor_exporter_what_if_cache_hits_total 1", exporter.build_metrics())
+
+            exporter._refresh_live_state(cluster, "monitoring", report, 1.0)
+            self.assertFalse(what_if(request)[1]["cached"])
+
+    def test_refresh_recovers_from_transient_configmap_error(self):
+        class Kube:
+            def __init__(self):
+                self.configmaps = {}
+                self.failures = 0
+
+            def request_json(self, method, path, body=None):
+                if self.failures:
+                    self.failures -= 1
+                    return 500, {}
+                name = path.rsplit("/", 1)[-1]
+                return (200, self.configmaps[name]) if name in self.configmaps else (404, {})
+
+            def upsert_configmap(
+                self, namespace, name, data, binary_data=None, known_hash="", remove_keys=(), content_hash=""
+            ):
+                metadata = {"name": name, "resourceVersion": "1"}
+                self.configmaps[name] = {"metadata": metadata, "data": data, "binaryData": binary_data or {}}
+                return content_hash or exporter.advisor.configmap_content_hash(data, binary_data)
+
+            def list_pods(self, namespace, field_selector=""):
+                return []
+
+            def list_replicasets(self, namespace):
+                return []
+
+        kube = Kube()
+        report = {"generated_at": "2026-03-13T18:30:19Z", "recommendations": []}
+        exporter.advisor.write_report_configmaps(kube, "monitoring", "advisor", {"latest.json": json.dumps(report)})
+
+        with (
+            patch.object(exporter, "STATE", exporter.State()),
+            patch.object(exporter, "INFORMERS", None),
+            patch.dict(exporter.os.environ, {"CONFIGMAP_NAME": "advisor", "LIVE_REFRESH_SECONDS": "300"}),
+            patch.object(exporter.advisor, "KubeClient", return_value=kube),
+            patch.object(exporter.advisor, "build_apply_plan", return_value=({"selected": []}, "")),
+        ):
+            exporter.fetch_configmap_once()
+            self.assertTrue(exporter.STATE.last_fetch_ok)
+
+            kube.failures = 1
+            exporter.fetch_configmap_once()
+            self.assertFalse(exporter.STATE.last_fetch_ok)
+            self.assertIn("500", exporter.STATE.last_error)
+
+            exporter.fetch_configmap_once()
+            self.assertEqual(exporter.STATE.report_unchanged_total, 1)
+            self.assertTrue(exporter.STATE.last_fetch_ok)
+            self.assertEqual(exporter.STATE.last_error, "")
+            self.assertIn("resource_advisor_report_fetch_success 1.0", exporter.build_metrics())
+
     def test_security_headers_include_nosniff_and_html_csp(self):
         html_headers = exporter.security_headers_for("text/html; charset=utf-8")
         json_headers = exporter.security_headers_for("application/json; charset=utf-8")